@@ -0,0 +1,93 @@
+"""
+Measures how long blacklist functions take to filter large, nested feature report parameters.
+
+Usage:
+    python benchmarks/blacklist.py -n 1000 --width 20 --depth 4
+"""
+import argparse
+import time
+from typing import Any, Callable, Dict
+
+from humbug import blacklist
+
+
+def nested_parameters(width: int, depth: int) -> Dict[str, Any]:
+    """
+    Parameters with width keys on every level, depth levels deep. Some keys and values look like
+    secrets.
+    """
+    parameters: Dict[str, Any] = {}
+    for i in range(width):
+        if i % 10 == 0:
+            parameters[
+                "api_token_{}".format(i)
+            ] = "2fd5a1c1-6e7e-4a54-9d43-2f0c8f1e0b1a"
+        elif i % 10 == 1:
+            parameters["email_{}".format(i)] = "user{}@example.com".format(i)
+        elif i % 10 == 2:
+            parameters["values_{}".format(i)] = list(range(10))
+        elif depth > 1 and i % 10 == 3:
+            parameters["nested_{}".format(i)] = nested_parameters(width, depth - 1)
+        else:
+            parameters["parameter_{}".format(i)] = i
+    return parameters
+
+
+def measure(
+    name: str,
+    blacklist_fn: Callable[[Dict[str, Any]], Dict[str, Any]],
+    parameters: Dict[str, Any],
+    n: int,
+) -> None:
+    start = time.perf_counter()
+    for _ in range(n):
+        blacklist_fn(parameters)
+    elapsed = time.perf_counter() - start
+    print("{:<24} {:>10.1f}us/call".format(name, elapsed / n * 1e6))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Humbug blacklist benchmark")
+    parser.add_argument(
+        "-n", "--num-calls", type=int, default=1000, help="Calls per run"
+    )
+    parser.add_argument("--width", type=int, default=20, help="Keys per level")
+    parser.add_argument("--depth", type=int, default=4, help="Levels of nesting")
+    args = parser.parse_args()
+
+    parameters = nested_parameters(args.width, args.depth)
+    keys = ["password", "secret", "api_token_0", "api_token_10", "email_1"]
+
+    measure(
+        "by_key",
+        blacklist.generate_filter_parameters_by_key_fn(keys),
+        parameters,
+        args.num_calls,
+    )
+    measure(
+        "by_key_inner",
+        blacklist.generate_filter_parameters_by_key_inner_fn(keys),
+        parameters,
+        args.num_calls,
+    )
+    if hasattr(blacklist, "generate_filter_parameters_fn"):
+        measure(
+            "keys (any depth)",
+            blacklist.generate_filter_parameters_fn(keys),
+            parameters,
+            args.num_calls,
+        )
+        measure(
+            "patterns (any depth)",
+            blacklist.generate_filter_parameters_fn(
+                keys,
+                key_patterns=["*token*", "email_*"],
+                value_patterns=[*blacklist.TOKEN_PATTERNS, blacklist.EMAIL_PATTERN],
+            ),
+            parameters,
+            args.num_calls,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Measures the size of each type of report on the wire (as JSON, and compressed with gzip and, if the
+zstandard package is installed, zstd) and the CPU time it takes to encode it (and compress it).
+
+Usage:
+    python benchmarks/compression.py -n 100
+"""
+import argparse
+import functools
+import json
+import time
+from typing import Callable, Dict, List, Tuple
+
+from humbug.consent import HumbugConsent
+from humbug.report import HumbugReporter, Modes, Report
+from humbug.lazy_imports import optional_import
+from humbug.transport import compress
+
+
+def reports(reporter: HumbugReporter) -> Dict[str, Report]:
+    try:
+        raise ValueError("benchmark")
+    except ValueError as e:
+        error = e
+    env_report = reporter.env_report(publish=False)
+    assert env_report is not None
+    packages_report = reporter.packages_report(publish=False)
+    return {
+        "error": reporter.error_report(error, publish=False),
+        "env": env_report,
+        "packages": packages_report,
+        "compound": reporter.compound_report(
+            [env_report, packages_report], publish=False
+        ),
+        "metrics": reporter.metrics_report(publish=False),
+        "metrics (compact)": reporter.metrics_report(publish=False, compact=True),
+    }
+
+
+def measure(encode: Callable[[], bytes], n: int) -> Tuple[int, float]:
+    start = time.perf_counter()
+    for _ in range(n):
+        encoded = encode()
+    return len(encoded), (time.perf_counter() - start) / n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Humbug compression benchmark")
+    parser.add_argument("-n", "--repeat", type=int, default=100, help="Runs per report")
+    args = parser.parse_args()
+
+    reporter = HumbugReporter(
+        "benchmark", HumbugConsent(True), bugout_token="token", mode=Modes.SYNCHRONOUS
+    )
+    compressions: List[str] = ["gzip"]
+    if optional_import("zstandard") is not None:
+        compressions.append("zstd")
+
+    print(
+        "{:<18} {:>14} {}".format(
+            "report",
+            "json",
+            " ".join("{:>14}".format(compression) for compression in compressions),
+        )
+    )
+    for name, report in reports(reporter).items():
+        body = reporter._post_body(report)
+
+        def encode() -> bytes:
+            return json.dumps(body, separators=(",", ":")).encode("utf-8")
+
+        def encode_and_compress(compression: str) -> bytes:
+            return compress(encode(), compression)
+
+        results = [measure(encode, args.repeat)]
+        for compression in compressions:
+            results.append(
+                measure(
+                    functools.partial(encode_and_compress, compression), args.repeat
+                )
+            )
+        print(
+            "{:<18} {}".format(
+                name,
+                " ".join(
+                    "{:>7}B {:>4.0f}us".format(size, seconds * 1e6)
+                    for size, seconds in results
+                ),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Measures how long it takes to import Humbug and to create a reporter, in fresh Python processes, with
+python -X importtime. Lists the modules whose imports took the longest.
+
+Usage:
+    python benchmarks/import_time.py -n 5 --top 10
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+SCRIPT = """
+import time
+start = time.perf_counter()
+from humbug.consent import HumbugConsent
+from humbug.report import HumbugReporter
+imported = time.perf_counter()
+HumbugReporter("benchmark", HumbugConsent(False))
+print(imported - start, time.perf_counter() - imported)
+"""
+
+
+def run() -> Tuple[float, float, Dict[str, int]]:
+    """
+    Returns the time it took to import Humbug, the time it took to create a reporter, and the
+    cumulative import time (in microseconds) of every module that was imported.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SCRIPT],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    )
+    import_seconds, create_seconds = (float(value) for value in process.stdout.split())
+    cumulative: Dict[str, int] = {}
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, module = line.split("|")
+        try:
+            cumulative[module.strip()] = int(cumulative_us)
+        except ValueError:
+            continue
+    return import_seconds, create_seconds, cumulative
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Humbug import time benchmark")
+    parser.add_argument("-n", "--num-runs", type=int, default=5, help="Runs")
+    parser.add_argument(
+        "--top", type=int, default=10, help="Number of slowest imports to list"
+    )
+    args = parser.parse_args()
+
+    import_times: List[float] = []
+    create_times: List[float] = []
+    cumulative: Dict[str, List[int]] = {}
+    start = time.perf_counter()
+    for _ in range(args.num_runs):
+        import_seconds, create_seconds, run_cumulative = run()
+        import_times.append(import_seconds)
+        create_times.append(create_seconds)
+        for module, microseconds in run_cumulative.items():
+            cumulative.setdefault(module, []).append(microseconds)
+
+    print("{} runs in {:.2f}s".format(args.num_runs, time.perf_counter() - start))
+    print("{:<32} {:>10.2f}ms".format("import", statistics.median(import_times) * 1e3))
+    print(
+        "{:<32} {:>10.2f}ms".format(
+            "HumbugReporter()", statistics.median(create_times) * 1e3
+        )
+    )
+    print()
+    slowest = sorted(
+        cumulative.items(), key=lambda item: statistics.median(item[1]), reverse=True
+    )
+    for module, module_times in slowest[: args.top]:
+        print(
+            "{:<32} {:>10.2f}ms".format(module, statistics.median(module_times) / 1e3)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Load test of publishing reports, in every reporter mode, against a local stub Humbug server which can
+be made slow or unreliable.
+
+For each mode, measures the rate at which the caller can publish reports, the caller-side latency
+(p50 and p99) of error_report and feature_report, how long wait() takes to drain the reports which
+are still waiting to be published, how much memory (allocated by Python, as traced by tracemalloc)
+the reporter holds on to before and after wait(), and how many reports the server received.
+
+Usage:
+    python benchmarks/load.py -n 2000 --latency-ms 5 --error-rate 0.01 --throttle-rate 0.01
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+from humbug.consent import HumbugConsent
+from humbug.report import HumbugReporter, Modes
+from humbug.retry import RetryPolicy
+from stub_server import StubHumbugServer
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[max(0, int(len(sorted_values) * q) - 1)]
+
+
+def run(
+    mode: Modes, server: StubHumbugServer, n: int, trace_memory: bool
+) -> Dict[str, Any]:
+    reporter = HumbugReporter(
+        "benchmark",
+        HumbugConsent(True),
+        client_id="benchmark-client",
+        bugout_token="benchmark-token",
+        url=server.url,
+        mode=mode,
+        tags=["benchmark"],
+        retry_policy=RetryPolicy(initial_backoff_seconds=0.01, max_backoff_seconds=0.1),
+    )
+    try:
+        raise ValueError("benchmark")
+    except ValueError as e:
+        error = e
+    parameters = {"a": 1, "b": "two"}
+    # Imports requests, opens a connection and fills the reporter's caches before measuring.
+    reporter.custom_report("warm up", "warm up", wait=True)
+    num_reports = server.num_reports
+
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0] if trace_memory else 0
+
+    latencies: Dict[str, List[float]] = {"error_report": [], "feature_report": []}
+    start = time.perf_counter()
+    for i in range(n):
+        if i % 2 == 0:
+            report_start = time.perf_counter()
+            reporter.error_report(error)
+            latencies["error_report"].append(time.perf_counter() - report_start)
+        else:
+            report_start = time.perf_counter()
+            reporter.feature_report("feature", parameters)
+            latencies["feature_report"].append(time.perf_counter() - report_start)
+    published = time.perf_counter()
+
+    memory_queued = 0
+    if trace_memory:
+        memory_queued = tracemalloc.get_traced_memory()[0] - memory_before
+    reporter.wait()
+    drained = time.perf_counter()
+    memory_retained = 0
+    if trace_memory:
+        gc.collect()
+        memory_retained = tracemalloc.get_traced_memory()[0] - memory_before
+        tracemalloc.stop()
+
+    counters = reporter.counters.snapshot()
+    results: Dict[str, Any] = {
+        "reports_per_second": n / (published - start),
+        "wait_ms": (drained - published) * 1e3,
+        "received": server.num_reports - num_reports,
+        "dropped": counters.get("dropped", 0) + reporter.dropped_reports,
+        "deferred": counters.get("deferred", 0),
+        "retried": counters.get("retried", 0),
+    }
+    for name, values in latencies.items():
+        sorted_ms = sorted(value * 1e3 for value in values)
+        results[name + "_p50_ms"] = percentile(sorted_ms, 0.5)
+        results[name + "_p99_ms"] = percentile(sorted_ms, 0.99)
+    if trace_memory:
+        results["memory_queued_KiB"] = memory_queued / 1024
+        results["memory_retained_KiB"] = memory_retained / 1024
+
+    print("{} ({} reports)".format(mode.name, n))
+    print(
+        "  {:<16} {:>10.0f} reports/s".format("caller", results["reports_per_second"])
+    )
+    for name in latencies:
+        print(
+            "  {:<16} p50={:.3f}ms p99={:.3f}ms".format(
+                name, results[name + "_p50_ms"], results[name + "_p99_ms"]
+            )
+        )
+    print("  {:<16} {:>10.1f}ms".format("wait()", results["wait_ms"]))
+    if trace_memory:
+        print(
+            "  {:<16} queued={:.1f}KiB retained={:.1f}KiB".format(
+                "memory", results["memory_queued_KiB"], results["memory_retained_KiB"]
+            )
+        )
+    print(
+        "  {:<16} received={} dropped={} deferred={} retried={}".format(
+            "reports",
+            results["received"],
+            results["dropped"],
+            results["deferred"],
+            results["retried"],
+        )
+    )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Humbug publishing load test")
+    parser.add_argument(
+        "-n", "--num-reports", type=int, default=2000, help="Reports per mode"
+    )
+    parser.add_argument(
+        "--latency-ms", type=float, default=0.0, help="Server response latency"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Fraction of 503 responses"
+    )
+    parser.add_argument(
+        "--throttle-rate", type=float, default=0.0, help="Fraction of 429 responses"
+    )
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        choices=[mode.name for mode in Modes],
+        default=[mode.name for mode in Modes],
+        help="Reporter modes to test",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Do not trace memory (tracemalloc slows down publishing)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="File to write the results to, as JSON (to compare them between versions)",
+    )
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, Any]] = {}
+    with StubHumbugServer(
+        latency_seconds=args.latency_ms / 1e3,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after="0",
+        seed=0,
+        keep_requests=False,
+    ) as server:
+        for name in args.modes:
+            results[name] = run(
+                Modes[name], server, args.num_reports, not args.no_memory
+            )
+
+    if args.output is not None:
+        with open(args.output, "w") as ofp:
+            json.dump(results, ofp, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Measures how long packages reports take in an environment with many packages: the first report,
+repeated reports (which use the cached package lists), and reports of the changes since the last
+report. The environment is a temporary directory of synthetic package metadata.
+
+Usage:
+    python benchmarks/packages.py --num-packages 1000 -n 100
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable
+
+from humbug.consent import HumbugConsent
+from humbug.lazy_imports import optional_import
+from humbug.packages import PackageIndex
+from humbug.report import HumbugReporter, Modes
+
+
+def install(directory: str, name: str, version: str) -> None:
+    dist_info = os.path.join(directory, "{}-{}.dist-info".format(name, version))
+    os.makedirs(dist_info)
+    with open(os.path.join(dist_info, "METADATA"), "w") as ofp:
+        ofp.write(
+            "Metadata-Version: 2.1\nName: {}\nVersion: {}\n".format(name, version)
+        )
+
+
+def measure(name: str, run: Callable[[], object], n: int) -> None:
+    start = time.perf_counter()
+    for _ in range(n):
+        run()
+    elapsed = time.perf_counter() - start
+    print("{:<24} {:>10.2f}ms/report".format(name, elapsed / n * 1e3))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Humbug packages report benchmark")
+    parser.add_argument(
+        "--num-packages", type=int, default=1000, help="Packages in the environment"
+    )
+    parser.add_argument("-n", "--num-reports", type=int, default=100, help="Reports")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        for i in range(args.num_packages):
+            install(directory, "package{}".format(i), "1.0.{}".format(i))
+
+        reporter = HumbugReporter(
+            "benchmark",
+            HumbugConsent(True),
+            bugout_token="benchmark-token",
+            mode=Modes.SYNCHRONOUS,
+            package_index=PackageIndex(),
+        )
+        # Reports are handed to publish (so that they count as reported), but not sent.
+        reporter.publish = lambda report, wait=False: None  # type: ignore
+        # Imports importlib.metadata before sys.path is replaced.
+        if not reporter.package_index.is_available:
+            print("importlib.metadata is not available")
+            return
+        pkg_resources = optional_import("pkg_resources")
+        path = sys.path
+        sys.path = [directory]
+        try:
+            if pkg_resources is not None:
+                measure(
+                    "pkg_resources",
+                    lambda: [
+                        str(distribution)
+                        for distribution in pkg_resources.WorkingSet(  # type: ignore
+                            [directory]
+                        )
+                    ],
+                    max(args.num_reports // 10, 1),
+                )
+            measure(
+                "first report",
+                lambda: reporter.packages_report(),
+                1,
+            )
+            measure(
+                "repeated report",
+                lambda: reporter.packages_report(),
+                args.num_reports,
+            )
+            measure(
+                "changes_only report",
+                lambda: reporter.packages_report(changes_only=True),
+                args.num_reports,
+            )
+            install(directory, "new-package", "1.0.0")
+            measure(
+                "after an install",
+                lambda: reporter.packages_report(changes_only=True),
+                1,
+            )
+        finally:
+            sys.path = path
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
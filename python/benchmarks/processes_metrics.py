@@ -0,0 +1,128 @@
+"""
+Measures utils.get_processes_metrics on a synthetic list of processes, against the previous
+implementation (one call to name(), cpu_percent() and memory_info() per process), and then on the
+processes actually running on this machine.
+
+Usage:
+    python benchmarks/processes_metrics.py --num-processes 5000 --top-n 20
+"""
+import argparse
+from collections import namedtuple
+import json
+import random
+import time
+from typing import Any, Callable, Dict, Iterable
+
+import psutil  # type: ignore
+
+from humbug import utils
+
+MemoryInfo = namedtuple("MemoryInfo", ["rss", "vms"])
+
+
+class SyntheticProcess:
+    """
+    Stands in for psutil.Process objects, both the ones returned by process_iter (with an info
+    dictionary) and the ones whose methods read from /proc on every call.
+    """
+
+    def __init__(self, name: str, cpu_percent: float, rss: int) -> None:
+        self.info: Dict[str, Any] = {
+            "name": name,
+            "cpu_percent": cpu_percent,
+            "memory_info": MemoryInfo(rss, rss * 2),
+        }
+
+    def name(self) -> str:
+        return self.info["name"]
+
+    def cpu_percent(self) -> float:
+        return self.info["cpu_percent"]
+
+    def memory_info(self) -> MemoryInfo:
+        return self.info["memory_info"]
+
+
+def previous_get_processes_metrics(processes: Iterable[Any]) -> Dict[str, Any]:
+    process_metrics: Dict[str, Any] = {}
+    for process in processes:
+        cpu_percent = process.cpu_percent()
+        mem_info = process.memory_info()
+        if process.name() not in process_metrics:
+            process_metrics[f"{process.name()}"] = {
+                "cpu_percent": cpu_percent,
+                "memory_MB": round(mem_info.rss / 1024 / 1024, 2),
+                "amount_of_processes": 1,
+            }
+        else:
+            process_metrics[f"{process.name()}"]["cpu_percent"] += cpu_percent
+            process_metrics[f"{process.name()}"]["memory_MB"] += round(
+                mem_info.rss / 1024 / 1024, 2
+            )
+            process_metrics[f"{process.name()}"]["amount_of_processes"] += 1
+    return process_metrics
+
+
+def measure(name: str, collect: Callable[[], Dict[str, Any]], repeat: int) -> None:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        metrics = collect()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(
+        "{:<32} {:>10.3f}ms {:>6} groups {:>9} bytes of JSON".format(
+            name, elapsed * 1000, len(metrics), len(json.dumps(metrics))
+        )
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Humbug process metrics benchmark")
+    parser.add_argument(
+        "--num-processes", type=int, default=5000, help="Synthetic processes"
+    )
+    parser.add_argument(
+        "--num-names", type=int, default=1000, help="Distinct synthetic process names"
+    )
+    parser.add_argument("--top-n", type=int, default=20, help="Groups to keep")
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per measurement")
+    args = parser.parse_args()
+
+    random.seed(0)
+    processes = [
+        SyntheticProcess(
+            "process-{}".format(random.randrange(args.num_names)),
+            random.random() * 10,
+            random.randrange(1024 * 1024, 1024 * 1024 * 1024),
+        )
+        for _ in range(args.num_processes)
+    ]
+
+    measure(
+        "synthetic, previous",
+        lambda: previous_get_processes_metrics(processes),
+        args.repeat,
+    )
+    measure(
+        "synthetic, all groups",
+        lambda: utils.get_processes_metrics(processes=processes),
+        args.repeat,
+    )
+    measure(
+        "synthetic, top {}".format(args.top_n),
+        lambda: utils.get_processes_metrics(top_n=args.top_n, processes=processes),
+        args.repeat,
+    )
+    measure(
+        "this machine, previous",
+        lambda: previous_get_processes_metrics(psutil.process_iter()),
+        args.repeat,
+    )
+    measure(
+        "this machine, top {}".format(args.top_n),
+        lambda: utils.get_processes_metrics(top_n=args.top_n),
+        args.repeat,
+    )
+
+
+if __name__ == "__main__":
+    main()
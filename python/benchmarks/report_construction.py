@@ -0,0 +1,92 @@
+"""
+Measures how many reports per second a HumbugReporter can construct (without publishing them), how
+long it takes to render their content, and how long it takes to build the body of a report for
+publishing.
+
+Usage:
+    python benchmarks/report_construction.py -n 100000
+"""
+import argparse
+import logging
+import time
+from typing import Callable
+
+from humbug.consent import HumbugConsent
+from humbug.report import HumbugReporter, Modes
+
+
+def recurse(depth: int) -> None:
+    if depth == 0:
+        raise RecursionError("benchmark")
+    recurse(depth - 1)
+
+
+def measure(name: str, construct: Callable[[], object], n: int) -> None:
+    start = time.perf_counter()
+    for _ in range(n):
+        construct()
+    elapsed = time.perf_counter() - start
+    print(
+        "{:<16} {:>10.0f} reports/s {:>8.2f}us/report".format(
+            name, n / elapsed, elapsed / n * 1e6
+        )
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Humbug report construction benchmark")
+    parser.add_argument(
+        "-n", "--num-reports", type=int, default=100000, help="Reports per run"
+    )
+    args = parser.parse_args()
+
+    reporter = HumbugReporter(
+        "benchmark",
+        HumbugConsent(True),
+        client_id="benchmark-client",
+        bugout_token="benchmark-token",
+        mode=Modes.SYNCHRONOUS,
+        tags=["benchmark", "version:1.0.0"],
+    )
+    try:
+        raise ValueError("benchmark")
+    except ValueError as e:
+        error = e
+    # A deep stack, like the ones in RecursionError reports.
+    try:
+        recurse(900)
+    except RecursionError as e:
+        deep_error = e
+    record = logging.LogRecord(
+        "benchmark", logging.ERROR, __file__, 1, "benchmark %s", ("message",), None
+    )
+    parameters = {"a": 1, "b": "two"}
+    feature_report = reporter.feature_report("feature", parameters, publish=False)
+
+    n = args.num_reports
+    measure("system_tags", reporter.system_tags, n)
+    measure(
+        "error_report", lambda: reporter.error_report(error, publish=False), n // 10
+    )
+    # Report content is rendered when it is first needed.
+    measure(
+        "error_content",
+        lambda: reporter.error_report(error, publish=False).content,
+        n // 10,
+    )
+    measure(
+        "deep_error",
+        lambda: reporter.error_report(deep_error, publish=False).content,
+        n // 100,
+    )
+    measure(
+        "feature_report",
+        lambda: reporter.feature_report("feature", parameters, publish=False),
+        n,
+    )
+    measure("logging_report", lambda: reporter.logging_report(record, publish=False), n)
+    measure("post_body", lambda: reporter._post_body(feature_report), n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+This module implements a local stand-in for the Bugout API endpoints that Humbug publishes to. It
+is meant for tests and benchmarks which need to exercise the full publishing path without talking
+to https://spire.bugout.dev.
+"""
+from collections import deque
+import gzip
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import random
+import re
+from socketserver import ThreadingMixIn
+import threading
+import time
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from humbug.lazy_imports import optional_import
+
+# Journal entry endpoints, which the legacy Reporter publishes to
+_JOURNAL_PATH = re.compile(r"^/journals/([^/?]+)/(entries|bulk)\b")
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubHumbugServer:
+    """
+    Runs an HTTP server on localhost (in a background thread) which accepts Humbug report uploads
+    and remembers everything it receives.
+
+    Usage:
+
+    with StubHumbugServer() as server:
+        reporter = HumbugReporter(..., url=server.url)
+        ...
+        print(server.num_requests, server.num_reports)
+
+    The server accepts reports at /humbug/reports and /humbug/reports/bulk, and journal entries at
+    /journals/{journal_id}/entries and /journals/{journal_id}/bulk. Journal entries are added to
+    reports too, and their requests record the journal_id.
+
+    Use respond_with to make the server reject upcoming requests, for example with 429 or 503
+    responses. To simulate a slow or unreliable API, every response can be delayed by
+    latency_seconds, and a random throttle_rate of the requests answered with 429 (and the
+    Retry-After header retry_after), and error_rate of them with 503. These can be changed while the
+    server is running. Reports in rejected requests are not added to reports. status_counts counts
+    the responses by status code.
+
+    For load tests, set keep_requests to False, so that the server only counts requests and reports
+    instead of keeping them in memory.
+
+    Request bodies compressed with gzip (or zstd, if the zstandard package is installed) are
+    decompressed, unless accept_compression is False, in which case compressed requests get 415
+    responses. received_bytes counts request body bytes as they were sent.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        accept_compression: bool = True,
+        latency_seconds: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: Optional[str] = "1",
+        seed: Optional[int] = None,
+        keep_requests: bool = True,
+    ) -> None:
+        self.accept_compression = accept_compression
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.received_bytes = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self.keep_requests = keep_requests
+        self.requests: List[Dict[str, Any]] = []
+        self.reports: List[Dict[str, Any]] = []
+        # Counts of requests and reports, and the client addresses, if keep_requests is False
+        self._num_requests = 0
+        self._num_reports = 0
+        self._client_addresses: Set[Tuple[str, int]] = set()
+        self.status_counts: Dict[int, int] = {}
+        self._responses: Deque[Tuple[int, Optional[str]]] = deque()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self) -> None:
+                content_length = int(self.headers.get("Content-Length", 0))
+                raw_body = self.rfile.read(content_length)
+                status, retry_after = stub._record(
+                    self.path, dict(self.headers), raw_body, self.client_address
+                )
+                with stub._lock:
+                    stub.status_counts[status] = stub.status_counts.get(status, 0) + 1
+                if stub.latency_seconds > 0:
+                    time.sleep(stub.latency_seconds)
+                response = b"{}"
+                self.send_response(status)
+                if retry_after is not None:
+                    self.send_header("Retry-After", retry_after)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self._host = host
+        self._server = _ThreadingHTTPServer((host, port), Handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return "http://{}:{}".format(self._host, self._server.server_port)
+
+    @property
+    def num_requests(self) -> int:
+        with self._lock:
+            if not self.keep_requests:
+                return self._num_requests
+            return len(self.requests)
+
+    @property
+    def num_reports(self) -> int:
+        with self._lock:
+            if not self.keep_requests:
+                return self._num_reports
+            return len(self.reports)
+
+    @property
+    def num_connections(self) -> int:
+        with self._lock:
+            if not self.keep_requests:
+                return len(self._client_addresses)
+            return len(set(request["client_address"] for request in self.requests))
+
+    def respond_with(
+        self, status: int, count: int = 1, retry_after: Optional[str] = None
+    ) -> None:
+        """
+        Makes the server answer the next count requests with the given status code (and Retry-After
+        header, if retry_after is not None) instead of accepting them.
+        """
+        with self._lock:
+            self._responses.extend([(status, retry_after)] * count)
+
+    def _record(
+        self,
+        path: str,
+        headers: Dict[str, str],
+        raw_body: bytes,
+        client_address: Tuple[str, int],
+    ) -> Tuple[int, Optional[str]]:
+        with self._lock:
+            self.received_bytes += len(raw_body)
+
+        content_encoding = headers.get("Content-Encoding")
+        if content_encoding is not None:
+            if not self.accept_compression:
+                return 415, None
+            zstandard = optional_import("zstandard")
+            try:
+                if content_encoding == "gzip":
+                    raw_body = gzip.decompress(raw_body)
+                elif content_encoding == "zstd" and zstandard is not None:
+                    raw_body = zstandard.ZstdDecompressor().decompress(raw_body)
+                else:
+                    return 415, None
+            except Exception:
+                return 400, None
+
+        try:
+            body = json.loads(raw_body.decode("utf-8"))
+        except Exception:
+            return 400, None
+
+        journal_id = None
+        journal_match = _JOURNAL_PATH.match(path)
+        if journal_match is not None:
+            journal_id = journal_match.group(1)
+        is_bulk = path.startswith("/humbug/reports/bulk") or (
+            journal_match is not None and journal_match.group(2) == "bulk"
+        )
+        if is_bulk:
+            if not isinstance(body, list):
+                return 400, None
+            reports = body
+        elif path.startswith("/humbug/reports") or journal_match is not None:
+            reports = [body]
+        else:
+            return 404, None
+
+        with self._lock:
+            if self.keep_requests:
+                self.requests.append(
+                    {
+                        "path": path,
+                        "headers": headers,
+                        "body": body,
+                        "client_address": client_address,
+                        "journal_id": journal_id,
+                    }
+                )
+            else:
+                self._num_requests += 1
+                self._client_addresses.add(client_address)
+            if self._responses:
+                return self._responses.popleft()
+            draw = self._random.random()
+            if draw < self.throttle_rate:
+                return 429, self.retry_after
+            if draw < self.throttle_rate + self.error_rate:
+                return 503, None
+            if self.keep_requests:
+                self.reports.extend(reports)
+            else:
+                self._num_reports += len(reports)
+        return 200, None
+
+    def start(self) -> "StubHumbugServer":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            kwargs={"poll_interval": 0.05},
+            name="humbug_stub_server",
+            daemon=True,
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "StubHumbugServer":
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
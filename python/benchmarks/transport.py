@@ -0,0 +1,68 @@
+"""
+Compares per-report publishing latency with a new connection for every report (the behavior of
+module-level requests.post) against the pooled HumbugTransport, using a local stub Humbug server.
+
+Usage:
+    python benchmarks/transport.py -n 1000
+"""
+import argparse
+import statistics
+import time
+from typing import Callable, List
+
+import requests  # type: ignore
+
+from stub_server import StubHumbugServer
+from humbug.transport import HumbugTransport
+
+
+def measure(post: Callable[..., requests.Response], url: str, n: int) -> List[float]:
+    body = {"title": "benchmark", "content": "x" * 1000, "tags": ["benchmark"]}
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        post(url=url, json=body, timeout=10)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def summarize(name: str, latencies: List[float]) -> None:
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    print(
+        "{:<24} mean={:.3f}ms p50={:.3f}ms p99={:.3f}ms".format(
+            name,
+            statistics.mean(latencies_ms),
+            latencies_ms[len(latencies_ms) // 2],
+            latencies_ms[int(len(latencies_ms) * 0.99) - 1],
+        )
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Humbug transport benchmark")
+    parser.add_argument(
+        "-n", "--num-reports", type=int, default=1000, help="Reports per run"
+    )
+    args = parser.parse_args()
+
+    with StubHumbugServer() as server:
+        url = "{}/humbug/reports".format(server.url)
+
+        summarize("requests.post", measure(requests.post, url, args.num_reports))
+        unpooled_connections = server.num_connections
+
+        transport = HumbugTransport()
+        summarize(
+            "HumbugTransport.post", measure(transport.post, url, args.num_reports)
+        )
+        transport.close()
+
+        print(
+            "Connections opened: requests.post={}, HumbugTransport.post={}".format(
+                unpooled_connections, server.num_connections - unpooled_connections
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
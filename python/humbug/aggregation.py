@@ -0,0 +1,246 @@
+"""
+This module implements in-process aggregation of function calls, so that frequently used features
+can be reported as periodic summaries instead of one report per call.
+"""
+from bisect import bisect_left
+from dataclasses import dataclass, field
+import threading
+import time
+from typing import Any, Dict, List, Sequence, Tuple
+
+# Upper bounds (in seconds) of the buckets of call duration histograms. The last bucket holds every
+# call which took longer than the largest bound.
+DEFAULT_BUCKET_BOUNDS: Tuple[float, ...] = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+)
+
+# Parameters of calls whose parameter tuple did not fit in a feature's max_keys_per_feature.
+OVERFLOW_KEY: Tuple[Tuple[str, str], ...] = (("overflow", "true"),)
+
+ParametersKey = Tuple[Tuple[str, str], ...]
+
+
+@dataclass
+class CallStats:
+    """
+    Statistics about calls with the same feature and parameters. histogram[i] is the number of calls
+    which took at most bucket_bounds[i] seconds (and longer than bucket_bounds[i - 1]).
+    """
+
+    calls: int = 0
+    errors: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    histogram: List[int] = field(default_factory=list)
+
+    def merge(self, other: "CallStats") -> None:
+        self.calls += other.calls
+        self.errors += other.errors
+        self.total_seconds += other.total_seconds
+        self.max_seconds = max(self.max_seconds, other.max_seconds)
+        if not self.histogram:
+            self.histogram = [0] * len(other.histogram)
+        for i, count in enumerate(other.histogram):
+            self.histogram[i] += count
+
+    def quantile(self, q: float, bucket_bounds: Sequence[float]) -> float:
+        """
+        Estimates the q-th quantile of call durations as the upper bound of the bucket it falls
+        in (or max_seconds, for the last bucket).
+        """
+        rank = q * self.calls
+        seen = 0
+        for i, count in enumerate(self.histogram):
+            seen += count
+            if seen >= rank and count:
+                if i < len(bucket_bounds):
+                    return min(bucket_bounds[i], self.max_seconds)
+                break
+        return self.max_seconds
+
+
+@dataclass
+class CallSummary:
+    """
+    Calls of a feature during an interval of interval_seconds seconds, grouped by parameters.
+    """
+
+    feature_name: str
+    interval_seconds: float
+    stats: Dict[ParametersKey, CallStats] = field(default_factory=dict)
+
+    @property
+    def calls(self) -> int:
+        return sum(stats.calls for stats in self.stats.values())
+
+
+class _Shard:
+    """
+    Statistics recorded by a single thread. Only that thread records into it, so its lock is almost
+    never contended.
+    """
+
+    def __init__(self) -> None:
+        self.thread = threading.current_thread()
+        self.lock = threading.Lock()
+        self.stats: Dict[str, Dict[ParametersKey, CallStats]] = {}
+
+
+class CallAggregator:
+    """
+    Counts calls of features, and the distribution of their durations, by feature and parameters.
+
+    Every thread records into its own shard, so recording a call only takes an uncontended lock.
+    collect merges the shards and resets them. At most max_keys_per_feature distinct parameter
+    tuples are tracked per feature (per interval). Calls with other parameters are counted under
+    OVERFLOW_KEY.
+
+    HumbugReporter calls collect every interval_seconds and publishes a calls report for every
+    feature which was called during the interval.
+    """
+
+    def __init__(
+        self,
+        interval_seconds: float = 60.0,
+        group_by_parameters: bool = True,
+        max_keys_per_feature: int = 100,
+        bucket_bounds: Sequence[float] = DEFAULT_BUCKET_BOUNDS,
+    ) -> None:
+        self.interval_seconds = interval_seconds
+        self.group_by_parameters = group_by_parameters
+        self.max_keys_per_feature = max_keys_per_feature
+        self.bucket_bounds = tuple(bucket_bounds)
+
+        self._local = threading.local()
+        self._shards_lock = threading.Lock()
+        self._shards: List[_Shard] = []
+        self._interval_start = time.monotonic()
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = _Shard()
+            self._local.shard = shard
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def after_fork(self) -> None:
+        """
+        Called in a child process after a fork. The calls recorded so far are reported by the parent
+        process, so the child forgets them.
+        """
+        self._local = threading.local()
+        self._shards_lock = threading.Lock()
+        self._shards = []
+        self._interval_start = time.monotonic()
+
+    def parameters_key(self, parameters: Dict[str, Any]) -> ParametersKey:
+        if not self.group_by_parameters:
+            return ()
+        return tuple(
+            sorted((str(key), str(value)) for key, value in parameters.items())
+        )
+
+    def record(
+        self,
+        feature_name: str,
+        parameters_key: ParametersKey,
+        duration_seconds: float,
+        error: bool = False,
+    ) -> None:
+        bucket = bisect_left(self.bucket_bounds, duration_seconds)
+        shard = self._shard()
+        with shard.lock:
+            feature_stats = shard.stats.get(feature_name)
+            if feature_stats is None:
+                feature_stats = {}
+                shard.stats[feature_name] = feature_stats
+            stats = feature_stats.get(parameters_key)
+            if stats is None:
+                if len(feature_stats) >= self.max_keys_per_feature:
+                    parameters_key = OVERFLOW_KEY
+                    stats = feature_stats.get(parameters_key)
+                if stats is None:
+                    stats = CallStats(histogram=[0] * (len(self.bucket_bounds) + 1))
+                    feature_stats[parameters_key] = stats
+            stats.calls += 1
+            if error:
+                stats.errors += 1
+            stats.total_seconds += duration_seconds
+            if duration_seconds > stats.max_seconds:
+                stats.max_seconds = duration_seconds
+            stats.histogram[bucket] += 1
+
+    def collect(self) -> List[CallSummary]:
+        """
+        Returns a summary of the calls of every feature since the last call to collect.
+        """
+        now = time.monotonic()
+        interval_seconds = now - self._interval_start
+        self._interval_start = now
+
+        with self._shards_lock:
+            shards = list(self._shards)
+            # Shards of threads which have exited will not receive any more calls.
+            self._shards = [shard for shard in shards if shard.thread.is_alive()]
+
+        summaries: Dict[str, CallSummary] = {}
+        for shard in shards:
+            with shard.lock:
+                shard_stats = shard.stats
+                shard.stats = {}
+            for feature_name, feature_stats in shard_stats.items():
+                summary = summaries.get(feature_name)
+                if summary is None:
+                    summary = CallSummary(feature_name, interval_seconds)
+                    summaries[feature_name] = summary
+                for parameters_key, stats in feature_stats.items():
+                    merged = summary.stats.get(parameters_key)
+                    if merged is None:
+                        summary.stats[parameters_key] = stats
+                    else:
+                        merged.merge(stats)
+        return list(summaries.values())
+
+
+def summarize(summary: CallSummary, bucket_bounds: Sequence[float]) -> List[str]:
+    """
+    Renders a call summary as the lines of a markdown table.
+    """
+    lines = [
+        "| Parameters | Calls | Calls/s | Errors | Mean (s) | p50 (s) | p90 (s) | p99 (s) | Max (s) |",
+        "| --- | --- | --- | --- | --- | --- | --- | --- | --- |",
+    ]
+    for parameters_key, stats in sorted(
+        summary.stats.items(), key=lambda item: -item[1].calls
+    ):
+        parameters = ", ".join(
+            "`{}` = `{}`".format(key, value) for key, value in parameters_key
+        )
+        lines.append(
+            "| {} | {} | {:.3g} | {} | {:.3g} | {:.3g} | {:.3g} | {:.3g} | {:.3g} |".format(
+                parameters or "-",
+                stats.calls,
+                stats.calls / summary.interval_seconds
+                if summary.interval_seconds > 0
+                else 0.0,
+                stats.errors,
+                stats.total_seconds / stats.calls if stats.calls else 0.0,
+                stats.quantile(0.5, bucket_bounds),
+                stats.quantile(0.9, bucket_bounds),
+                stats.quantile(0.99, bucket_bounds),
+                stats.max_seconds,
+            )
+        )
+    return lines
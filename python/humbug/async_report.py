@@ -0,0 +1,368 @@
+"""
+This module implements a Humbug reporter for programs which run on an asyncio event loop.
+"""
+import asyncio
+import functools
+import logging
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from .consent import HumbugConsent
+from .dedup import ErrorDeduplicator
+from .lazy_imports import optional_import
+from .report import HumbugReporter, Modes, Report
+from .retry import RetryPolicy
+from .sampling import Sampler
+from .system_information import SystemInformation
+from .transport import HumbugTransport
+
+
+class AsyncHumbugReporter:
+    """
+    A Humbug reporter whose methods are coroutines and never block the event loop.
+
+    Reports are constructed by a HumbugReporter (available as the reporter attribute), so they are
+    exactly the same as the reports that HumbugReporter generates. They are published with aiohttp
+    if it is installed. Otherwise, the blocking HumbugTransport runs in the event loop's default
+    executor. Failed reports are retried according to retry_policy, and the reporter's counters
+    record what happens to them. If a sampler or deduplicator is given, feature reports are sampled
+    and error and logging reports are deduplicated, like HumbugReporter does.
+
+    At most max_concurrency reports are sent at a time. Call aclose before the event loop stops, to
+    make sure that pending reports are published.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        consent: HumbugConsent,
+        client_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        system_information: Optional[SystemInformation] = None,
+        bugout_token: Optional[str] = None,
+        timeout_seconds: int = 10,
+        url: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        blacklist_fn: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+        transport: Optional[HumbugTransport] = None,
+        max_concurrency: int = 10,
+        retry_policy: Optional[RetryPolicy] = None,
+        deduplicator: Optional[ErrorDeduplicator] = None,
+        sampler: Optional[Sampler] = None,
+    ) -> None:
+        self.reporter = HumbugReporter(
+            name,
+            consent,
+            client_id=client_id,
+            session_id=session_id,
+            system_information=system_information,
+            bugout_token=bugout_token,
+            timeout_seconds=timeout_seconds,
+            mode=Modes.SYNCHRONOUS,
+            url=url,
+            tags=tags,
+            blacklist_fn=blacklist_fn,
+            transport=transport,
+            retry_policy=retry_policy,
+            deduplicator=deduplicator,
+            sampler=sampler,
+        )
+        self.max_concurrency = max_concurrency
+
+        # asyncio primitives are created lazily so that they belong to the running event loop.
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._session: Any = None
+        self._tasks: Set[asyncio.Future] = set()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _get_session(self) -> Any:
+        if self._session is None:
+            aiohttp = optional_import("aiohttp")
+            assert aiohttp is not None
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.reporter.timeout_seconds),
+            )
+        return self._session
+
+    async def _post(self, url: str, body: Dict[str, Any]) -> None:
+        """
+        Posts a report with aiohttp, retrying it according to the reporter's retry policy.
+        """
+        reporter = self.reporter
+        reporter.retry_budget.deposit()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                async with self._get_session().post(
+                    url, headers=reporter._headers(), json=body
+                ) as response:
+                    await response.read()
+                reporter._check_status(
+                    url, 1, response.status, response.headers.get("Retry-After")
+                )
+                reporter.counters.increment("sent")
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                is_done, retry_after_seconds = reporter._on_failure(e, 1)
+                if is_done:
+                    return
+
+            backoff_seconds = reporter._retry_backoff(
+                attempt, retry_after_seconds, True, 1
+            )
+            if backoff_seconds is None:
+                return
+            await asyncio.sleep(backoff_seconds)
+
+    def _prepare(
+        self, report: Report, allow: Optional[Callable[[], bool]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Returns the body of a report which should be published, or None if it should not be. Runs in
+        the event loop's default executor, since checking consent, fingerprinting errors and
+        rendering reports can all take a while.
+        """
+        if not self.reporter._can_publish():
+            return None
+        if allow is not None and not allow():
+            return None
+        return self.reporter._post_body(report)
+
+    async def _publish(
+        self, report: Report, allow: Optional[Callable[[], bool]] = None
+    ) -> None:
+        loop = asyncio.get_event_loop()
+        is_in_executor = False
+        try:
+            body = await loop.run_in_executor(None, self._prepare, report, allow)
+            if body is None:
+                return
+            async with self._get_semaphore():
+                if optional_import("aiohttp") is not None:
+                    await self._post(
+                        "{}/humbug/reports".format(self.reporter.url), body
+                    )
+                else:
+                    is_in_executor = True
+                    await loop.run_in_executor(
+                        None,
+                        functools.partial(
+                            self.reporter._send, "/humbug/reports", body, True
+                        ),
+                    )
+        except asyncio.CancelledError:
+            # Reports which the executor is already sending are counted by the executor.
+            if not is_in_executor:
+                self.reporter.counters.increment("dropped")
+            raise
+        except Exception:
+            self.reporter.counters.increment("dropped")
+
+    async def publish(
+        self,
+        report: Report,
+        wait: bool = False,
+        allow: Optional[Callable[[], bool]] = None,
+    ) -> None:
+        """
+        Publishes a report. If wait is False, the report is sent in a background task and this
+        coroutine returns immediately.
+
+        If allow is given, it is called (off the event loop) to decide whether the report is
+        published - for example, by the reporter's sampler or deduplicator.
+        """
+        if wait:
+            await self._publish(report, allow)
+        else:
+            task = asyncio.ensure_future(self._publish(report, allow))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def aclose(self, timeout: Optional[float] = None) -> None:
+        """
+        Waits (by default, up to the reporter's timeout_seconds) for pending reports to be
+        published, and releases the reporter's connections. Reports which are still pending after
+        the timeout are cancelled, and counted as dropped.
+        """
+        if timeout is None:
+            timeout = float(self.reporter.timeout_seconds)
+        if self._tasks:
+            _, pending = await asyncio.wait(list(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _publish_report(
+        self,
+        report: Report,
+        publish: bool,
+        wait: bool,
+        allow: Optional[Callable[[], bool]] = None,
+    ) -> Report:
+        if publish:
+            await self.publish(report, wait=wait, allow=allow)
+        return report
+
+    async def custom_report(
+        self,
+        title: str,
+        content: str,
+        tags: Optional[List[str]] = None,
+        publish: bool = True,
+        wait: bool = False,
+    ) -> Report:
+        report = self.reporter.custom_report(title, content, tags=tags, publish=False)
+        return await self._publish_report(report, publish, wait)
+
+    async def system_report(
+        self, tags: Optional[List[str]] = None, publish: bool = True, wait: bool = False
+    ) -> Report:
+        report = self.reporter.system_report(tags=tags, publish=False)
+        return await self._publish_report(report, publish, wait)
+
+    async def error_report(
+        self,
+        error: Exception,
+        tags: Optional[List[str]] = None,
+        publish: bool = True,
+        wait: bool = False,
+    ) -> Report:
+        # Errors are deduplicated with the tags they were reported with, like in record_errors.
+        allow = functools.partial(
+            self.reporter._should_report_error,
+            error,
+            None if tags is None else list(tags),
+        )
+        report = self.reporter.error_report(error, tags=tags, publish=False)
+        return await self._publish_report(report, publish, wait, allow)
+
+    async def env_report(
+        self,
+        title: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        publish: bool = True,
+        wait: bool = False,
+        changes_only: bool = False,
+    ) -> Optional[Report]:
+        env_hash = self.reporter._env_hash()
+        if changes_only and self.reporter._is_env_reported(env_hash):
+            return None
+        report, env = self.reporter._env_report(title, tags, changes_only, env_hash)
+        if publish:
+            self.reporter._mark_env_reported(env)
+        return await self._publish_report(report, publish, wait)
+
+    async def packages_report(
+        self,
+        title: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        publish: bool = True,
+        wait: bool = False,
+        changes_only: bool = False,
+    ) -> Report:
+        report, packages = self.reporter._packages_report(title, tags, changes_only)
+        if publish:
+            self.reporter._mark_packages_reported(packages)
+        return await self._publish_report(report, publish, wait)
+
+    async def compound_report(
+        self,
+        reports: List[Report],
+        title: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        publish: bool = True,
+        wait: bool = False,
+    ) -> Report:
+        report = self.reporter.compound_report(
+            reports, title=title, tags=tags, publish=False
+        )
+        return await self._publish_report(report, publish, wait)
+
+    async def logging_report(
+        self,
+        record: logging.LogRecord,
+        tags: Optional[List[str]] = None,
+        publish: bool = True,
+        wait: bool = False,
+    ) -> Report:
+        allow = functools.partial(
+            self.reporter._should_report_log_record,
+            record,
+            None if tags is None else list(tags),
+        )
+        report = self.reporter.logging_report(record, tags=tags, publish=False)
+        return await self._publish_report(report, publish, wait, allow)
+
+    async def feature_report(
+        self,
+        feature_name: str,
+        parameters: Dict[str, Any],
+        tags: Optional[List[str]] = None,
+        publish: bool = True,
+        wait: bool = False,
+        apply_blacklist: bool = True,
+        apply_sampling: bool = True,
+    ) -> Report:
+        if publish and apply_sampling and self.reporter.sampler is not None:
+            sample_weight = self.reporter._sample_weight(feature_name)
+            if sample_weight is None:
+                publish = False
+            else:
+                tags = (tags or []) + self.reporter._sample_tags(sample_weight)
+        report = self.reporter.feature_report(
+            feature_name,
+            parameters,
+            tags=tags,
+            publish=False,
+            apply_blacklist=apply_blacklist,
+            apply_sampling=False,
+        )
+        return await self._publish_report(report, publish, wait)
+
+    async def metrics_report(
+        self,
+        cpu: bool = True,
+        gpu: bool = True,
+        memory: bool = True,
+        disk: bool = True,
+        network: bool = True,
+        open_files_flag: bool = True,
+        num_threads_flag: bool = True,
+        processes_flag: bool = True,
+        tags: Optional[List[str]] = None,
+        publish: bool = False,
+        wait: bool = False,
+        compact: bool = False,
+    ) -> Report:
+        # Collecting metrics can take a while (especially processes_flag), so it happens off the
+        # event loop.
+        loop = asyncio.get_event_loop()
+        report = await loop.run_in_executor(
+            None,
+            functools.partial(
+                self.reporter.metrics_report,
+                cpu=cpu,
+                gpu=gpu,
+                memory=memory,
+                disk=disk,
+                network=network,
+                open_files_flag=open_files_flag,
+                num_threads_flag=num_threads_flag,
+                processes_flag=processes_flag,
+                tags=tags,
+                publish=False,
+                compact=compact,
+            ),
+        )
+        return await self._publish_report(report, publish, wait)
@@ -0,0 +1,179 @@
+"""
+This module implements batching of Humbug reports, so that bursts of reports can be published to
+the Bugout API in a small number of bulk requests instead of one request per report.
+"""
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from .report_queue import ReportQueue
+
+
+class ReportBatcher:
+    """
+    Collects report bodies and hands them, from a background thread, to send_batch as JSON-encoded
+    bulk payloads (JSON arrays of report bodies), along with the number of reports in each payload.
+    send_batch should return True if the payload was delivered.
+
+    A batch is sent as soon as it holds max_batch_size reports, or once the oldest report in it has
+    waited for linger_seconds. Batches are split so that no payload is larger than max_batch_bytes,
+    unless a single report is larger than that on its own.
+
+    Reports waiting to be batched are held in queue, which determines what happens to new reports
+    when too many are waiting. If no queue is given, the batcher uses an unbounded one.
+
+    Each report can carry a ticket. After every payload is sent, on_batch_sent (if given) is called
+    with the tickets of the reports in the payload and with the return value of send_batch.
+    """
+
+    def __init__(
+        self,
+        send_batch: Callable[[bytes, int], Optional[bool]],
+        max_batch_size: int = 100,
+        max_batch_bytes: int = 1024 * 1024,
+        linger_seconds: float = 1.0,
+        thread_name: str = "humbug_batcher",
+        queue: Optional[ReportQueue] = None,
+        on_batch_sent: Optional[Callable[[List[Any], bool], None]] = None,
+    ) -> None:
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.send_batch = send_batch
+        self.max_batch_size = max_batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.linger_seconds = linger_seconds
+        self.on_batch_sent = on_batch_sent
+
+        if queue is None:
+            queue = ReportQueue(max_size=None)
+        self.queue = queue
+        self._condition = queue.condition
+        self._in_flight = 0
+        self._flush_requested = False
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name=thread_name, daemon=True)
+        self._thread.start()
+
+    def add(
+        self,
+        body: Union[Dict[str, Any], Callable[[], Dict[str, Any]]],
+        ticket: Any = None,
+    ) -> bool:
+        """
+        Queues a report body for publication in an upcoming batch. The body can also be given as a
+        function which builds it. It is called on the background thread, and reports whose body
+        cannot be built are skipped.
+
+        Returns True if the report was queued and False if the queue discarded it.
+        """
+        return self.queue.put((time.monotonic(), body, ticket))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Sends all queued reports without waiting for their batches to fill up. Blocks until they
+        have been sent or until timeout seconds have passed.
+
+        Returns True if every queued report was sent and False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+            while len(self.queue) or self._in_flight:
+                if deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Sends all queued reports and stops the background thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not len(self.queue) and not self._closed:
+                    self._condition.wait()
+                if not len(self.queue):
+                    return
+
+                deadline = self.queue.peek()[0] + self.linger_seconds
+                while (
+                    len(self.queue) < self.max_batch_size
+                    and not self._flush_requested
+                    and not self._closed
+                ):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch_size = min(len(self.queue), self.max_batch_size)
+                batch = [self.queue.get() for _ in range(batch_size)]
+                self._in_flight += batch_size
+
+            try:
+                self._send(batch)
+            finally:
+                with self._condition:
+                    self._in_flight -= batch_size
+                    if not len(self.queue) and not self._in_flight:
+                        self._flush_requested = False
+                    self._condition.notify_all()
+
+    def _send(self, batch: List[Tuple[float, Any, Any]]) -> None:
+        encoded_bodies: List[bytes] = []
+        tickets: List[Any] = []
+        # Size of the enclosing "[" and "]"
+        payload_size = 2
+        for _, body, ticket in batch:
+            try:
+                if callable(body):
+                    body = body()
+                encoded_body = json.dumps(body).encode("utf-8")
+            except Exception:
+                continue
+            # Every body after the first one is preceded by a ","
+            if (
+                encoded_bodies
+                and payload_size + 1 + len(encoded_body) > self.max_batch_bytes
+            ):
+                self._send_payload(encoded_bodies, tickets)
+                encoded_bodies = []
+                tickets = []
+                payload_size = 2
+            if encoded_bodies:
+                payload_size += 1
+            encoded_bodies.append(encoded_body)
+            tickets.append(ticket)
+            payload_size += len(encoded_body)
+
+        if encoded_bodies:
+            self._send_payload(encoded_bodies, tickets)
+
+    def _send_payload(self, encoded_bodies: List[bytes], tickets: List[Any]) -> None:
+        delivered = False
+        try:
+            delivered = bool(
+                self.send_batch(
+                    b"[" + b",".join(encoded_bodies) + b"]", len(encoded_bodies)
+                )
+            )
+        except Exception:
+            pass
+        if self.on_batch_sent is not None:
+            try:
+                self.on_batch_sent(tickets, delivered)
+            except Exception:
+                pass
@@ -1,81 +1,301 @@
 """
 Various implementations of the blacklist functionality.
 """
-from typing import Any, Callable, Dict, List, Optional
+from fnmatch import translate
+from itertools import islice
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
 
+from .truncation import ParameterFormatter
 
-def generate_filter_parameters_by_key_fn(
-    blacklist_keys: List[str],
-) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+# Patterns of parameter values which look like credentials: UUIDs (such as Bugout tokens), JSON Web
+# Tokens, bearer tokens, GitHub and AWS access keys, and long hexadecimal strings.
+TOKEN_PATTERNS = (
+    r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b",
+    r"\beyJ[\w-]+\.[\w-]+\.[\w-]+",
+    r"\b[Bb]earer\s+\S+",
+    r"\bgh[pousr]_\w{36,}",
+    r"\bAKIA[0-9A-Z]{16}\b",
+    r"\b[0-9a-fA-F]{32,}\b",
+)
+
+EMAIL_PATTERN = r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"
+
+# Glob patterns of names (of parameters or environment variables) which usually hold secrets.
+SECRET_KEY_PATTERNS = (
+    "*token*",
+    "*secret*",
+    "*passw*",
+    "*credential*",
+    "*auth*",
+    "*cookie*",
+    "*private*",
+    "*signature*",
+    "*apikey*",
+    "*api_key*",
+    "*_key",
+    "*_key_*",
+    "*_dsn",
+    "*database_url*",
+)
+
+# Replaces containers which (directly or indirectly) contain themselves.
+CYCLE = "<cycle>"
+
+# How ParameterFilter treats values of a given type.
+_SCALAR = 0
+_MAPPING = 1
+_MODEL = 2
+_SEQUENCE = 3
+
+# Formats values for filters which were not given a format_value, when they are not called by a
+# reporter (which passes the format method of its own ParameterFormatter).
+_default_formatter = ParameterFormatter()
+
+# Parameter names are usually few and fixed, but the cache of blacklisting decisions is cleared if it
+# grows past this size, in case they are not.
+_MAX_CACHED_KEYS = 10000
+
+
+class ParameterFilter:
     """
-    Generates a parameter filter function which filters out the parameters whose names are in the given
-    list of blacklist_keys.
+    Parameter filter which is compiled once, and then applied to the parameters of every feature
+    report.
 
-    The comparison to blacklist_keys is case insensitive.
+    Parameters (at any depth) are removed if their names are in blacklist_keys, or match one of the
+    glob patterns in key_patterns (like "*token*") or one of the regular expressions in key_regexes.
+    Names are matched case insensitively. If redact_keys is True, the values of those parameters are
+    replaced with redacted instead, so that their names are still reported.
+
+    Mappings, pydantic models and (if expand_sequences is True) lists, tuples and sets are filtered
+    recursively, up to max_depth levels deep (the parameters themselves are at depth 1). Only the
+    first max_items items of a sequence are kept; the rest are replaced by a count. Objects with
+    a shape (like numpy arrays and pandas data frames) are not. Every other value, and every value
+    deeper than max_depth, is converted to a string with format_value. By default, that is the format
+    method of the calling reporter's truncation.ParameterFormatter (or of a default one, when the
+    filter is called directly), so large values are never converted to strings in full. Parts of
+    those strings which match one of the regular expressions in value_patterns (for example,
+    TOKEN_PATTERNS or EMAIL_PATTERN) are replaced with redacted.
     """
 
-    lowercase_blacklist_keys = [key.lower() for key in blacklist_keys]
+    def __init__(
+        self,
+        blacklist_keys: Iterable[str] = (),
+        key_patterns: Iterable[str] = (),
+        key_regexes: Iterable[str] = (),
+        value_patterns: Iterable[str] = (),
+        max_depth: Optional[int] = None,
+        expand_sequences: bool = True,
+        max_items: int = 100,
+        redacted: str = "<redacted>",
+        format_value: Optional[Callable[[Any], str]] = None,
+        redact_keys: bool = False,
+    ) -> None:
+        self.blacklist_keys = frozenset(key.lower() for key in blacklist_keys)
+        regexes = [translate(pattern.lower()) for pattern in key_patterns]
+        regexes.extend(key_regexes)
+        self._key_regex = None
+        if regexes:
+            self._key_regex = re.compile(
+                "|".join("(?:{})".format(regex) for regex in regexes), re.IGNORECASE
+            )
+        value_patterns = list(value_patterns)
+        self._value_regex = None
+        if value_patterns:
+            self._value_regex = re.compile(
+                "|".join("(?:{})".format(pattern) for pattern in value_patterns)
+            )
+        self.max_depth = max_depth
+        self.expand_sequences = expand_sequences
+        self.max_items = max_items
+        self.redacted = redacted
+        self.format_value = format_value
+        self.redact_keys = redact_keys
 
-    def filter_parameters_by_key(
+        self._is_key_blacklisted: Dict[str, bool] = {}
+        self._kinds: Dict[type, int] = {}
+
+    def __call__(
+        self,
         parameters: Dict[str, Any],
+        format_value: Optional[Callable[[Any], str]] = None,
     ) -> Dict[str, Any]:
+        """
+        Filters parameters. format_value is used if the filter was not created with one.
+        """
+        if self.format_value is not None:
+            format_value = self.format_value
+        elif format_value is None:
+            format_value = _default_formatter.format
+        return self._filter_mapping(parameters, 1, {id(parameters)}, format_value)
+
+    def _matches(self, name: str) -> bool:
+        name = name.lower()
+        return name in self.blacklist_keys or (
+            self._key_regex is not None and self._key_regex.fullmatch(name) is not None
+        )
+
+    def is_blacklisted(self, key: Any) -> bool:
+        if type(key) is not str:
+            return self._matches(str(key))
+        is_blacklisted = self._is_key_blacklisted.get(key)
+        if is_blacklisted is None:
+            is_blacklisted = self._matches(key)
+            if len(self._is_key_blacklisted) >= _MAX_CACHED_KEYS:
+                self._is_key_blacklisted.clear()
+            self._is_key_blacklisted[key] = is_blacklisted
+        return is_blacklisted
+
+    def _kind(self, value_type: type) -> int:
+        kind = self._kinds.get(value_type)
+        if kind is None:
+            if issubclass(value_type, (str, bytes, int, float, bool)):
+                kind = _SCALAR
+            elif getattr(value_type, "shape", None) is not None:
+                # Arrays, data frames and tensors
+                kind = _SCALAR
+            elif hasattr(value_type, "keys"):
+                kind = _MAPPING
+            elif hasattr(value_type, "model_dump") or hasattr(value_type, "dict"):
+                # Pydantic models
+                kind = _MODEL
+            elif issubclass(value_type, (list, tuple, set, frozenset)):
+                kind = _SEQUENCE
+            else:
+                kind = _SCALAR
+            self._kinds[value_type] = kind
+        return kind
+
+    def _redact(self, value: str) -> str:
+        if self._value_regex is None:
+            return value
+        return self._value_regex.sub(self.redacted, value)
+
+    def _filter_mapping(
+        self,
+        mapping: Any,
+        depth: int,
+        ancestors: Set[int],
+        format_value: Callable[[Any], str],
+    ) -> Dict[Any, Any]:
+        if self.redact_keys:
+            return {
+                key: self.redacted
+                if self.is_blacklisted(key)
+                else self._filter_value(mapping[key], depth, ancestors, format_value)
+                for key in mapping.keys()
+            }
         return {
-            k: str(v)
-            for k, v in parameters.items()
-            if k.lower() not in lowercase_blacklist_keys
+            key: self._filter_value(mapping[key], depth, ancestors, format_value)
+            for key in mapping.keys()
+            if not self.is_blacklisted(key)
         }
 
-    return filter_parameters_by_key
+    def _filter_value(
+        self,
+        value: Any,
+        depth: int,
+        ancestors: Set[int],
+        format_value: Callable[[Any], str],
+    ) -> Any:
+        if self.max_depth is not None and depth >= self.max_depth:
+            return self._redact(format_value(value))
+        kind = self._kind(type(value))
+        if kind == _SCALAR or (kind == _SEQUENCE and not self.expand_sequences):
+            return self._redact(format_value(value))
 
+        if id(value) in ancestors:
+            return CYCLE
+        ancestors.add(id(value))
+        try:
+            if kind == _MAPPING:
+                return self._filter_mapping(value, depth + 1, ancestors, format_value)
+            if kind == _MODEL:
+                if hasattr(value, "model_dump"):
+                    return self._filter_mapping(
+                        value.model_dump(), depth + 1, ancestors, format_value
+                    )
+                return self._filter_mapping(
+                    value.dict(), depth + 1, ancestors, format_value
+                )
+            items = [
+                self._filter_value(item, depth + 1, ancestors, format_value)
+                for item in islice(value, self.max_items)
+            ]
+            if len(value) > self.max_items:
+                items.append("<{} more items>".format(len(value) - self.max_items))
+            return items
+        except Exception:
+            return self._redact(format_value(value))
+        finally:
+            ancestors.discard(id(value))
 
-def generate_filter_parameters_by_key_inner_fn(
+
+def generate_filter_parameters_fn(
+    blacklist_keys: Iterable[str] = (),
+    key_patterns: Iterable[str] = (),
+    key_regexes: Iterable[str] = (),
+    value_patterns: Iterable[str] = (),
+    max_depth: Optional[int] = None,
+    redacted: str = "<redacted>",
+    format_value: Optional[Callable[[Any], str]] = None,
+) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Generates a parameter filter function which filters out parameters by name, at any depth, and
+    redacts secrets from parameter values. See ParameterFilter for details.
+    """
+    return ParameterFilter(
+        blacklist_keys=blacklist_keys,
+        key_patterns=key_patterns,
+        key_regexes=key_regexes,
+        value_patterns=value_patterns,
+        max_depth=max_depth,
+        redacted=redacted,
+        format_value=format_value,
+    )
+
+
+def generate_redact_environment_fn(
+    key_patterns: Iterable[str] = SECRET_KEY_PATTERNS,
+    value_patterns: Iterable[str] = TOKEN_PATTERNS,
+    redacted: str = "<redacted>",
+) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Generates a filter for the environment variables in env reports. The values of variables whose
+    names match one of the glob patterns in key_patterns are replaced with redacted, as are the parts
+    of other values which match one of the regular expressions in value_patterns.
+    """
+    return ParameterFilter(
+        key_patterns=key_patterns,
+        value_patterns=value_patterns,
+        max_depth=1,
+        redacted=redacted,
+        format_value=str,
+        redact_keys=True,
+    )
+
+
+def generate_filter_parameters_by_key_fn(
     blacklist_keys: List[str],
 ) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
     """
     Generates a parameter filter function which filters out the parameters whose names are in the given
-    list of blacklist_keys for 1st and 2nd layer of dictionary. Expands pydantic model to dictionary.
+    list of blacklist_keys.
 
     The comparison to blacklist_keys is case insensitive.
     """
+    return ParameterFilter(blacklist_keys=blacklist_keys, max_depth=1)
 
-    lowercase_blacklist_keys = [key.lower() for key in blacklist_keys]
 
-    def filter_parameters_by_key_inner(
-        parameters: Dict[str, Any],
-    ) -> Dict[str, Any]:
-        """
-        Applies blacklist filter to provided parameters and to 2nd layer of
-        inner dictionary parameter if exists.
-        """
-        whitelisted_parameters: Dict[str, Any] = {}
-
-        for key in parameters.keys():
-            if key.lower() in lowercase_blacklist_keys:
-                continue
-
-            key_as_dict: Optional[Dict[str, Any]] = None
-            for d in dir(parameters[key]):
-                if d == "keys":
-                    key_as_dict = parameters[key]
-                    break
-                elif d == "dict":  # Pydantic models support
-                    key_as_dict = parameters[key].dict()
-                    break
-
-            if key_as_dict is not None:
-                try:
-                    inner_dict: Dict[str, str] = {}
-                    for inner_key in key_as_dict.keys():
-                        if inner_key.lower() in lowercase_blacklist_keys:
-                            continue
-                        inner_dict[inner_key] = str(key_as_dict[inner_key])
-                    whitelisted_parameters[key] = inner_dict
-                    continue
-                except Exception:
-                    pass
-
-            whitelisted_parameters[key] = str(parameters[key])
-
-        return whitelisted_parameters
-
-    return filter_parameters_by_key_inner
+def generate_filter_parameters_by_key_inner_fn(
+    blacklist_keys: List[str],
+) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Generates a parameter filter function which filters out the parameters whose names are in the given
+    list of blacklist_keys for 1st and 2nd layer of dictionary. Expands pydantic model to dictionary.
+
+    The comparison to blacklist_keys is case insensitive.
+    """
+    return ParameterFilter(
+        blacklist_keys=blacklist_keys, max_depth=2, expand_sequences=False
+    )
@@ -2,7 +2,9 @@
 This module implements Humbug's user consent mechanisms.
 """
 import os
-from typing import Callable, cast, Iterable, Optional, Sequence, Union
+import threading
+import time
+from typing import Any, Callable, cast, Iterable, Optional, Sequence, Union
 
 ConsentMechanism = Callable[[], bool]
 
@@ -10,21 +12,108 @@ ConsentMechanism = Callable[[], bool]
 class HumbugConsent:
     """
     HumbugConsent stores the client's consent settings.
+
+    By default, check runs every mechanism each time it is called. If ttl_seconds is given, the
+    result of check is cached for that many seconds (until invalidate is called, if it is
+    math.inf), so that checking consent before every report is cheap. Only BUGGER_OFF is still read
+    on every check, so that setting it takes effect immediately. Changes to the variables of
+    environment variable mechanisms take effect once the cached result expires. Call invalidate to
+    re-run every mechanism on the next check, for example after your application changes its
+    consent settings.
     """
 
     BUGGER_OFF = "BUGGER_OFF"
 
-    def __init__(self, *mechanisms: Union[bool, ConsentMechanism]) -> None:
+    def __init__(
+        self,
+        *mechanisms: Union[bool, ConsentMechanism],
+        ttl_seconds: Optional[float] = None,
+    ) -> None:
         if not mechanisms:
             mechanisms = (False,)
         self._mechanisms = mechanisms
         self._bugger_off_mechanism = environment_variable_opt_out(self.BUGGER_OFF, yes)
+        self.ttl_seconds = ttl_seconds
+
+        # BUGGER_OFF is looked up in the (undecoded) mapping underneath os.environ, where there is
+        # one, which is several times faster than os.environ.get.
+        self._bugger_off_key: Any = self.BUGGER_OFF
+        if hasattr(os.environ, "encodekey"):
+            self._bugger_off_key = os.environ.encodekey(self.BUGGER_OFF)
+
+        self._lock = threading.Lock()
+        self._result: Optional[bool] = None
+        self._result_bugger_off: Any = None
+        self._result_expires_at = 0.0
+
+    def _bugger_off(self) -> Any:
+        data = getattr(os.environ, "_data", None)
+        if data is None:
+            return os.environ.get(self.BUGGER_OFF)
+        return data.get(self._bugger_off_key)
+
+    def after_fork(self) -> None:
+        """
+        Called in a child process after a fork. The lock may have been held by a thread of the
+        parent process, which does not exist in the child.
+        """
+        self._lock = threading.Lock()
+
+    def invalidate(self, forget_answers: bool = False) -> None:
+        """
+        Discards the cached result of check. If forget_answers is True, the answers that users gave
+        to prompt_user mechanisms are forgotten as well (including persisted answers), so users will
+        be asked again.
+        """
+        with self._lock:
+            self._result = None
+        if forget_answers:
+            for mechanism in self._mechanisms:
+                if isinstance(mechanism, UserPrompt):
+                    mechanism.forget()
+
+    def is_pending(self) -> bool:
+        """
+        Checks whether consent is still undetermined, because the user has not answered one of the
+        prompt_user mechanisms yet (for example, because consent was only checked off the main
+        thread). While it is, check returns False.
+        """
+        return any(
+            isinstance(mechanism, UserPrompt) and not mechanism.is_answered()
+            for mechanism in self._mechanisms
+        )
 
     def check(self) -> bool:
         """
         Checks if all consent mechanisms signal the user's consent. If any of them signal False, returns
         False. Otherwise, returns True.
         """
+        if self.ttl_seconds is None:
+            return self._check_mechanisms()
+
+        bugger_off = self._bugger_off()
+        with self._lock:
+            if (
+                self._result is not None
+                and bugger_off == self._result_bugger_off
+                and time.monotonic() < self._result_expires_at
+            ):
+                return self._result
+
+        result = self._check_mechanisms()
+        # Users which have not been prompted yet (because consent was checked off the main thread)
+        # should get the chance to answer on the next check.
+        if all(
+            not isinstance(mechanism, UserPrompt) or mechanism.answer is not None
+            for mechanism in self._mechanisms
+        ):
+            with self._lock:
+                self._result = result
+                self._result_bugger_off = bugger_off
+                self._result_expires_at = time.monotonic() + self.ttl_seconds
+        return result
+
+    def _check_mechanisms(self) -> bool:
         for mechanism in self._mechanisms:
             if mechanism is True:
                 continue
@@ -64,39 +153,125 @@ yes = ["1", "t", "y", "T", "Y", "true", "yes", "True", "Yes", "TRUE", "YES"]
 no = ["0", "f", "n", "F", "N", "false", "no", "False", "No", "FALSE", "NO"]
 
 
-def prompt_user(
-    prompt: str,
-    accept_values: Iterable[str],
-    reject_values: Iterable[str],
-    retries: int = 0,
-) -> ConsentMechanism:
-    if accept_values is None:
-        accept_values = yes
-    if reject_values is None:
-        reject_values = no
+class UserPrompt:
+    """
+    Consent mechanism which asks the user for consent, and remembers their answer. If answer_file is
+    given, the answer is also saved there, so that the user is only asked once across sessions.
 
-    def mechanism() -> bool:
+    Users are only prompted from the main thread. Elsewhere (for example, when a report is published
+    from a background thread), consent is denied until the user has answered.
+    """
+
+    def __init__(
+        self,
+        prompt: str,
+        accept_values: Iterable[str],
+        reject_values: Iterable[str],
+        retries: int = 0,
+        answer_file: Optional[str] = None,
+    ) -> None:
+        self.prompt = prompt
+        self.accept_values = accept_values
+        self.reject_values = reject_values
+        self.retries = retries
+        self.answer_file = answer_file
+        self.answer: Optional[bool] = None
+
+    def _read_answer(self) -> Optional[bool]:
+        if self.answer_file is None:
+            return None
+        try:
+            with open(self.answer_file, "r") as ifp:
+                saved_answer = ifp.read().strip()
+        except OSError:
+            return None
+        if saved_answer in yes:
+            return True
+        if saved_answer in no:
+            return False
+        return None
+
+    def _save_answer(self, answer: bool) -> None:
+        if self.answer_file is None:
+            return
+        try:
+            with open(self.answer_file, "w") as ofp:
+                ofp.write("true" if answer else "false")
+        except OSError:
+            pass
+
+    def _ask(self) -> bool:
         result: Optional[bool] = None
         attempts = 0
         while result is None:
-            user_response = input(prompt)
-            if user_response in accept_values:
+            user_response = input(self.prompt)
+            if user_response in self.accept_values:
                 result = True
-            elif user_response in reject_values:
+            elif user_response in self.reject_values:
                 result = False
             else:
-                if attempts >= retries:
+                if attempts >= self.retries:
                     result = False
                 else:
                     attempts += 1
                     print("Invalid input: {}".format(user_response))
                     print(
-                        "To accept, enter one of: {}".format(", ".join(accept_values))
+                        "To accept, enter one of: {}".format(
+                            ", ".join(self.accept_values)
+                        )
                     )
                     print(
-                        "To reject, enter one of: {}".format(", ".join(reject_values))
+                        "To reject, enter one of: {}".format(
+                            ", ".join(self.reject_values)
+                        )
                     )
 
         return cast(bool, result)
 
-    return mechanism
+    def __call__(self) -> bool:
+        answer = self.answer
+        if answer is None:
+            answer = self._read_answer()
+        if answer is None:
+            if threading.current_thread() is not threading.main_thread():
+                return False
+            answer = self._ask()
+            self._save_answer(answer)
+        self.answer = answer
+        return answer
+
+    def is_answered(self) -> bool:
+        """
+        Checks whether the user has answered the prompt, in this session or (if there is an
+        answer_file) in an earlier one.
+        """
+        if self.answer is None:
+            self.answer = self._read_answer()
+        return self.answer is not None
+
+    def forget(self) -> None:
+        """
+        Forgets the user's answer, so that they will be asked again.
+        """
+        self.answer = None
+        if self.answer_file is not None:
+            try:
+                os.remove(self.answer_file)
+            except OSError:
+                pass
+
+
+def prompt_user(
+    prompt: str,
+    accept_values: Iterable[str],
+    reject_values: Iterable[str],
+    retries: int = 0,
+    answer_file: Optional[str] = None,
+) -> ConsentMechanism:
+    if accept_values is None:
+        accept_values = yes
+    if reject_values is None:
+        reject_values = no
+    return UserPrompt(
+        prompt, accept_values, reject_values, retries=retries, answer_file=answer_file
+    )
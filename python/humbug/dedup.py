@@ -0,0 +1,181 @@
+"""
+This module implements client-side deduplication of repeated error reports. A deduplicator lets the
+first few occurrences of an error through, suppresses the rest, and periodically hands back the
+number of suppressed occurrences so that they can be published as a single report.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import hashlib
+import logging
+import threading
+import time
+import traceback
+from types import TracebackType
+from typing import List, Optional
+
+
+def exception_fingerprint(error: BaseException) -> str:
+    """
+    Fingerprint of an exception, made up of its type and the frames in its traceback. The message
+    is not part of the fingerprint, so that errors like KeyError(<some id>) raised from the same
+    place are treated as the same error.
+
+    This does not format the traceback, so it is much cheaper than traceback.format_exception.
+    """
+    error_type = type(error)
+    parts = ["{}.{}".format(error_type.__module__, error_type.__qualname__)]
+    tb: Optional[TracebackType] = error.__traceback__
+    for frame, lineno in traceback.walk_tb(tb):
+        code = frame.f_code
+        parts.append("{}:{}:{}".format(code.co_filename, code.co_name, lineno))
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def log_record_fingerprint(record: logging.LogRecord) -> str:
+    """
+    Fingerprint of a log record, made up of the call site that emitted it and its (unformatted)
+    message template. Records prepared by HumbugHandler keep their template as humbug_msg_template.
+    """
+    template = getattr(record, "humbug_msg_template", record.msg)
+    return hashlib.sha1(
+        "{}:{}:{}:{}".format(
+            record.pathname, record.lineno, record.levelno, template
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+@dataclass
+class Occurrences:
+    """
+    Occurrences of an error which were suppressed by an ErrorDeduplicator. first_seen and last_seen
+    are Unix timestamps.
+    """
+
+    fingerprint: str
+    title: str
+    tags: List[str] = field(default_factory=list)
+    count: int = 0
+    first_seen: float = 0.0
+    last_seen: float = 0.0
+
+
+class _Entry:
+    def __init__(self, title: str, tags: List[str], tokens: float, now: float) -> None:
+        self.title = title
+        self.tags = tags
+        self.tokens = tokens
+        self.last_refill = now
+        self.suppressed = 0
+        # Monotonic time of the first suppressed occurrence in the current window.
+        self.window_start = 0.0
+        self.first_seen = 0.0
+        self.last_seen = 0.0
+
+    def occurrences(self, fingerprint: str) -> Occurrences:
+        return Occurrences(
+            fingerprint=fingerprint,
+            title=self.title,
+            tags=self.tags,
+            count=self.suppressed,
+            first_seen=self.first_seen,
+            last_seen=self.last_seen,
+        )
+
+
+class ErrorDeduplicator:
+    """
+    Thread-safe rate limiter for repeated errors.
+
+    Every fingerprint has its own token bucket, which holds up to burst tokens and regains one token
+    every refill_seconds. An occurrence is allowed (and should be reported in full) if it can take a
+    token from its bucket. Otherwise it is suppressed and counted.
+
+    collect returns the suppressed occurrences of every fingerprint whose counting window (which
+    starts at its first suppressed occurrence) is at least window_seconds old.
+
+    At most max_fingerprints fingerprints are remembered. When a new fingerprint arrives, the least
+    recently seen one is forgotten, and its suppressed occurrences are returned by the next call to
+    collect.
+    """
+
+    def __init__(
+        self,
+        max_fingerprints: int = 1000,
+        burst: int = 5,
+        refill_seconds: float = 60.0,
+        window_seconds: float = 60.0,
+    ) -> None:
+        self.max_fingerprints = max_fingerprints
+        self.burst = burst
+        self.refill_seconds = refill_seconds
+        self.window_seconds = window_seconds
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._evicted: List[Occurrences] = []
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def allow(self, fingerprint: str, title: str, tags: List[str]) -> bool:
+        """
+        Records an occurrence of the error with the given fingerprint. Returns True if it should be
+        reported. title and tags describe the error in the report of its suppressed occurrences.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                entry = _Entry(title, tags, float(self.burst), now)
+                self._entries[fingerprint] = entry
+                while len(self._entries) > self.max_fingerprints:
+                    evicted_fingerprint, evicted = self._entries.popitem(last=False)
+                    if evicted.suppressed:
+                        self._evicted.append(evicted.occurrences(evicted_fingerprint))
+            else:
+                self._entries.move_to_end(fingerprint)
+                if self.refill_seconds > 0:
+                    entry.tokens = min(
+                        float(self.burst),
+                        entry.tokens + (now - entry.last_refill) / self.refill_seconds,
+                    )
+                entry.last_refill = now
+
+            if entry.tokens >= 1:
+                entry.tokens -= 1
+                return True
+
+            timestamp = time.time()
+            if not entry.suppressed:
+                entry.window_start = now
+                entry.first_seen = timestamp
+            entry.suppressed += 1
+            entry.last_seen = timestamp
+            return False
+
+    def after_fork(self) -> None:
+        """
+        Called in a child process after a fork. The occurrences recorded so far are reported by the
+        parent process, so the child forgets them.
+        """
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._evicted = []
+
+    def collect(self, force: bool = False) -> List[Occurrences]:
+        """
+        Returns (and resets) the suppressed occurrences whose window has ended. If force is True,
+        every fingerprint with suppressed occurrences is returned, regardless of its window.
+        """
+        now = time.monotonic()
+        with self._lock:
+            collected = self._evicted
+            self._evicted = []
+            for fingerprint, entry in self._entries.items():
+                if not entry.suppressed:
+                    continue
+                if force or now - entry.window_start >= self.window_seconds:
+                    collected.append(entry.occurrences(fingerprint))
+                    entry.suppressed = 0
+            return collected
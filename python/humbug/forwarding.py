@@ -0,0 +1,153 @@
+"""
+This module implements forwarding of reports from the processes on a host (for example, the workers
+of a pre-fork server or a multiprocessing pool) to a single aggregator process, over a Unix socket,
+so that the aggregator can upload the reports of every process in a few bulk requests.
+"""
+import json
+import os
+import socket
+import socketserver
+import threading
+from typing import Any, Dict, Optional
+
+
+class ReportForwarder:
+    """
+    Sends reports to the ReportAggregator listening on socket_path, one line of JSON per report.
+
+    Every process uses its own connection, so a process which was forked from one that was already
+    forwarding reports opens a new one. If the aggregator cannot be reached, forward returns False,
+    and the reporter publishes the report itself.
+    """
+
+    def __init__(self, socket_path: str, timeout_seconds: float = 1.0) -> None:
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("Forwarding reports requires Unix sockets")
+        self.socket_path = socket_path
+        self.timeout_seconds = timeout_seconds
+
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._socket: Optional[socket.socket] = None
+
+    def _disconnect(self) -> None:
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+        self._socket = None
+
+    def forward(self, path: str, body: Dict[str, Any]) -> bool:
+        """
+        Forwards a report body to the aggregator, which publishes it to the given API path. Returns
+        False if the report could not be forwarded.
+        """
+        line = (json.dumps({"path": path, "body": body}) + "\n").encode("utf-8")
+        if self._pid != os.getpid():
+            self.after_fork()
+        with self._lock:
+            # If the aggregator was restarted, the first attempt fails on the old connection.
+            for _ in range(2):
+                try:
+                    if self._socket is None:
+                        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                        self._socket.settimeout(self.timeout_seconds)
+                        self._socket.connect(self.socket_path)
+                    self._socket.sendall(line)
+                    return True
+                except OSError:
+                    self._disconnect()
+        return False
+
+    def after_fork(self) -> None:
+        """
+        Called in a child process after a fork. The connection belongs to the parent process, so the
+        child opens its own.
+        """
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        # Closing the child's copy of the socket does not close the parent's connection.
+        self._disconnect()
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
+
+
+class ReportAggregator:
+    """
+    Listens on socket_path for reports from ReportForwarders, and publishes them with reporter. Use
+    a reporter in Modes.BATCH, so that the reports of all processes are uploaded in bulk, and do not
+    give that reporter a forwarder of its own.
+
+    The socket is only accessible to the user running the aggregator. A stale socket file left at
+    socket_path (by an aggregator which did not stop cleanly) is replaced.
+    """
+
+    def __init__(self, reporter: Any, socket_path: str) -> None:
+        if not hasattr(socketserver, "ThreadingUnixStreamServer"):
+            raise ValueError("Aggregating reports requires Unix sockets")
+        self.reporter = reporter
+        self.socket_path = socket_path
+        self._server: Optional[socketserver.BaseServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _publish(self, line: bytes) -> None:
+        try:
+            item = json.loads(line.decode("utf-8"))
+            path = item["path"]
+            body = item["body"]
+        except Exception:
+            return
+        if not self.reporter._can_publish():
+            return
+        try:
+            self.reporter._dispatch(path, body, False)
+        except Exception:
+            pass
+
+    def start(self) -> "ReportAggregator":
+        if self._server is not None:
+            return self
+        aggregator = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                for line in self.rfile:
+                    aggregator._publish(line)
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = socketserver.ThreadingUnixStreamServer(  # type: ignore
+            self.socket_path, Handler
+        )
+        server.daemon_threads = True
+        os.chmod(self.socket_path, 0o600)
+        self._server = server
+        self._thread = threading.Thread(
+            target=server.serve_forever, name="humbug_aggregator", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stops accepting reports. Reports which were already received are published by the reporter.
+        """
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        self._thread = None
+        try:
+            os.remove(self.socket_path)
+        except OSError:
+            pass
+
+    def __enter__(self) -> "ReportAggregator":
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
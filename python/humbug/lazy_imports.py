@@ -0,0 +1,51 @@
+"""
+This module implements lazy imports of Humbug's optional (and heavy) dependencies, so that importing
+Humbug does not import them. Each one is imported the first time it is needed.
+"""
+import importlib
+from types import ModuleType
+from typing import Any, Dict, Optional
+
+# Module name -> module, or None if it could not be imported
+_modules: Dict[str, Optional[ModuleType]] = {}
+
+
+def optional_import(module_name: str) -> Optional[ModuleType]:
+    """
+    Imports a module the first time it is called with its name. Returns None if the module is not
+    installed (or fails to import).
+    """
+    if module_name not in _modules:
+        module = None
+        try:
+            module = importlib.import_module(module_name)
+        except Exception:
+            pass
+        _modules[module_name] = module
+    return _modules[module_name]
+
+
+class OptionalDependency:
+    """
+    Class attribute which tells whether an optional dependency is installed. The dependency is
+    imported the first time the attribute is read on an instance. Setting the attribute on an
+    instance overrides it for that instance.
+    """
+
+    def __init__(self, module_name: str) -> None:
+        self.module_name = module_name
+        self.attribute = "_{}_exists".format(module_name)
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.attribute = "_" + name
+
+    def __get__(self, instance: Any, owner: type) -> Any:
+        if instance is None:
+            return self
+        exists = instance.__dict__.get(self.attribute)
+        if exists is None:
+            return optional_import(self.module_name) is not None
+        return exists
+
+    def __set__(self, instance: Any, exists: bool) -> None:
+        instance.__dict__[self.attribute] = exists
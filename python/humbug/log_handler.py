@@ -0,0 +1,186 @@
+"""
+This module implements a logging handler which publishes log records as Humbug reports, without
+slowing down the code which logs them.
+"""
+import copy
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+# Loggers whose records are never reported by default. The HTTP libraries which publish reports
+# log through them, and reporting those records could loop forever.
+DEFAULT_EXCLUDED_LOGGERS = ("humbug", "urllib3", "requests")
+
+_STOP = object()
+
+# Renders the tracebacks of records as they are handled.
+_formatter = logging.Formatter()
+
+
+def _matches(name: str, prefixes: Iterable[str]) -> bool:
+    for prefix in prefixes:
+        if name == prefix or name.startswith(prefix + "."):
+            return True
+    return False
+
+
+class HumbugHandler(logging.Handler):
+    """
+    Logging handler which publishes the records it handles with reporter.logging_report.
+
+    Handling a record only puts it on a queue (of at most max_queue_size records - further records
+    are dropped and counted in reporter.counters as "log_records_dropped"). A listener thread takes
+    records off the queue, up to batch_size at a time, and builds and publishes their reports.
+
+    If loggers is given, only records from those loggers (and their descendants) are reported.
+    Records from exclude_loggers (and their descendants) are never reported.
+
+    Records are queued as snapshots (see prepare), so they are reported as they were when they were
+    logged, even if the arguments of their messages are modified right after.
+    """
+
+    def __init__(
+        self,
+        reporter: Any,
+        level: int = logging.ERROR,
+        tags: Optional[List[str]] = None,
+        loggers: Optional[Iterable[str]] = None,
+        exclude_loggers: Iterable[str] = DEFAULT_EXCLUDED_LOGGERS,
+        max_queue_size: int = 10000,
+        batch_size: int = 100,
+        publish: bool = True,
+    ) -> None:
+        super().__init__(level)
+        self.reporter = reporter
+        self.tags: List[str] = []
+        if tags is not None:
+            self.tags = tags
+        self.loggers = None if loggers is None else tuple(loggers)
+        self.exclude_loggers = tuple(exclude_loggers)
+        self.batch_size = batch_size
+        self.publish = publish
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        # Whether records from a given logger are reported, by logger name.
+        self._is_logger_reported: Dict[str, bool] = {}
+        self._thread = self._start_listener()
+
+    def _start_listener(self) -> threading.Thread:
+        thread = threading.Thread(
+            target=self._listen, name="humbug_log_listener", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def after_fork(self) -> None:
+        """
+        Called in a child process after a fork. The records handled so far are reported by the
+        parent process, and its listener thread does not survive the fork, so the child starts over
+        with an empty queue and a new listener.
+        """
+        if not self._thread.is_alive():
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._thread = self._start_listener()
+
+    def _reports_logger(self, name: str) -> bool:
+        is_reported = self._is_logger_reported.get(name)
+        if is_reported is None:
+            is_reported = not _matches(name, self.exclude_loggers) and (
+                self.loggers is None or _matches(name, self.loggers)
+            )
+            self._is_logger_reported[name] = is_reported
+        return is_reported
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        # Unlike logging.Handler.handle, this does not take the handler's lock: the queue is
+        # thread-safe already.
+        if record.levelno < self.level or not self._reports_logger(record.name):
+            return False
+        if not self.filter(record):
+            return False
+        self.emit(record)
+        return True
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Returns a copy of the record which is safe to report from another thread, like
+        logging.handlers.QueueHandler.prepare does: its message is formatted and its traceback is
+        rendered into exc_text, and its arguments and exc_info are cleared. The message template is
+        kept as humbug_msg_template, for deduplication.
+        """
+        message = record.getMessage()
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = _formatter.formatException(record.exc_info)
+        prepared = copy.copy(record)
+        prepared.humbug_msg_template = record.msg
+        prepared.message = message
+        prepared.msg = message
+        prepared.args = None
+        prepared.exc_info = None
+        prepared.exc_text = exc_text
+        return prepared
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if threading.current_thread() is self._thread:
+            return
+        try:
+            self._queue.put_nowait(self.prepare(record))
+        except queue.Full:
+            self.reporter.counters.increment("log_records_dropped")
+
+    def _report(self, record: logging.LogRecord) -> None:
+        try:
+            if self.reporter._should_report_log_record(record, self.tags):
+                self.reporter.logging_report(
+                    record, tags=list(self.tags), publish=self.publish
+                )
+        except Exception:
+            pass
+
+    def _listen(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for item in batch:
+                if item is not _STOP:
+                    self._report(item)
+                self._queue.task_done()
+            if any(item is _STOP for item in batch):
+                return
+
+    def flush(self) -> None:
+        self.wait(timeout=float(self.reporter.timeout_seconds))
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits (up to timeout seconds, if timeout is not None) until every record handled so far has
+        been reported. Returns False if it timed out.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                if deadline is None:
+                    self._queue.all_tasks_done.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self) -> None:
+        timeout = float(self.reporter.timeout_seconds)
+        if self._thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+                self._thread.join(timeout=timeout)
+            except queue.Full:
+                pass
+        super().close()
@@ -0,0 +1,215 @@
+"""
+This module implements periodic sampling of system metrics in the background, with a fixed-size
+history and summaries of each window of samples.
+"""
+from array import array
+from dataclasses import dataclass, field
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# (name, metrics group, key in the group) for every metric that a MetricsSampler samples by default.
+# The groups are the methods of utils.MetricsCollector, without the "_metrics" suffix.
+DEFAULT_METRICS: Tuple[Tuple[str, str, str], ...] = (
+    ("cpu_percent", "cpu", "cpu_percent"),
+    ("process_cpu_percent", "cpu", "cpu_load_by_process"),
+    ("memory_percent", "memory", "percent_%"),
+    ("process_memory_MB", "process_memory", "rss_MB"),
+    ("threads", "thread", "total"),
+    ("disk_read_MB_per_s", "disk", "read_MB_per_s"),
+    ("disk_write_MB_per_s", "disk", "write_MB_per_s"),
+    ("network_sent_MB_per_s", "network", "MB_sent_per_s"),
+    ("network_recv_MB_per_s", "network", "MB_recv_per_s"),
+)
+
+
+class RingBuffer:
+    """
+    Thread-safe fixed-size buffer of rows of floats (a timestamp followed by num_values values),
+    backed by a single array. Once it is full, new rows overwrite the oldest ones.
+    """
+
+    def __init__(self, capacity: int, num_values: int) -> None:
+        self.capacity = capacity
+        self.row_size = num_values + 1
+        self._data = array("d", [math.nan]) * (capacity * self.row_size)
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count
+
+    def append(self, timestamp: float, values: Sequence[float]) -> None:
+        with self._lock:
+            offset = self._next * self.row_size
+            self._data[offset] = timestamp
+            self._data[offset + 1 : offset + self.row_size] = array("d", values)
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def since(self, timestamp: float) -> List[Tuple[float, List[float]]]:
+        """
+        Returns the rows whose timestamp is at least the given timestamp, oldest first.
+        """
+        rows = []
+        with self._lock:
+            for i in range(self._count):
+                offset = ((self._next - 1 - i) % self.capacity) * self.row_size
+                row_timestamp = self._data[offset]
+                if row_timestamp < timestamp:
+                    break
+                rows.append(
+                    (
+                        row_timestamp,
+                        self._data[offset + 1 : offset + self.row_size].tolist(),
+                    )
+                )
+        rows.reverse()
+        return rows
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """
+    Nearest-rank percentile of values which are already sorted.
+    """
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+@dataclass
+class MetricsSummary:
+    """
+    Minimum, mean, maximum and 95th percentile of every metric over a window of samples. start and
+    end are Unix timestamps.
+    """
+
+    start: float
+    end: float
+    num_samples: int
+    stats: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+
+def summarize(
+    names: Sequence[str], rows: Sequence[Tuple[float, List[float]]]
+) -> Optional[MetricsSummary]:
+    if not rows:
+        return None
+    summary = MetricsSummary(start=rows[0][0], end=rows[-1][0], num_samples=len(rows))
+    for i, name in enumerate(names):
+        values = sorted(row[i] for _, row in rows if not math.isnan(row[i]))
+        if not values:
+            continue
+        summary.stats[name] = {
+            "min": values[0],
+            "mean": sum(values) / len(values),
+            "max": values[-1],
+            "p95": percentile(values, 0.95),
+        }
+    return summary
+
+
+class MetricsSampler:
+    """
+    Samples metrics from a utils.MetricsCollector every interval_seconds on a daemon thread, and
+    keeps the last capacity samples in a RingBuffer, so its memory use does not grow.
+
+    Every window_seconds, the samples from the window are summarized and passed to on_summary.
+    history returns the samples from the last few seconds.
+    """
+
+    def __init__(
+        self,
+        collector: Any,
+        interval_seconds: float = 5.0,
+        window_seconds: float = 300.0,
+        capacity: int = 720,
+        metrics: Sequence[Tuple[str, str, str]] = DEFAULT_METRICS,
+        on_summary: Optional[Callable[[MetricsSummary], Any]] = None,
+    ) -> None:
+        self.collector = collector
+        self.interval_seconds = interval_seconds
+        self.window_seconds = window_seconds
+        self.metrics = tuple(metrics)
+        self.names = [name for name, _, _ in self.metrics]
+        self.on_summary = on_summary
+        self.buffer = RingBuffer(capacity, len(self.metrics))
+
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._window_start = time.time()
+
+    def sample(self) -> None:
+        groups: Dict[str, Dict[str, Any]] = {}
+        values = []
+        for _, group, key in self.metrics:
+            if group not in groups:
+                try:
+                    groups[group] = getattr(self.collector, group + "_metrics")()
+                except Exception:
+                    groups[group] = {}
+            value = groups[group].get(key)
+            values.append(math.nan if value is None else float(value))
+        self.buffer.append(time.time(), values)
+
+    def history(self, seconds: float) -> List[Tuple[float, Dict[str, float]]]:
+        """
+        Returns (timestamp, metrics) for every sample taken in the last seconds seconds, oldest
+        first.
+        """
+        return [
+            (timestamp, dict(zip(self.names, values)))
+            for timestamp, values in self.buffer.since(time.time() - seconds)
+        ]
+
+    def _summarize_window(self) -> None:
+        now = time.time()
+        summary = summarize(self.names, self.buffer.since(self._window_start))
+        self._window_start = now
+        if summary is not None and self.on_summary is not None:
+            try:
+                self.on_summary(summary)
+            except Exception:
+                pass
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval_seconds):
+            self.sample()
+            if time.time() - self._window_start >= self.window_seconds:
+                self._summarize_window()
+
+    def start(self) -> "MetricsSampler":
+        if self._thread is None:
+            self._window_start = time.time()
+            self._thread = threading.Thread(
+                target=self._run, name="humbug_metrics_sampler", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def after_fork(self, collector: Any) -> None:
+        """
+        Called in a child process after a fork, with a collector for the child process. The sampling
+        thread does not survive the fork, so it is started again if it was running, and the samples
+        of the parent process are discarded.
+        """
+        was_running = self._thread is not None and not self._stopped.is_set()
+        self.collector = collector
+        self.buffer = RingBuffer(self.buffer.capacity, len(self.metrics))
+        self._stopped = threading.Event()
+        self._thread = None
+        if was_running:
+            self.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stops sampling, and summarizes the samples in the current (incomplete) window.
+        """
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join(timeout)
+        self._thread = None
+        self._summarize_window()
@@ -0,0 +1,220 @@
+"""
+This module implements enumeration of the Python packages installed in the current environment, for
+packages reports. The packages on each sys.path entry are cached until that entry changes, so
+repeated packages reports only read the metadata of packages which were installed since.
+"""
+from dataclasses import dataclass, field
+import json
+import os
+import sys
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .lazy_imports import optional_import
+
+# Package name -> version
+Packages = Dict[str, str]
+
+
+def _metadata_module() -> Any:
+    """
+    Returns importlib.metadata (or, before Python 3.8, its importlib_metadata backport), or None if
+    neither is available.
+    """
+    metadata = optional_import("importlib.metadata")
+    if metadata is None:
+        metadata = optional_import("importlib_metadata")
+    return metadata
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+@dataclass
+class PackageChanges:
+    """
+    Packages which were installed, removed or upgraded (or downgraded) between two enumerations.
+    changed maps package names to their (old version, new version).
+    """
+
+    added: Packages = field(default_factory=dict)
+    removed: Packages = field(default_factory=dict)
+    changed: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+
+def diff(old: Packages, new: Packages) -> PackageChanges:
+    changes = PackageChanges()
+    for name, version in new.items():
+        old_version = old.get(name)
+        if old_version is None:
+            changes.added[name] = version
+        elif old_version != version:
+            changes.changed[name] = (old_version, version)
+    for name, version in old.items():
+        if name not in new:
+            changes.removed[name] = version
+    return changes
+
+
+class PackageIndex:
+    """
+    Enumerates the installed packages with importlib.metadata, one sys.path entry at a time. The
+    packages on an entry are cached until its modification time changes (installing or removing a
+    package creates or deletes a directory in it), and then only the metadata of new packages is
+    read. If a package is installed on several entries, the
+    first one on sys.path wins, like it does for imports.
+
+    The index also remembers the packages which were last reported, so that reports can include only
+    the changes since then. If snapshot_file is set, they are saved to (and initially loaded from)
+    that file, so changes can be reported across sessions.
+    """
+
+    def __init__(self, snapshot_file: Optional[str] = None) -> None:
+        self.snapshot_file = snapshot_file
+        self._lock = threading.Lock()
+        # sys.path entry -> (modification time, name of metadata directory -> (name, version))
+        self._entries: Dict[
+            str, Tuple[Optional[float], Dict[str, Tuple[str, str]]]
+        ] = {}
+        self._path: List[str] = []
+        self._packages: Optional[Packages] = None
+        self._reported: Optional[Packages] = None
+        self._is_snapshot_loaded = False
+
+    @property
+    def is_available(self) -> bool:
+        return _metadata_module() is not None
+
+    def _read_distribution(self, distribution: Any) -> Optional[Tuple[str, str]]:
+        try:
+            name = distribution.metadata["Name"]
+            version = distribution.version
+        except Exception:
+            return None
+        if not name:
+            return None
+        return name, version
+
+    def _entry_distributions(
+        self, metadata: Any, entry: str, previous: Dict[str, Tuple[str, str]]
+    ) -> Dict[str, Tuple[str, str]]:
+        """
+        Returns the (name, version) of every distribution on a sys.path entry, by the name of its
+        metadata directory. Only the metadata of distributions which are not in previous is read.
+        """
+        distributions: Dict[str, Tuple[str, str]] = {}
+        try:
+            with os.scandir(entry) as it:
+                names = sorted(
+                    dir_entry.name
+                    for dir_entry in it
+                    if dir_entry.name.endswith((".dist-info", ".egg-info"))
+                )
+        except OSError:
+            # Not a directory (for example, a zip file)
+            for distribution in metadata.distributions(path=[entry]):
+                name_version = self._read_distribution(distribution)
+                if name_version is not None:
+                    distributions.setdefault(name_version[0], name_version)
+            return distributions
+
+        for name in names:
+            name_version = previous.get(name)
+            if name_version is None:
+                name_version = self._read_distribution(
+                    metadata.Distribution.at(os.path.join(entry, name))
+                )
+            if name_version is not None:
+                distributions[name] = name_version
+        return distributions
+
+    def packages(self) -> Packages:
+        """
+        Returns the installed packages. The result is the same object for as long as no packages
+        are installed or removed, and must not be modified.
+        """
+        metadata = _metadata_module()
+        if metadata is None:
+            return {}
+        with self._lock:
+            path = list(sys.path)
+            is_changed = path != self._path
+            entries: Dict[str, Tuple[Optional[float], Dict[str, Tuple[str, str]]]] = {}
+            for entry in path:
+                if entry in entries:
+                    continue
+                mtime = _mtime(entry or ".")
+                cached = self._entries.get(entry)
+                if cached is None or cached[0] != mtime:
+                    previous = cached[1] if cached is not None else {}
+                    cached = (
+                        mtime,
+                        self._entry_distributions(metadata, entry or ".", previous),
+                    )
+                    is_changed = True
+                entries[entry] = cached
+            self._entries = entries
+            self._path = path
+
+            if self._packages is None or is_changed:
+                packages: Packages = {}
+                for _, distributions in entries.values():
+                    for name, version in distributions.values():
+                        packages.setdefault(name, version)
+                self._packages = packages
+            return self._packages
+
+    def after_fork(self) -> None:
+        """
+        Called in a child process after a fork. The child has the same packages as the parent, so
+        only the lock (which another thread of the parent may have held) is replaced.
+        """
+        self._lock = threading.Lock()
+
+    def _load_snapshot(self) -> Optional[Packages]:
+        if self.snapshot_file is None:
+            return None
+        try:
+            with open(self.snapshot_file, "r") as ifp:
+                snapshot = json.load(ifp)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(snapshot, dict):
+            return None
+        return {str(name): str(version) for name, version in snapshot.items()}
+
+    def _save_snapshot(self, packages: Packages) -> None:
+        if self.snapshot_file is None:
+            return
+        try:
+            with open(self.snapshot_file, "w") as ofp:
+                json.dump(packages, ofp, sort_keys=True)
+        except OSError:
+            pass
+
+    def last_reported(self) -> Optional[Packages]:
+        """
+        Returns the packages which were last reported (in this session, or, if snapshot_file is set,
+        in a previous one), or None if they were never reported.
+        """
+        with self._lock:
+            if not self._is_snapshot_loaded:
+                self._is_snapshot_loaded = True
+                if self._reported is None:
+                    self._reported = self._load_snapshot()
+            return self._reported
+
+    def mark_reported(self, packages: Packages) -> None:
+        with self._lock:
+            if packages is self._reported:
+                return
+            self._reported = packages
+            self._is_snapshot_loaded = True
+        self._save_snapshot(packages)
@@ -4,73 +4,229 @@ Bugout knowledge bases.
 """
 import atexit
 import concurrent.futures
-from dataclasses import dataclass, field
 from enum import Enum
-from functools import wraps
+from functools import partial, wraps
+from itertools import chain
 import json
 
 import logging
 import os
 import sys
+import threading
 import time
-import traceback
-from typing import Any, Callable, Dict, List, Optional
+import weakref
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 import uuid
-
-import requests  # type: ignore
-
+import warnings
 
 from . import utils
+from .aggregation import (
+    CallAggregator,
+    CallSummary,
+    DEFAULT_BUCKET_BOUNDS,
+    summarize,
+)
+from .batch import ReportBatcher
+from .blacklist import generate_redact_environment_fn, ParameterFilter
 from .consent import HumbugConsent
+from .log_handler import HumbugHandler
+from .packages import diff as diff_packages, PackageIndex, Packages
+from .metrics_sampler import DEFAULT_METRICS, MetricsSampler, MetricsSummary
+from .forwarding import ReportForwarder
+from .lazy_imports import OptionalDependency
+from .dedup import (
+    ErrorDeduplicator,
+    exception_fingerprint,
+    log_record_fingerprint,
+    Occurrences,
+)
+from .report_queue import OverflowPolicy, ReportQueue
+from .retry import parse_retry_after, RetryBudget, RetryPolicy
+from .sampling import Sampler
+from .spool import ReportSpool, SpoolRecord
+from .stats import Counters
 from .system_information import (
     SystemInformation,
     generate as generate_system_information,
 )
+from .transport import HumbugTransport
+from .tracebacks import CapturedError, TracebackCapture
+from .truncation import ParameterFormatter
 
-psutil = None
 
-try:
-    import psutil  # type: ignore
-except ImportError:
-    pass
+DEFAULT_URL = "https://spire.bugout.dev"
 
-GPUtil = None
+# The body of a request to publish a report, or a function which builds it on the thread which sends
+# the request.
+ReportBody = Union[Dict[str, Any], Callable[[], Dict[str, Any]]]
 
-try:
-    import GPUtil  # type: ignore
-except ImportError:
-    pass
 
-pkg_resources = None
+class BugoutUnexpectedStatusResponse(Exception):
+    """
+    Raised when Bugout server response return incorrect status.
+    """
 
-try:
-    import pkg_resources  # type: ignore
-except ImportError:
-    pass
+    def __init__(
+        self,
+        message: str = "",
+        status_code: Optional[int] = None,
+        retry_after_seconds: Optional[float] = None,
+    ) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after_seconds = retry_after_seconds
 
 
-DEFAULT_URL = "https://spire.bugout.dev"
+class Report:
+    """
+    A Humbug report. content can be given as a string, or as a function which renders it. In that
+    case, the content is rendered the first time it is needed - for reports which are published in
+    the background, on the thread which sends them, so that formatting does not slow down the code
+    which creates the report.
+    """
 
+    def __init__(
+        self,
+        title: str,
+        content: Union[str, Callable[[], str]],
+        tags: Optional[List[str]] = None,
+    ) -> None:
+        self.title = title
+        self._content = content
+        self.tags: List[str] = []
+        if tags is not None:
+            self.tags = tags
 
-class BugoutUnexpectedStatusResponse(Exception):
+    @property
+    def content(self) -> str:
+        content = self._content
+        if not isinstance(content, str):
+            # Rendering functions are deterministic, so it does not matter if two threads render the
+            # same report at the same time.
+            content = content()
+            self._content = content
+        return content
+
+    @content.setter
+    def content(self, content: str) -> None:
+        self._content = content
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Report):
+            return NotImplemented
+        return (self.title, self.content, self.tags) == (
+            other.title,
+            other.content,
+            other.tags,
+        )
+
+    def __repr__(self) -> str:
+        return "Report(title={!r}, content={!r}, tags={!r})".format(
+            self.title, self.content, self.tags
+        )
+
+
+class _DeferredReport(Report):
     """
-    Raised when Bugout server response return incorrect status.
+    A report which is only built when its title, content or tags are first read. Reporters return
+    these in place of reports which cannot be published (because the user has not consented, or
+    the reporter has no token), so that building those reports costs nothing unless they are read.
+    Once built, it is the same as the report that build returns.
     """
 
+    def __init__(self, build: Callable[[], Report]) -> None:
+        self._build: Optional[Callable[[], Report]] = build
+        self._report: Optional[Report] = None
+
+    def _built(self) -> Report:
+        report = self._report
+        if report is None:
+            assert self._build is not None
+            report = self._build()
+            self._report = report
+            self._build = None
+        return report
+
+    @property
+    def title(self) -> str:
+        return self._built().title
+
+    @title.setter
+    def title(self, title: str) -> None:
+        self._built().title = title
+
+    @property
+    def content(self) -> str:
+        return self._built().content
+
+    @content.setter
+    def content(self, content: str) -> None:
+        self._built().content = content
+
+    @property
+    def tags(self) -> List[str]:
+        return self._built().tags
+
+    @tags.setter
+    def tags(self, tags: List[str]) -> None:
+        self._built().tags = tags
 
-@dataclass
-class Report:
-    title: str
-    content: str
-    tags: List[str] = field(default_factory=list)
+
+def merge_tags(*tag_lists: Iterable[str]) -> List[str]:
+    """
+    Concatenates lists of tags, keeping only the first occurrence of each tag.
+    """
+    return list(dict.fromkeys(chain.from_iterable(tag_lists)))
+
+
+def build_body(body: ReportBody) -> Dict[str, Any]:
+    if callable(body):
+        return body()
+    return body
 
 
 class Modes(Enum):
     DEFAULT = 0
     SYNCHRONOUS = 1
+    BATCH = 2
+
+
+# Reporters in this process, so that they can be reset in child processes after a fork.
+_reporters: "weakref.WeakSet[HumbugReporter]" = weakref.WeakSet()
+
+
+def _after_fork_in_child() -> None:
+    for reporter in list(_reporters):
+        try:
+            reporter._after_fork()
+        except Exception:
+            pass
+
+
+# Python 3.6 does not have os.register_at_fork. There, reporters check whether they are running in
+# a new process whenever they publish a report.
+_HAS_FORK_HOOKS = hasattr(os, "register_at_fork")
+if _HAS_FORK_HOOKS:
+    os.register_at_fork(after_in_child=_after_fork_in_child)
 
 
 class HumbugReporter:
+    # Whether optional dependencies are installed. Each one is imported the first time its flag is
+    # read, so creating a reporter does not import them.
+    psutil_exists = OptionalDependency("psutil")
+    gputil_exists = OptionalDependency("GPUtil")
+    pkg_resources_exists = OptionalDependency("pkg_resources")
+
     def __init__(
         self,
         name: str,
@@ -84,53 +240,336 @@ class HumbugReporter:
         url: Optional[str] = None,
         tags: Optional[List[str]] = None,
         blacklist_fn: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+        batch_max_size: int = 100,
+        batch_max_bytes: int = 1024 * 1024,
+        batch_linger_seconds: float = 1.0,
+        transport: Optional[HumbugTransport] = None,
+        max_queue_size: Optional[int] = 10000,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_NEWEST,
+        block_timeout_seconds: float = 1.0,
+        spool: Optional[ReportSpool] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        deduplicator: Optional[ErrorDeduplicator] = None,
+        sampler: Optional[Sampler] = None,
+        call_aggregator: Optional[CallAggregator] = None,
+        parameter_formatter: Optional[ParameterFormatter] = None,
+        forwarder: Optional[ReportForwarder] = None,
+        traceback_capture: Optional[TracebackCapture] = None,
+        package_index: Optional[PackageIndex] = None,
+        env_filter: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
     ):
+        # Set before any of the reporter's threads start, since they compare it to the current PID.
+        self._pid = os.getpid()
+
+        # The aggregator batches the reports of all processes, so forwarding reporters do not batch
+        # them themselves.
+        if forwarder is not None and mode == Modes.BATCH:
+            raise ValueError("Reporters with a forwarder cannot use Modes.BATCH")
         if url is None:
             url = DEFAULT_URL
         self.url = url.rstrip("/")
         self.name = name
         self.consent = consent
+        # system_tags and the request headers only change when client_id, session_id or
+        # bugout_token do, so they are built once and cached until one of those is set.
+        self._system_tags: Optional[Tuple[str, ...]] = None
+        self._request_headers: Optional[Dict[str, str]] = None
+        self._bulk_request_headers: Optional[Dict[str, str]] = None
         self.client_id = client_id
         if session_id is not None:
             self.session_id = session_id
         else:
             self.session_id = str(uuid.uuid4())
-        if system_information is None:
-            system_information = generate_system_information()
-        self.system_information = system_information
+        # Generated the first time it is needed.
+        self._system_information = system_information
+        self._system_information_lock = threading.Lock()
         self.bugout_token = bugout_token
         self.timeout_seconds = timeout_seconds
 
-        self.report_futures: List[concurrent.futures.Future] = []
+        if transport is None:
+            transport = HumbugTransport()
+        self.transport = transport
+
+        if retry_policy is None:
+            retry_policy = RetryPolicy()
+        self.retry_policy = retry_policy
+        self.retry_budget = RetryBudget(
+            retry_policy.budget_ratio, retry_policy.budget_max_tokens
+        )
+
+        # Counts what happens to reports: "sent", "retried", "throttled", "dropped" (reports that
+        # the reporter gave up on), "deferred" (reports that it gave up on for now, which stay in
+        # the spool to be sent again later) and "forwarded", as well as the queue_* and spool_*
+        # counters.
+        self.counters = Counters()
+        self.spool = spool
+        if self.spool is not None:
+            self.spool.counters = self.counters
+        # Reports waiting to be published in the background (by the executor in DEFAULT mode and by
+        # the batcher in BATCH mode). Every item in the queue ends with the report's spool record.
+        self.report_queue = ReportQueue(
+            max_size=max_queue_size,
+            overflow_policy=overflow_policy,
+            block_timeout_seconds=block_timeout_seconds,
+            counters=self.counters,
+            on_drop=lambda item: self._ack(item[-1]),
+        )
         atexit.register(self.wait)
 
+        # If a forwarder is set, reports are forwarded to an aggregator process (see
+        # forwarding.ReportAggregator), which publishes them.
+        self.forwarder = forwarder
+
         self.executor: Optional[concurrent.futures.Executor] = None
+        self._drain_lock = threading.Lock()
+        self._is_drain_scheduled = False
+        self._drain_future: Optional[concurrent.futures.Future] = None
         if mode == Modes.DEFAULT:
             self.executor = concurrent.futures.ThreadPoolExecutor(
                 max_workers=1, thread_name_prefix="humbug_reporter"
             )
 
+        self.batcher: Optional[ReportBatcher] = None
+        if mode == Modes.BATCH:
+            self.batcher = ReportBatcher(
+                self._publish_batch,
+                max_batch_size=batch_max_size,
+                max_batch_bytes=batch_max_bytes,
+                linger_seconds=batch_linger_seconds,
+                queue=self.report_queue,
+                on_batch_sent=self._on_batch_sent,
+            )
+
         self.is_excepthook_set = False
         self.is_loggerhook_set = False
+        self.logging_handler: Optional[HumbugHandler] = None
 
         self.tags: List[str] = []
         if tags is not None:
             self.tags = tags
 
         self.blacklist_fn = blacklist_fn
+        self.sampler = sampler
+        # Bounds the length of the parameters in feature reports.
+        if parameter_formatter is None:
+            parameter_formatter = ParameterFormatter()
+        self.parameter_formatter = parameter_formatter
+        # Bounds the size of the tracebacks in error reports.
+        if traceback_capture is None:
+            traceback_capture = TracebackCapture()
+        self.traceback_capture = traceback_capture
+        # Enumerates the packages in packages reports, and remembers which were last reported.
+        if package_index is None:
+            package_index = PackageIndex()
+        self.package_index = package_index
+        # (packages, content) of the last full packages report
+        self._packages_content: Optional[Tuple[Packages, str]] = None
+        # Redacts secrets from env reports.
+        if env_filter is None:
+            env_filter = generate_redact_environment_fn()
+        self.env_filter = env_filter
+        # (hash, filtered environment variables, content if it was rendered) of the last environment
+        # which was filtered, and (hash, filtered environment variables) of the last environment
+        # which was published
+        self._env_content: Optional[Tuple[int, Dict[str, Any], Optional[str]]] = None
+        self._reported_env: Optional[Tuple[int, Dict[str, Any]]] = None
+
+        self._metrics_collector: Optional[utils.MetricsCollector] = None
+        self._metrics_collector_lock = threading.Lock()
+        self.metrics_sampler: Optional[MetricsSampler] = None
+        # How many seconds of metrics history error reports include, if the sampler is running.
+        self.error_metrics_history_seconds = 0.0
+
+        # Reports left in the spool by earlier reporters are replayed in the background, once the
+        # reporter can publish them.
+        self._spool_replay_lock = threading.Lock()
+        self._is_spool_replay_started = False
+        if self.spool is not None:
+            self._start_spool_replay()
+
+        # If a deduplicator is set, repeated errors from the excepthook, the loggerhook and
+        # record_errors are rate limited, and their suppressed occurrences are published
+        # periodically as occurrences reports.
+        self.deduplicator = deduplicator
+        self._flushers_stopped = threading.Event()
+        if self.deduplicator is not None:
+            threading.Thread(
+                target=self._run_deduplicator, name="humbug_deduplicator", daemon=True
+            ).start()
+
+        # Aggregates calls of functions decorated with record_call(aggregate=True). The thread
+        # which publishes its summaries is started by the first such decorator.
+        self.call_aggregator = call_aggregator
+        self._call_aggregator_lock = threading.Lock()
+        self._is_call_aggregator_started = False
+
+        _reporters.add(self)
+
+    def _after_fork(self) -> None:
+        """
+        Resets the reporter in a child process after a fork (for example, in a worker of a pre-fork
+        server or of a multiprocessing pool).
 
-        self.psutil_exists = psutil is not None
-        self.gputil_exists = GPUtil is not None
-        self.pkg_resources_exists = pkg_resources is not None
+        Threads do not survive a fork, so the child starts its own executor, batcher and background
+        threads. The reports which were waiting to be published, the reporter's connections and its
+        spool segments belong to the parent process, which publishes the reports, so the child
+        starts over without them.
+        """
+        self._pid = os.getpid()
+        self._system_information_lock = threading.Lock()
+        self._spool_replay_lock = threading.Lock()
+        self.consent.after_fork()
+        self.package_index.after_fork()
+        self.transport.after_fork()
+        if self.forwarder is not None:
+            self.forwarder.after_fork()
+        self.retry_budget = RetryBudget(
+            self.retry_policy.budget_ratio, self.retry_policy.budget_max_tokens
+        )
+        self.counters = Counters()
+        if self.spool is not None:
+            self.spool.counters = self.counters
+            self.spool.after_fork()
+
+        report_queue = self.report_queue
+        self.report_queue = ReportQueue(
+            max_size=report_queue.max_size,
+            overflow_policy=report_queue.overflow_policy,
+            block_timeout_seconds=report_queue.block_timeout_seconds,
+            counters=self.counters,
+            on_drop=lambda item: self._ack(item[-1]),
+        )
+        self._drain_lock = threading.Lock()
+        self._is_drain_scheduled = False
+        self._drain_future = None
+        if self.executor is not None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="humbug_reporter"
+            )
+        batcher = self.batcher
+        if batcher is not None:
+            self.batcher = ReportBatcher(
+                self._publish_batch,
+                max_batch_size=batcher.max_batch_size,
+                max_batch_bytes=batcher.max_batch_bytes,
+                linger_seconds=batcher.linger_seconds,
+                queue=self.report_queue,
+                on_batch_sent=self._on_batch_sent,
+            )
+
+        if self.logging_handler is not None:
+            self.logging_handler.after_fork()
+
+        self._flushers_stopped = threading.Event()
+        if self.deduplicator is not None:
+            self.deduplicator.after_fork()
+            threading.Thread(
+                target=self._run_deduplicator, name="humbug_deduplicator", daemon=True
+            ).start()
+        self._call_aggregator_lock = threading.Lock()
+        if self.call_aggregator is not None:
+            self.call_aggregator.after_fork()
+            if self._is_call_aggregator_started:
+                self._is_call_aggregator_started = False
+                self._start_call_aggregator()
+
+        # The metrics collector measures the process which created it.
+        self._metrics_collector_lock = threading.Lock()
+        self._metrics_collector = None
+        if self.metrics_sampler is not None:
+            self.metrics_sampler.after_fork(self.metrics_collector)
 
     def wait(self) -> None:
-        concurrent.futures.wait(
-            self.report_futures, timeout=float(self.timeout_seconds)
-        )
+        if self.metrics_sampler is not None:
+            self.metrics_sampler.stop(timeout=float(self.timeout_seconds))
+        if self.logging_handler is not None:
+            self.logging_handler.wait(timeout=float(self.timeout_seconds))
+        self._flushers_stopped.set()
+        if self.deduplicator is not None:
+            self._publish_occurrences(force=True)
+        if self.call_aggregator is not None:
+            self._publish_call_summaries()
+        if self.batcher is not None:
+            self.batcher.flush(timeout=float(self.timeout_seconds))
+        drain_future = self._drain_future
+        if drain_future is not None:
+            concurrent.futures.wait([drain_future], timeout=float(self.timeout_seconds))
         if self.executor is not None:
             self.executor.shutdown()
+        if self.spool is not None:
+            self.spool.sync()
+
+    @property
+    def dropped_reports(self) -> int:
+        """
+        Number of reports that were discarded because too many reports were waiting to be
+        published.
+        """
+        return sum(
+            count
+            for name, count in self.counters.snapshot().items()
+            if name.startswith("queue_dropped_")
+        )
+
+    @property
+    def report_futures(self) -> List[concurrent.futures.Future]:
+        """
+        Deprecated. Reports are no longer published as individual futures, so this is always empty.
+        Use wait to wait for pending reports to be published.
+        """
+        warnings.warn(
+            "HumbugReporter.report_futures is deprecated and always empty. Use wait instead.",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        return []
+
+    @property
+    def client_id(self) -> Optional[str]:
+        return self._client_id
+
+    @client_id.setter
+    def client_id(self, client_id: Optional[str]) -> None:
+        self._client_id = client_id
+        self._system_tags = None
+
+    @property
+    def session_id(self) -> str:
+        return self._session_id
+
+    @session_id.setter
+    def session_id(self, session_id: str) -> None:
+        self._session_id = session_id
+        self._system_tags = None
+
+    @property
+    def bugout_token(self) -> Optional[str]:
+        return self._bugout_token
+
+    @bugout_token.setter
+    def bugout_token(self, bugout_token: Optional[str]) -> None:
+        self._bugout_token = bugout_token
+        self._request_headers = None
+        self._bulk_request_headers = None
+
+    @property
+    def system_information(self) -> SystemInformation:
+        with self._system_information_lock:
+            if self._system_information is None:
+                self._system_information = generate_system_information()
+            return self._system_information
+
+    @system_information.setter
+    def system_information(self, system_information: SystemInformation) -> None:
+        self._system_information = system_information
+        self._system_tags = None
 
     def system_tags(self) -> List[str]:
+        if self._system_tags is None:
+            self._system_tags = tuple(self._build_system_tags())
+        return list(self._system_tags)
+
+    def _build_system_tags(self) -> List[str]:
         tags = [
             "humbug",
             "source:{}".format(self.name),
@@ -153,36 +592,318 @@ class HumbugReporter:
         return {
             "title": report.title,
             "content": report.content,
-            "tags": report.tags + self.tags,
+            "tags": merge_tags(report.tags, self.tags),
         }
 
-    def publish(self, report: Report, wait: bool = False) -> None:
-        if not self.consent.check():
+    def _headers(self) -> Dict[str, str]:
+        """
+        Headers for requests to the Bugout API. The returned dictionary is shared, so it must not be
+        modified.
+        """
+        if self._request_headers is None:
+            self._request_headers = {
+                "Authorization": "Bearer {}".format(self.bugout_token),
+            }
+        return self._request_headers
+
+    def _bulk_headers(self) -> Dict[str, str]:
+        if self._bulk_request_headers is None:
+            self._bulk_request_headers = {
+                **self._headers(),
+                "Content-Type": "application/json",
+            }
+        return self._bulk_request_headers
+
+    def _post_once(
+        self,
+        url: str,
+        num_reports: int,
+        headers: Dict[str, str],
+        json: Optional[Any] = None,
+        data: Optional[bytes] = None,
+    ) -> None:
+        response = self.transport.post(
+            url=url, headers=headers, json=json, data=data, timeout=self.timeout_seconds
+        )
+        self._check_status(
+            url, num_reports, response.status_code, response.headers.get("Retry-After")
+        )
+
+    def _check_status(
+        self,
+        url: str,
+        num_reports: int,
+        status_code: int,
+        retry_after: Optional[str],
+    ) -> None:
+        """
+        Raises BugoutUnexpectedStatusResponse if the server did not accept the reports.
+        """
+        if status_code == 429:
+            self.counters.increment("throttled", num_reports)
+        if not 200 <= status_code < 300:
+            raise BugoutUnexpectedStatusResponse(
+                "Unexpected status code from {}: {}".format(url, status_code),
+                status_code=status_code,
+                retry_after_seconds=parse_retry_after(retry_after),
+            )
+
+    def _post(
+        self,
+        url: str,
+        num_reports: int,
+        retry: bool,
+        headers: Dict[str, str],
+        json: Optional[Any] = None,
+        data: Optional[bytes] = None,
+    ) -> bool:
+        """
+        Posts reports to the Bugout API. If retry is True, failed requests are retried according to
+        the reporter's retry policy, sleeping in between - so this should only happen off the
+        caller's thread.
+
+        Returns False if the reports should be sent again later (for example, after a network
+        failure) and True if the server has dealt with them, even if it rejected them.
+        """
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                self._post_once(url, num_reports, headers, json=json, data=data)
+                self.counters.increment("sent", num_reports)
+                return True
+            except Exception as e:
+                is_done, retry_after_seconds = self._on_failure(e, num_reports)
+                if is_done:
+                    return True
+
+            backoff_seconds = self._retry_backoff(
+                attempt, retry_after_seconds, retry, num_reports
+            )
+            if backoff_seconds is None:
+                return False
+            time.sleep(backoff_seconds)
+
+    def _on_failure(
+        self, error: Exception, num_reports: int
+    ) -> Tuple[bool, Optional[float]]:
+        """
+        Handles an error from an attempt to post reports. Returns whether the reports are done with
+        (because the server rejected them), and how long the server asked to wait before retrying.
+        """
+        if isinstance(error, BugoutUnexpectedStatusResponse):
+            if error.status_code is None or not self.retry_policy.is_retryable(
+                error.status_code
+            ):
+                self.counters.increment("dropped", num_reports)
+                return True, None
+            return False, error.retry_after_seconds
+        return False, None
+
+    def _retry_backoff(
+        self,
+        attempt: int,
+        retry_after_seconds: Optional[float],
+        retry: bool,
+        num_reports: int,
+    ) -> Optional[float]:
+        """
+        Decides whether reports are posted again after the given failed attempt. Returns how long to
+        wait before the next attempt, or None if the reports are given up on.
+        """
+        backoff_seconds = self.retry_policy.backoff_seconds(
+            attempt, retry_after_seconds
+        )
+        if (
+            not retry
+            or attempt >= self.retry_policy.max_attempts
+            or backoff_seconds is None
+            or not self.retry_budget.withdraw()
+        ):
+            # Every report is written to the spool (if there is one) before it is sent, and
+            # stays there until it is delivered.
+            if self.spool is not None:
+                self.counters.increment("deferred", num_reports)
+            else:
+                self.counters.increment("dropped", num_reports)
+            return None
+        self.counters.increment("retried", num_reports)
+        return backoff_seconds
+
+    def _publish_batch(self, payload: bytes, num_reports: int) -> bool:
+        """
+        Publishes a JSON-encoded list of report bodies using the bulk reports endpoint.
+        """
+        return self._post(
+            "{}/humbug/reports/bulk".format(self.url),
+            num_reports,
+            True,
+            self._bulk_headers(),
+            data=payload,
+        )
+
+    def _send(self, path: str, body: ReportBody, retry: bool) -> bool:
+        try:
+            json_body = build_body(body)
+        except Exception:
+            self.counters.increment("dropped")
+            return True
+        # If the aggregator cannot be reached, the report is published directly.
+        if self.forwarder is not None and self.forwarder.forward(path, json_body):
+            self.counters.increment("forwarded")
+            return True
+        return self._post(self.url + path, 1, retry, self._headers(), json=json_body)
+
+    def _ack(self, spooled: Optional[SpoolRecord]) -> None:
+        """
+        Removes a report which no longer needs to be sent from the spool.
+        """
+        if self.spool is not None and spooled is not None:
+            self.spool.ack(spooled)
+
+    def _deliver(
+        self,
+        path: str,
+        body: ReportBody,
+        spooled: Optional[SpoolRecord],
+        retry: bool,
+    ) -> None:
+        # Reports which could not be delivered stay in the spool, to be replayed later.
+        if self._send(path, body, retry):
+            self._ack(spooled)
+
+    def _on_batch_sent(
+        self, spooled_reports: List[Optional[SpoolRecord]], delivered: bool
+    ) -> None:
+        if delivered:
+            for spooled in spooled_reports:
+                self._ack(spooled)
+
+    def _drain(self) -> None:
+        """
+        Publishes reports from the report queue until it is empty. Runs on the executor.
+        """
+        while True:
+            with self._drain_lock:
+                try:
+                    path, body, spooled = self.report_queue.get()
+                except IndexError:
+                    self._is_drain_scheduled = False
+                    return
+            self._deliver(path, body, spooled, True)
+
+    def _enqueue(
+        self, path: str, body: ReportBody, spooled: Optional[SpoolRecord]
+    ) -> None:
+        """
+        Queues a report for publication from the executor, and makes sure that the executor is
+        draining the queue.
+        """
+        assert self.executor is not None
+        if not self.report_queue.put((path, body, spooled)):
             return
-        if self.bugout_token is None:
+        with self._drain_lock:
+            if self._is_drain_scheduled:
+                return
+            self._is_drain_scheduled = True
+        try:
+            self._drain_future = self.executor.submit(self._drain)
+        except Exception:
+            with self._drain_lock:
+                self._is_drain_scheduled = False
+            raise
+
+    def _dispatch(
+        self,
+        path: str,
+        body: ReportBody,
+        wait: bool,
+        spooled: Optional[SpoolRecord] = None,
+    ) -> None:
+        """
+        Sends a report body to the given API path, either immediately or in the background,
+        depending on the reporter's mode. If the body is a function, it is called on the thread
+        which sends it - unless the report has to be spooled first.
+
+        Paths are relative to the reporter's URL, so that spooled reports are replayed against
+        whichever URL the replaying reporter is configured with.
+        """
+        if not _HAS_FORK_HOOKS and self._pid != os.getpid():
+            self._after_fork()
+        # Reports are only dispatched once they can be published, so the spool can be replayed too.
+        if self.spool is not None and not self._is_spool_replay_started:
+            self._start_spool_replay()
+
+        if self.spool is not None and spooled is None:
+            body = build_body(body)
+            spooled = self.spool.append(path, body)
+
+        # Reports sent from the caller's thread are not retried, so that a failing server cannot
+        # slow the caller down.
+        if wait or (self.executor is None and self.batcher is None):
+            self._deliver(path, body, spooled, False)
+        elif self.batcher is not None:
+            self.batcher.add(body, spooled)
+        else:
+            self._enqueue(path, body, spooled)
+
+    def _start_spool_replay(self) -> None:
+        with self._spool_replay_lock:
+            if self._is_spool_replay_started:
+                return
+            self._is_spool_replay_started = True
+        threading.Thread(
+            target=self._replay_spool, name="humbug_spool_replay", daemon=True
+        ).start()
+
+    def _replay_spool(self) -> None:
+        """
+        Publishes the reports that previous reporters left behind in the spool.
+
+        If the reporter cannot publish them yet (because it has no token, or because the user has
+        not been asked for consent yet), they are left in the spool, and replay starts over with the
+        next report the reporter publishes. They are only discarded if consent was denied.
+        """
+        assert self.spool is not None
+        can_publish = self._can_publish()
+        if not can_publish and (self.bugout_token is None or self.consent.is_pending()):
+            with self._spool_replay_lock:
+                self._is_spool_replay_started = False
             return
+        for spooled, path, body in self.spool.claim():
+            if not can_publish:
+                self._ack(spooled)
+                continue
+            try:
+                self._dispatch(path, body, False, spooled)
+            except Exception:
+                pass
 
-        json = self._post_body(report)
-        headers = {
-            "Authorization": "Bearer {}".format(self.bugout_token),
-        }
-        url = "{}/humbug/reports".format(self.url)
+    def _can_publish(self) -> bool:
+        """
+        Checks whether reports can be published at all, so that work which is only needed to publish
+        reports can be skipped.
+        """
+        return self.bugout_token is not None and self.consent.check()
+
+    def _publish_deferred(self, build: Callable[[], Report], wait: bool) -> Report:
+        """
+        Called by report builders, instead of building a report, when the report should be
+        published but cannot be. The report is only built if it is read. It is still handed to
+        publish, which drops it without reading it.
+        """
+        report = _DeferredReport(build)
+        self.publish(report, wait=wait)
+        return report
+
+    def publish(self, report: Report, wait: bool = False) -> None:
+        if not self._can_publish():
+            return
 
         try:
-            report.tags = list(set(report.tags))
-            if wait or self.executor is None:
-                requests.post(
-                    url=url, headers=headers, json=json, timeout=self.timeout_seconds
-                )
-            else:
-                report_future = self.executor.submit(
-                    requests.post,
-                    url=url,
-                    headers=headers,
-                    json=json,
-                    timeout=self.timeout_seconds,
-                )
-                self.report_futures.append(report_future)
+            report.tags = merge_tags(report.tags)
+            self._dispatch("/humbug/reports", partial(self._post_body, report), wait)
         except Exception:
             pass
 
@@ -208,6 +929,10 @@ class HumbugReporter:
     def system_report(
         self, tags: Optional[List[str]] = None, publish: bool = True, wait: bool = False
     ) -> Report:
+        if publish and not self._can_publish():
+            return self._publish_deferred(
+                partial(self.system_report, tags, publish=False), wait
+            )
         title = "{}: System information".format(self.name)
         content = """### User timestamp
 ```
@@ -252,35 +977,32 @@ Release: `{os_release}`
         tags: Optional[List[str]] = None,
         publish: bool = True,
         wait: bool = False,
+        metrics_history_seconds: Optional[float] = None,
     ) -> Report:
-        title = "{} - {}".format(self.name, type(error).__name__)
-        error_content = """### User timestamp
-```
-{user_time}
-```
+        """
+        Creates and optionally publishes a report of an exception.
 
-### Exception summary
-```
-{error_summary}
-```
+        If the reporter's metrics sampler is running, the report includes the metrics sampled in the
+        last metrics_history_seconds seconds (by default, error_metrics_history_seconds).
 
-### Traceback
-```
-{error_traceback}
-```""".format(
-            user_time=int(time.time()),
-            error_summary=repr(error),
-            error_traceback="".join(
-                traceback.format_exception(
-                    type(error),
-                    value=error,
-                    tb=error.__traceback__,
-                )
-            ),
-        )
+        The traceback is captured by the reporter's traceback_capture, which bounds its size. The
+        content of the report is rendered when it is first needed, which for published reports is on
+        the thread that sends them.
+        """
+        if publish and not self._can_publish():
+            return self._publish_deferred(
+                partial(
+                    self.error_report,
+                    error,
+                    tags,
+                    publish=False,
+                    metrics_history_seconds=metrics_history_seconds,
+                ),
+                wait,
+            )
+        title = "{} - {}".format(self.name, type(error).__name__)
         if tags is None:
             tags = []
-
         tags.extend(["type:error", "error:{}".format(error.__class__.__name__)])
         try:
             tags.append(
@@ -290,23 +1012,107 @@ Release: `{os_release}`
             pass
         tags.extend(self.system_tags())
 
-        report = Report(title=title, content=error_content, tags=tags)
+        if metrics_history_seconds is None:
+            metrics_history_seconds = self.error_metrics_history_seconds
+        metrics_history: List[Tuple[float, Dict[str, float]]] = []
+        if self.metrics_sampler is not None and metrics_history_seconds > 0:
+            metrics_history = self.metrics_sampler.history(metrics_history_seconds)
+        # If the exception is raised again, frames are added in front of its __traceback__, so the
+        # traceback as of now is captured here.
+        render_content = partial(
+            self._render_error_content,
+            int(time.time()),
+            self.traceback_capture.capture(error),
+            metrics_history,
+        )
+
+        report = Report(title=title, content=render_content, tags=tags)
 
         if publish:
             self.publish(report, wait=wait)
 
         return report
 
+    def _render_error_content(
+        self,
+        user_time: int,
+        captured_error: CapturedError,
+        metrics_history: List[Tuple[float, Dict[str, float]]],
+    ) -> str:
+        content = """### User timestamp
+```
+{user_time}
+```
+
+### Exception summary
+```
+{error_summary}
+```
+
+### Traceback
+```
+{error_traceback}
+```""".format(
+            user_time=user_time,
+            error_summary=captured_error.summary,
+            error_traceback=self.traceback_capture.format(captured_error),
+        )
+        return content + self._metrics_history_content(metrics_history)
+
     def env_report(
         self,
         title: Optional[str] = None,
         tags: Optional[List[str]] = None,
         publish: bool = True,
         wait: bool = False,
-    ) -> Report:
+        changes_only: bool = False,
+    ) -> Optional[Report]:
         """
         Creates and optionally publishes a report containing the environment variables defined in
-        the current process.
+        the current process, filtered by the reporter's env_filter (which, by default, redacts
+        secrets).
+
+        If changes_only is True, the report only contains the variables which were set, unset or
+        changed since the last env report of this reporter which was published. If no env report was
+        published yet, it contains all the variables. If nothing changed, no report is created or
+        published, and None is returned.
+
+        The environment is only filtered and rendered again if it changed since the last env report.
+        """
+        env_hash = self._env_hash()
+        if changes_only and self._is_env_reported(env_hash):
+            return None
+        if publish and not self._can_publish():
+            return self._publish_deferred(
+                lambda: self._env_report(title, tags, changes_only, env_hash)[0], wait
+            )
+        report, env = self._env_report(title, tags, changes_only, env_hash)
+        if publish:
+            self._mark_env_reported(env)
+            self.publish(report, wait=wait)
+        return report
+
+    def _env_hash(self) -> int:
+        return hash(tuple(os.environ.items()))
+
+    def _is_env_reported(self, env_hash: int) -> bool:
+        """
+        Checks whether the environment with the given hash is the last one which was published.
+        """
+        reported = self._reported_env
+        return reported is not None and reported[0] == env_hash
+
+    def _env_report(
+        self,
+        title: Optional[str],
+        tags: Optional[List[str]],
+        changes_only: bool,
+        env_hash: int,
+    ) -> Tuple[Report, Tuple[int, Dict[str, Any]]]:
+        """
+        Creates an env report of the environment with the given hash. Also returns the (hash,
+        filtered environment variables) of the environment, to pass to _mark_env_reported if the
+        report is published.
         """
         if title is None:
             title = "Environment variables"
@@ -314,13 +1120,59 @@ Release: `{os_release}`
             tags = []
         tags.append("type:env")
 
-        env_vars = ["{}={}".format(key, value) for key, value in os.environ.items()]
-        content = "```\n{}\n```".format("\n".join(env_vars))
-
-        report = Report(title=title, content=content, tags=tags)
-        if publish:
-            self.publish(report, wait=wait)
-        return report
+        reported = self._reported_env
+        if changes_only and reported is not None:
+            tags.append("env:changes")
+            if reported[0] == env_hash:
+                env_vars = reported[1]
+                content = "No environment variables were set, unset or changed."
+            else:
+                env_vars = self._filtered_env(env_hash)
+                content = self._env_changes_content(reported[1], env_vars)
+        else:
+            env_vars = self._filtered_env(env_hash)
+            content = self._env_list_content(env_hash, env_vars)
+        return Report(title=title, content=content, tags=tags), (env_hash, env_vars)
+
+    def _mark_env_reported(self, env: Tuple[int, Dict[str, Any]]) -> None:
+        # Changes are reported relative to the last environment which was actually sent.
+        if self._can_publish():
+            self._reported_env = env
+
+    def _filtered_env(self, env_hash: int) -> Dict[str, Any]:
+        cached = self._env_content
+        if cached is not None and cached[0] == env_hash:
+            return cached[1]
+        env_vars = self.env_filter(dict(os.environ))
+        self._env_content = (env_hash, env_vars, None)
+        return env_vars
+
+    def _env_list_content(self, env_hash: int, env_vars: Dict[str, Any]) -> str:
+        cached = self._env_content
+        if cached is not None and cached[0] == env_hash and cached[2] is not None:
+            return cached[2]
+        content = "```\n{}\n```".format(
+            "\n".join("{}={}".format(key, value) for key, value in env_vars.items())
+        )
+        self._env_content = (env_hash, env_vars, content)
+        return content
+
+    def _env_changes_content(self, old: Dict[str, Any], new: Dict[str, Any]) -> str:
+        sections = []
+        set_vars = [key for key in new if key not in old or old[key] != new[key]]
+        unset_vars = [key for key in old if key not in new]
+        if set_vars:
+            sections.append(
+                "### Set\n```\n{}\n```".format(
+                    "\n".join("{}={}".format(key, new[key]) for key in set_vars)
+                )
+            )
+        if unset_vars:
+            sections.append("### Unset\n```\n{}\n```".format("\n".join(unset_vars)))
+        if not sections:
+            # Only the values of redacted variables changed.
+            return "No environment variables were set, unset or changed."
+        return "\n\n".join(sections)
 
     def packages_report(
         self,
@@ -328,10 +1180,35 @@ Release: `{os_release}`
         tags: Optional[List[str]] = None,
         publish: bool = True,
         wait: bool = False,
+        changes_only: bool = False,
     ) -> Report:
         """
         Creates and optionally publishes a report containing the packages (and versions of those
         packages) available in the current Python process.
+
+        If changes_only is True, the report only contains the packages which were installed, removed
+        or changed since the last packages report which was published (see PackageIndex for how long
+        that is remembered). If no packages report was published yet, it contains all the packages.
+        """
+        if publish and not self._can_publish():
+            return self._publish_deferred(
+                partial(
+                    self.packages_report, title, tags, False, changes_only=changes_only
+                ),
+                wait,
+            )
+        report, packages = self._packages_report(title, tags, changes_only)
+        if publish:
+            self._mark_packages_reported(packages)
+            self.publish(report, wait=wait)
+        return report
+
+    def _packages_report(
+        self, title: Optional[str], tags: Optional[List[str]], changes_only: bool
+    ) -> Tuple[Report, Optional[Packages]]:
+        """
+        Creates a packages report. Also returns the packages it was created from (None if package
+        metadata is not available), to pass to _mark_packages_reported if the report is published.
         """
         if title is None:
             title = "Available packages"
@@ -339,22 +1216,79 @@ Release: `{os_release}`
             tags = []
         tags.append("type:dependencies")
 
-        available_packages = []
+        if not self.package_index.is_available:
+            tags.append("warning:package_metadata_unavailable")
+            content = "```\nPackage versions are not available.\n```"
+            return Report(title, content, tags), None
 
-        if self.pkg_resources_exists:
-            available_packages = [
-                str(package_info) for package_info in pkg_resources.working_set  # type: ignore
-            ]
+        packages = self.package_index.packages()
+        last_reported = None
+        if changes_only:
+            last_reported = self.package_index.last_reported()
+
+        if last_reported is None:
+            content = self._packages_list_content(packages)
         else:
-            tags.append("warning:pkg_resources_import_failed")
-            available_packages.append(
-                "Failed to import pkg_resources. Package versions are not available."
+            tags.append("packages:changes")
+            content = self._packages_changes_content(last_reported, packages)
+        return Report(title, content, tags), packages
+
+    def _mark_packages_reported(self, packages: Optional[Packages]) -> None:
+        # Changes are reported relative to the last packages which were actually sent.
+        if packages is not None and self._can_publish():
+            self.package_index.mark_reported(packages)
+
+    def _packages_list_content(self, packages: Packages) -> str:
+        # The list is only rendered again if packages were installed or removed.
+        cached = self._packages_content
+        if cached is not None and cached[0] is packages:
+            return cached[1]
+        content = "```\n{}\n```".format(
+            "\n".join(
+                "{} {}".format(name, packages[name])
+                for name in sorted(packages, key=str.lower)
             )
-        content = "```\n{}\n```".format("\n".join(available_packages))
-        report = Report(title, content, tags)
-        if publish:
-            self.publish(report, wait=wait)
-        return report
+        )
+        self._packages_content = (packages, content)
+        return content
+
+    def _packages_changes_content(self, old: Packages, new: Packages) -> str:
+        changes = None
+        if new is not old:
+            changes = diff_packages(old, new)
+        if not changes:
+            return "No packages were installed, removed or changed."
+        sections = []
+        if changes.added:
+            sections.append(
+                "### Installed\n```\n{}\n```".format(
+                    "\n".join(
+                        "{} {}".format(name, version)
+                        for name, version in sorted(changes.added.items())
+                    )
+                )
+            )
+        if changes.removed:
+            sections.append(
+                "### Removed\n```\n{}\n```".format(
+                    "\n".join(
+                        "{} {}".format(name, version)
+                        for name, version in sorted(changes.removed.items())
+                    )
+                )
+            )
+        if changes.changed:
+            sections.append(
+                "### Changed\n```\n{}\n```".format(
+                    "\n".join(
+                        "{} {} -> {}".format(name, old_version, new_version)
+                        for name, (old_version, new_version) in sorted(
+                            changes.changed.items()
+                        )
+                    )
+                )
+            )
+        return "\n\n".join(sections)
 
     def compound_report(
         self,
@@ -364,6 +1298,10 @@ Release: `{os_release}`
         publish: bool = True,
         wait: bool = False,
     ) -> Report:
+        if publish and not self._can_publish():
+            return self._publish_deferred(
+                partial(self.compound_report, reports, title, tags, publish=False), wait
+            )
         if tags is None:
             tags = []
         for component in reports:
@@ -372,9 +1310,10 @@ Release: `{os_release}`
         if title is None:
             title = "Composite report"
 
-        content = "\n\n- - -\n\n".join(component.content for component in reports)
+        def render_content() -> str:
+            return "\n\n- - -\n\n".join(component.content for component in reports)
 
-        report = Report(title=title, content=content, tags=tags)
+        report = Report(title=title, content=render_content, tags=tags)
         if publish:
             self.publish(report, wait=wait)
         return report
@@ -386,8 +1325,19 @@ Release: `{os_release}`
         publish: bool = True,
         wait: bool = False,
     ) -> Report:
+        """
+        Creates and optionally publishes a report of a log record.
+
+        The message of the record is formatted right away, since its arguments could change later.
+        The rest of the content is rendered when it is first needed.
+        """
+        if publish and not self._can_publish():
+            return self._publish_deferred(
+                partial(self.logging_report, record, tags, publish=False), wait
+            )
         title = "{} - Logging error - {}".format(self.name, record.module)
-        error_content = """### User timestamp
+        render_content = partial(
+            """### User timestamp
 ```
 {user_time}
 ```
@@ -400,7 +1350,7 @@ Release: `{os_release}`
 ### Error message
 ```
 {error_message}
-```""".format(
+```""".format,
             user_time=int(time.time()),
             module_name=record.module,
             error_message=record.getMessage(),
@@ -410,7 +1360,7 @@ Release: `{os_release}`
         tags.append("type:logging")
         tags.extend(self.system_tags())
 
-        report = Report(title=title, content=error_content, tags=tags)
+        report = Report(title=title, content=render_content, tags=tags)
 
         if publish:
             self.publish(report, wait=wait)
@@ -425,22 +1375,92 @@ Release: `{os_release}`
         publish: bool = True,
         wait: bool = False,
         apply_blacklist: bool = True,
+        apply_sampling: bool = True,
     ) -> Report:
+        """
+        Creates and optionally publishes a report of a use of a feature.
+
+        If the reporter has a sampler and apply_sampling is True, the report is only published if
+        the sampler selects it, and it is tagged with its sample weight.
+
+        The content of the report is rendered when it is first needed.
+        """
+        if publish and not self._can_publish():
+            return self._publish_deferred(
+                partial(
+                    self.feature_report,
+                    feature_name,
+                    parameters,
+                    tags,
+                    publish=False,
+                    apply_blacklist=apply_blacklist,
+                    apply_sampling=apply_sampling,
+                ),
+                wait,
+            )
         title = "Feature used: {name}".format(name=feature_name)
 
+        if tags is None:
+            tags = []
+        if publish and apply_sampling and self.sampler is not None:
+            sample_weight = self._sample_weight(feature_name)
+            if sample_weight is None:
+                publish = False
+            else:
+                tags.extend(self._sample_tags(sample_weight))
+
         if apply_blacklist and self.blacklist_fn is not None:
-            parameters = self.blacklist_fn(parameters)
+            parameters = self._apply_blacklist(parameters)
+
+        # Parameter values are converted to strings right away, since they could change later.
+        parameter_values, num_omitted = self.parameter_formatter.format_parameters(
+            parameters
+        )
+        render_content = partial(
+            self._render_feature_content,
+            int(time.time()),
+            feature_name,
+            parameter_values,
+            num_omitted,
+        )
+
+        tags.append("type:feature")
+        tags.append("feature:{}".format(feature_name))
+        tags.extend(self.system_tags())
+        tags.extend(
+            ["parameter:{}={}".format(key, value) for key, value in parameter_values]
+        )
+        if num_omitted:
+            tags.append("parameters_omitted:{}".format(num_omitted))
+
+        report = Report(title=title, content=render_content, tags=tags)
+
+        if publish:
+            self.publish(report, wait=wait)
+
+        return report
 
+    def _render_feature_content(
+        self,
+        user_time: int,
+        feature_name: str,
+        parameter_values: List[Tuple[str, str]],
+        num_omitted: int,
+    ) -> str:
         parameters_content = "\n".join(
             [
                 "- `{parameter_name}` = `{parameter_value}`".format(
                     parameter_name=key, parameter_value=value
                 )
-                for key, value in parameters.items()
+                for key, value in parameter_values
             ]
         )
+        if num_omitted:
+            parameters_content += "\n\n{} more parameters were omitted.".format(
+                num_omitted
+            )
 
-        content = """### User timestamp
+        return """### User timestamp
 ```
 {user_time}
 ```
@@ -451,43 +1471,273 @@ Feature: {name}
 
 {parameters_content}
 """.format(
-            user_time=int(time.time()),
+            user_time=user_time,
             name=feature_name,
             parameters_content=parameters_content,
         )
 
+    def occurrences_report(
+        self,
+        occurrences: Occurrences,
+        tags: Optional[List[str]] = None,
+        publish: bool = True,
+        wait: bool = False,
+    ) -> Report:
+        """
+        Creates and optionally publishes a report summarizing occurrences of an error which were
+        suppressed by the reporter's deduplicator.
+        """
+        if publish and not self._can_publish():
+            return self._publish_deferred(
+                partial(self.occurrences_report, occurrences, tags, publish=False), wait
+            )
+        title = "{} ({} occurrences)".format(occurrences.title, occurrences.count)
+        content = """### User timestamp
+```
+{user_time}
+```
+
+### Occurrences
+```
+{count} occurrences between {first_seen} and {last_seen}
+```
+
+### Fingerprint
+```
+{fingerprint}
+```""".format(
+            user_time=int(time.time()),
+            count=occurrences.count,
+            first_seen=int(occurrences.first_seen),
+            last_seen=int(occurrences.last_seen),
+            fingerprint=occurrences.fingerprint,
+        )
         if tags is None:
             tags = []
-        tags.append("type:feature")
-        tags.append("feature:{}".format(feature_name))
+        tags.extend(occurrences.tags)
+        tags.append("type:occurrences")
         tags.extend(self.system_tags())
-        tags.extend(
-            ["parameter:{}={}".format(key, value) for key, value in parameters.items()]
-        )
 
         report = Report(title=title, content=content, tags=tags)
-
         if publish:
             self.publish(report, wait=wait)
+        return report
+
+    def _publish_occurrences(self, force: bool = False) -> None:
+        assert self.deduplicator is not None
+        for occurrences in self.deduplicator.collect(force=force):
+            try:
+                self.occurrences_report(occurrences)
+            except Exception:
+                pass
+
+    def _run_deduplicator(self) -> None:
+        assert self.deduplicator is not None
+        while not self._flushers_stopped.wait(self.deduplicator.window_seconds):
+            self._publish_occurrences()
+
+    def calls_report(
+        self,
+        summary: CallSummary,
+        tags: Optional[List[str]] = None,
+        publish: bool = True,
+        wait: bool = False,
+    ) -> Report:
+        """
+        Creates and optionally publishes a report summarizing the calls of a feature which were
+        aggregated by record_call(aggregate=True).
+        """
+        if publish and not self._can_publish():
+            return self._publish_deferred(
+                partial(self.calls_report, summary, tags, publish=False), wait
+            )
+        title = "Feature used: {name}".format(name=summary.feature_name)
+        bucket_bounds = DEFAULT_BUCKET_BOUNDS
+        if self.call_aggregator is not None:
+            bucket_bounds = self.call_aggregator.bucket_bounds
+        content = """### User timestamp
+```
+{user_time}
+```
+
+### Information
+
+Feature: {name}
+
+{calls} calls in {interval_seconds:.1f} seconds
+
+{table}
+""".format(
+            user_time=int(time.time()),
+            name=summary.feature_name,
+            calls=summary.calls,
+            interval_seconds=summary.interval_seconds,
+            table="\n".join(summarize(summary, bucket_bounds)),
+        )
 
+        if tags is None:
+            tags = []
+        tags.append("type:feature")
+        tags.append("type:calls")
+        tags.append("feature:{}".format(summary.feature_name))
+        tags.append("calls:{}".format(summary.calls))
+        tags.extend(self.system_tags())
+
+        report = Report(title=title, content=content, tags=tags)
+        if publish:
+            self.publish(report, wait=wait)
         return report
 
+    def _publish_call_summaries(self) -> None:
+        assert self.call_aggregator is not None
+        for summary in self.call_aggregator.collect():
+            try:
+                self.calls_report(summary)
+            except Exception:
+                pass
+
+    def _run_call_aggregator(self) -> None:
+        assert self.call_aggregator is not None
+        while not self._flushers_stopped.wait(self.call_aggregator.interval_seconds):
+            self._publish_call_summaries()
+
+    def _start_call_aggregator(self) -> CallAggregator:
+        with self._call_aggregator_lock:
+            if self.call_aggregator is None:
+                self.call_aggregator = CallAggregator()
+            if not self._is_call_aggregator_started:
+                threading.Thread(
+                    target=self._run_call_aggregator,
+                    name="humbug_call_aggregator",
+                    daemon=True,
+                ).start()
+                self._is_call_aggregator_started = True
+            return self.call_aggregator
+
+    def _should_report_error(
+        self, error: BaseException, tags: Optional[List[str]] = None
+    ) -> bool:
+        if self.deduplicator is None:
+            return True
+        # Fingerprinting is wasted work if the report could not be published anyway.
+        if not self._can_publish():
+            return False
+        error_tags = ["type:error", "error:{}".format(type(error).__name__)]
+        if tags is not None:
+            error_tags.extend(tags)
+        return self.deduplicator.allow(
+            exception_fingerprint(error),
+            "{} - {}".format(self.name, type(error).__name__),
+            error_tags,
+        )
+
+    def _should_report_log_record(
+        self, record: logging.LogRecord, tags: Optional[List[str]] = None
+    ) -> bool:
+        if self.deduplicator is None:
+            return True
+        # Fingerprinting is wasted work if the report could not be published anyway.
+        if not self._can_publish():
+            return False
+        record_tags = ["type:logging"]
+        if tags is not None:
+            record_tags.extend(tags)
+        return self.deduplicator.allow(
+            log_record_fingerprint(record),
+            "{} - Logging error - {}".format(self.name, record.module),
+            record_tags,
+        )
+
+    def _apply_blacklist(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        assert self.blacklist_fn is not None
+        if isinstance(self.blacklist_fn, ParameterFilter):
+            # Values which the filter converts to strings are truncated as they are converted.
+            return self.blacklist_fn(parameters, self.parameter_formatter.format)
+        return self.blacklist_fn(parameters)
+
+    def _sample_weight(self, feature_name: str) -> Optional[float]:
+        if self.sampler is None:
+            return 1.0
+        return self.sampler.sample(feature_name, self.session_id)
+
+    def _sample_tags(self, sample_weight: float) -> List[str]:
+        if self.sampler is None:
+            return []
+        return ["sample_weight:{:g}".format(sample_weight)]
+
     def record_call(
         self,
-        callable: Callable,
+        callable: Optional[Callable] = None,
+        aggregate: bool = False,
     ) -> Callable:
+        """
+        Decorator which reports calls of the decorated function as uses of a feature.
+
+        By default, every call (or every call selected by the reporter's sampler) is reported with a
+        feature_report. With @reporter.record_call(aggregate=True), calls are counted and timed
+        instead, and the reporter's call_aggregator publishes one calls_report per feature per
+        interval.
+        """
+        if callable is None:
+            return lambda decorated: self.record_call(decorated, aggregate=aggregate)
+        if aggregate:
+            return self._record_aggregated_calls(callable)
+
         @wraps(callable)
         def wrapped_callable(*args, **kwargs):
+            # Sampling happens first, so that calls which are not reported cost as little as
+            # possible.
+            sample_weight = self._sample_weight(callable.__name__)
+            if sample_weight is None:
+                return callable(*args, **kwargs)
+
             parameters = {**kwargs}
             for i, arg in enumerate(args):
                 parameters["arg.{}".format(i)] = arg
 
-            self.feature_report(callable.__name__, parameters)
+            self.feature_report(
+                callable.__name__,
+                parameters,
+                tags=self._sample_tags(sample_weight),
+                apply_sampling=False,
+            )
 
             return callable(*args, **kwargs)
 
         return wrapped_callable
 
+    def _record_aggregated_calls(self, callable: Callable) -> Callable:
+        aggregator = self._start_call_aggregator()
+        feature_name = callable.__name__
+
+        @wraps(callable)
+        def wrapped_callable(*args, **kwargs):
+            parameters_key = ()
+            if aggregator.group_by_parameters:
+                parameters = {**kwargs}
+                for i, arg in enumerate(args):
+                    parameters["arg.{}".format(i)] = arg
+                if self.blacklist_fn is not None:
+                    parameters = self._apply_blacklist(parameters)
+                parameter_values, _ = self.parameter_formatter.format_parameters(
+                    parameters
+                )
+                parameters_key = aggregator.parameters_key(dict(parameter_values))
+
+            error = False
+            start = time.perf_counter()
+            try:
+                return callable(*args, **kwargs)
+            except BaseException:
+                error = True
+                raise
+            finally:
+                aggregator.record(
+                    feature_name, parameters_key, time.perf_counter() - start, error
+                )
+
+        return wrapped_callable
+
     def record_errors(
         self,
         callable: Callable,
@@ -498,7 +1748,9 @@ Feature: {name}
             try:
                 result = callable(*args, **kwargs)
             except Exception as err:
-                self.error_report(err, tags=["site:{}".format(callable.__name__)])
+                site_tags = ["site:{}".format(callable.__name__)]
+                if self._should_report_error(err, site_tags):
+                    self.error_report(err, tags=site_tags)
                 raise err
             return result
 
@@ -509,19 +1761,27 @@ Feature: {name}
         level: int,
         tags: Optional[List[str]] = None,
         publish: bool = True,
-    ) -> None:
-        if not self.is_loggerhook_set:
-            old_factory = logging.getLogRecordFactory()
-
-            def record_factory(*args, **kwargs):
-                record = old_factory(*args, **kwargs)
-                if record.levelno >= level:
-                    self.logging_report(record=record, tags=tags, publish=publish)
-                return record
+        logger: Optional[logging.Logger] = None,
+    ) -> HumbugHandler:
+        """
+        Reports log records at or above the given level by adding a HumbugHandler to logger (by
+        default, the root logger). Records are reported from a background thread, so logging them
+        only costs a queue put.
 
-            logging.setLogRecordFactory(record_factory)
+        Only one handler will be added, no matter how many times you call this method. Records which
+        the logger itself filters out (for example, because they are below its level) are not
+        reported.
+        """
+        if self.logging_handler is None:
+            self.logging_handler = HumbugHandler(
+                self, level=level, tags=tags, publish=publish
+            )
+            if logger is None:
+                logger = logging.getLogger()
+            logger.addHandler(self.logging_handler)
 
             self.is_loggerhook_set = True
+        return self.logging_handler
 
     def setup_excepthook(
         self, tags: Optional[List[str]] = None, publish: bool = True
@@ -537,7 +1797,10 @@ Feature: {name}
             original_excepthook = sys.excepthook
 
             def _hook(exception_type, exception_instance, traceback):
-                self.error_report(error=exception_instance, tags=tags, publish=publish)
+                if self._should_report_error(exception_instance, tags):
+                    self.error_report(
+                        error=exception_instance, tags=tags, publish=publish
+                    )
                 original_excepthook(exception_type, exception_instance, traceback)
 
             sys.excepthook = _hook
@@ -553,12 +1816,132 @@ Feature: {name}
 
         def showtraceback(*args, **kwargs):
             _, exc_instance, _ = sys.exc_info()
-            self.error_report(exc_instance, tags=tags, publish=True)
+            if exc_instance is not None and self._should_report_error(
+                exc_instance, tags
+            ):
+                self.error_report(exc_instance, tags=tags, publish=True)
             old_showtraceback(*args, **kwargs)
 
         ipython_shell.showtraceback = showtraceback
         self.setup_excepthook(publish=True, tags=tags)
 
+    @property
+    def metrics_collector(self) -> utils.MetricsCollector:
+        """
+        Collector of the metrics in metrics reports. It is created the first time it is needed,
+        since creating it takes a baseline of the process's CPU usage. Requires psutil.
+        """
+        with self._metrics_collector_lock:
+            if self._metrics_collector is None:
+                self._metrics_collector = utils.MetricsCollector()
+            return self._metrics_collector
+
+    def start_metrics_sampler(
+        self,
+        interval_seconds: float = 5.0,
+        window_seconds: float = 300.0,
+        capacity: int = 720,
+        error_metrics_history_seconds: float = 60.0,
+        publish_summaries: bool = True,
+        metrics: Sequence[Tuple[str, str, str]] = DEFAULT_METRICS,
+    ) -> MetricsSampler:
+        """
+        Starts sampling metrics every interval_seconds in the background. Requires psutil.
+
+        If publish_summaries is True, a metrics summary report is published every window_seconds.
+        Error reports include the samples from the last error_metrics_history_seconds. See
+        metrics_sampler.DEFAULT_METRICS for the format of metrics.
+        """
+        if self.metrics_sampler is None:
+            on_summary = None
+            if publish_summaries:
+                on_summary = self.metrics_summary_report
+            self.metrics_sampler = MetricsSampler(
+                self.metrics_collector,
+                interval_seconds=interval_seconds,
+                window_seconds=window_seconds,
+                capacity=capacity,
+                metrics=metrics,
+                on_summary=on_summary,
+            )
+            self.error_metrics_history_seconds = error_metrics_history_seconds
+            self.metrics_sampler.start()
+        return self.metrics_sampler
+
+    def _metrics_history_content(
+        self, history: List[Tuple[float, Dict[str, float]]]
+    ) -> str:
+        if not history or self.metrics_sampler is None:
+            return ""
+        names = self.metrics_sampler.names
+        lines = [
+            "| Timestamp | {} |".format(" | ".join(names)),
+            "| --- |{}".format(" --- |" * len(names)),
+        ]
+        for timestamp, metrics in history:
+            lines.append(
+                "| {} | {} |".format(
+                    int(timestamp),
+                    " | ".join("{:.4g}".format(metrics[name]) for name in names),
+                )
+            )
+        return "\n\n### Metrics history\n\n{}".format("\n".join(lines))
+
+    def metrics_summary_report(
+        self,
+        summary: MetricsSummary,
+        tags: Optional[List[str]] = None,
+        publish: bool = True,
+        wait: bool = False,
+    ) -> Report:
+        """
+        Creates and optionally publishes a report summarizing the metrics sampled by the reporter's
+        metrics sampler over a window of time.
+        """
+        if publish and not self._can_publish():
+            return self._publish_deferred(
+                partial(self.metrics_summary_report, summary, tags, publish=False), wait
+            )
+        title = "Metrics summary"
+        lines = [
+            "| Metric | Min | Mean | Max | p95 |",
+            "| --- | --- | --- | --- | --- |",
+        ]
+        for name, stats in summary.stats.items():
+            lines.append(
+                "| {} | {:.4g} | {:.4g} | {:.4g} | {:.4g} |".format(
+                    name, stats["min"], stats["mean"], stats["max"], stats["p95"]
+                )
+            )
+        content = """### User timestamp
+```
+{user_time}
+```
+
+### Window
+
+{num_samples} samples from {start} to {end}
+
+{table}
+""".format(
+            user_time=int(time.time()),
+            num_samples=summary.num_samples,
+            start=int(summary.start),
+            end=int(summary.end),
+            table="\n".join(lines),
+        )
+
+        if tags is None:
+            tags = []
+        tags.append("type:metrics")
+        tags.append("type:metrics_summary")
+        tags.extend(self.system_tags())
+
+        report = Report(title=title, content=content, tags=tags)
+        if publish:
+            self.publish(report, wait=wait)
+        return report
+
     def metrics_report(
         self,
         cpu: bool = True,
@@ -572,7 +1955,31 @@ Feature: {name}
         tags: Optional[List[str]] = None,
         publish: bool = False,
         wait: bool = False,
+        compact: bool = False,
     ) -> Report:
+        """
+        Creates and optionally publishes a report of system metrics. If compact is True, the
+        metrics are encoded as JSON without indentation, which makes the report several times
+        smaller.
+        """
+        if publish and not self._can_publish():
+            return self._publish_deferred(
+                partial(
+                    self.metrics_report,
+                    cpu,
+                    gpu,
+                    memory,
+                    disk,
+                    network,
+                    open_files_flag,
+                    num_threads_flag,
+                    processes_flag,
+                    tags,
+                    publish=False,
+                    compact=compact,
+                ),
+                wait,
+            )
         title = "Metrics report"
 
         metrics: Dict[str, Any] = {}
@@ -581,36 +1988,41 @@ Feature: {name}
             metrics["gpu"] = utils.get_gpu_metrics()
 
         if self.psutil_exists:
+            collector = self.metrics_collector
             if cpu:
-                metrics["cpu"] = utils.get_cpu_metrics()
+                metrics["cpu"] = collector.cpu_metrics()
 
             if memory:
-                metrics["memory"] = utils.get_memory_metrics()
+                metrics["memory"] = collector.memory_metrics()
 
             if disk:
-                metrics["disk"] = utils.get_disk_metrics()
+                metrics["disk"] = collector.disk_metrics()
 
             if network:
-                metrics["network"] = utils.get_network_metrics()
+                metrics["network"] = collector.network_metrics()
 
             if open_files_flag:
-                metrics["open_files"] = utils.get_open_files_metrics()
+                metrics["open_files"] = collector.open_files_metrics()
 
             if num_threads_flag:
-                metrics["num_threads"] = utils.get_thread_metrics()
+                metrics["num_threads"] = collector.thread_metrics()
 
             if processes_flag:
-                metrics["processes"] = utils.get_processes_metrics()
+                metrics["processes"] = collector.processes_metrics()
 
         tags = tags if tags is not None else []
 
         tags.append("type:metrics")
         tags.extend(self.system_tags())
 
+        if compact:
+            encoded_metrics = json.dumps(metrics, separators=(",", ":"), sort_keys=True)
+        else:
+            encoded_metrics = json.dumps(metrics, indent=4, sort_keys=True)
         report = Report(
             title=title,
             tags=tags,
-            content=f"```\n{json.dumps(metrics, indent=4, sort_keys=True)}\n```",
+            content=f"```\n{encoded_metrics}\n```",
         )
 
         if publish:
@@ -637,6 +2049,9 @@ class Reporter(HumbugReporter):
         timeout_seconds: int = 10,
         mode: Modes = Modes.DEFAULT,
     ):
+        # The journal entries endpoint has no bulk counterpart, so batching is not available here.
+        if mode == Modes.BATCH:
+            mode = Modes.DEFAULT
         super().__init__(
             name,
             consent,
@@ -667,26 +2082,15 @@ class Reporter(HumbugReporter):
         if self.bugout_journal_id is None:
             return
 
-        json = {"title": report.title, "content": report.content, "tags": report.tags}
-        headers = {
-            "Authorization": "Bearer {}".format(self.bugout_token),
-        }
-        url = "{}/journals/{}/entries".format(self.url, self.bugout_journal_id)
+        path = "/journals/{}/entries".format(self.bugout_journal_id)
 
         try:
-            report.tags = list(set(report.tags))
-            if wait or self.executor is None:
-                requests.post(
-                    url=url, headers=headers, json=json, timeout=self.timeout_seconds
-                )
-            else:
-                report_future = self.executor.submit(
-                    requests.post,
-                    url=url,
-                    headers=headers,
-                    json=json,
-                    timeout=self.timeout_seconds,
-                )
-                self.report_futures.append(report_future)
+            report.tags = merge_tags(report.tags)
+            json = {
+                "title": report.title,
+                "content": report.content,
+                "tags": report.tags,
+            }
+            self._dispatch(path, json, wait)
         except Exception:
             pass
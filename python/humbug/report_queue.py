@@ -0,0 +1,146 @@
+"""
+This module implements the bounded queue in which Humbug reporters hold reports until they are
+published.
+"""
+from collections import deque
+from enum import Enum
+import random
+import threading
+import time
+from typing import Any, Callable, Deque, Optional
+
+from .stats import Counters
+
+
+class OverflowPolicy(Enum):
+    """
+    What a ReportQueue does with a new report when it is full:
+    1. DROP_NEWEST - the new report is discarded
+    2. DROP_OLDEST - the oldest report in the queue is discarded to make room for the new one
+    3. BLOCK - the caller waits (up to a timeout) for room, and the new report is discarded if none
+       frees up
+    4. SAMPLE - the new report replaces a randomly selected report in the queue, with a probability
+       chosen so that the queue holds a uniform sample of all the reports that arrived since it
+       filled up (reservoir sampling)
+    """
+
+    DROP_NEWEST = 0
+    DROP_OLDEST = 1
+    BLOCK = 2
+    SAMPLE = 3
+
+
+class ReportQueue:
+    """
+    A thread-safe FIFO queue holding at most max_size items, which applies its overflow_policy when
+    it is full. If max_size is None, the queue is unbounded.
+
+    Items discarded by the queue are counted in counters, under the names
+    "queue_dropped_newest", "queue_dropped_oldest", "queue_dropped_blocked" and
+    "queue_dropped_sampled".
+
+    A queue can share its condition with its consumer, so that the consumer can wait for items
+    while holding the same lock that guards the queue. If on_drop is given, it is called with every
+    item that the queue discards.
+    """
+
+    def __init__(
+        self,
+        max_size: Optional[int] = 10000,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_NEWEST,
+        block_timeout_seconds: float = 1.0,
+        counters: Optional[Counters] = None,
+        condition: Optional[threading.Condition] = None,
+        on_drop: Optional[Callable[[Any], None]] = None,
+    ) -> None:
+        if max_size is not None and max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.overflow_policy = overflow_policy
+        self.block_timeout_seconds = block_timeout_seconds
+        if counters is None:
+            counters = Counters()
+        self.counters = counters
+        if condition is None:
+            condition = threading.Condition()
+        self.condition = condition
+        self.on_drop = on_drop
+
+        self._items: Deque[Any] = deque()
+        # Number of items offered to the queue since it last had room - used by the SAMPLE policy.
+        self._overflow_count = 0
+
+    def __len__(self) -> int:
+        with self.condition:
+            return len(self._items)
+
+    def _is_full(self) -> bool:
+        return self.max_size is not None and len(self._items) >= self.max_size
+
+    def _drop(self, item: Any, counter: str) -> None:
+        self.counters.increment(counter)
+        if self.on_drop is not None:
+            self.on_drop(item)
+
+    def put(self, item: Any) -> bool:
+        """
+        Adds an item to the back of the queue, applying the overflow policy if the queue is full.
+
+        Returns True if the item was added to the queue and False if it was discarded.
+        """
+        with self.condition:
+            if not self._is_full():
+                self._overflow_count = 0
+                self._items.append(item)
+                self.condition.notify_all()
+                return True
+
+            if self.overflow_policy == OverflowPolicy.DROP_OLDEST:
+                self._drop(self._items.popleft(), "queue_dropped_oldest")
+                self._items.append(item)
+                self.condition.notify_all()
+                return True
+
+            if self.overflow_policy == OverflowPolicy.BLOCK:
+                deadline = time.monotonic() + self.block_timeout_seconds
+                while self._is_full():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._drop(item, "queue_dropped_blocked")
+                        return False
+                    self.condition.wait(remaining)
+                self._items.append(item)
+                self.condition.notify_all()
+                return True
+
+            if self.overflow_policy == OverflowPolicy.SAMPLE:
+                assert self.max_size is not None
+                self._overflow_count += 1
+                index = random.randrange(self.max_size + self._overflow_count)
+                if index < len(self._items):
+                    self._drop(self._items[index], "queue_dropped_sampled")
+                    self._items[index] = item
+                    return True
+                self._drop(item, "queue_dropped_sampled")
+                return False
+
+            self._drop(item, "queue_dropped_newest")
+            return False
+
+    def peek(self) -> Any:
+        """
+        Returns the item at the front of the queue without removing it. Raises IndexError if the
+        queue is empty.
+        """
+        with self.condition:
+            return self._items[0]
+
+    def get(self) -> Any:
+        """
+        Removes and returns the item at the front of the queue. Raises IndexError if the queue is
+        empty.
+        """
+        with self.condition:
+            item = self._items.popleft()
+            self.condition.notify_all()
+            return item
@@ -0,0 +1,101 @@
+"""
+This module implements the policy that Humbug reporters follow when publishing a report fails.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import random
+import threading
+from typing import Optional
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parses the value of a Retry-After header (either a number of seconds or an HTTP date) into a
+    number of seconds from now. Returns None if the value is missing or cannot be parsed.
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except Exception:
+        return None
+    if retry_at is None:
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Describes how many times and how quickly a failed report is retried.
+
+    The n-th retry happens after a delay drawn uniformly from
+    [(1 - jitter) * backoff, backoff], where backoff = initial_backoff_seconds * multiplier^(n-1),
+    capped at max_backoff_seconds. If the server sent a Retry-After header, the reporter waits that
+    long instead - unless it is longer than max_backoff_seconds, in which case the report is not
+    retried.
+
+    Retries are also limited by a budget shared by all reports: every report adds budget_ratio to
+    the budget (which holds at most budget_max_tokens) and every retry takes 1 from it. This keeps a
+    struggling server from receiving more than about (1 + budget_ratio) times the normal number of
+    requests.
+    """
+
+    max_attempts: int = 4
+    initial_backoff_seconds: float = 0.5
+    max_backoff_seconds: float = 30.0
+    multiplier: float = 2.0
+    jitter: float = 1.0
+    budget_ratio: float = 0.2
+    budget_max_tokens: float = 10.0
+
+    def is_retryable(self, status_code: int) -> bool:
+        return status_code == 429 or status_code >= 500
+
+    def backoff_seconds(
+        self, retry: int, retry_after_seconds: Optional[float] = None
+    ) -> Optional[float]:
+        """
+        Returns how long to wait before the given retry (starting from 1), or None if the report
+        should not be retried.
+        """
+        if retry_after_seconds is not None:
+            if retry_after_seconds > self.max_backoff_seconds:
+                return None
+            return retry_after_seconds
+        backoff = min(
+            self.max_backoff_seconds,
+            self.initial_backoff_seconds * self.multiplier ** (retry - 1),
+        )
+        return backoff * (1 - self.jitter * random.random())
+
+
+class RetryBudget:
+    """
+    Thread-safe token bucket which limits the number of retries relative to the number of reports.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float) -> None:
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
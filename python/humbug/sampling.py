@@ -0,0 +1,71 @@
+"""
+This module implements sampling of feature reports, for features which are used too often to
+report every use.
+"""
+import hashlib
+import random
+from typing import Dict, Optional, Tuple
+
+
+def session_position(session_id: str) -> float:
+    """
+    Maps a session ID to a number in [0, 1), uniformly and deterministically.
+    """
+    digest = hashlib.sha1(session_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64
+
+
+class Sampler:
+    """
+    Decides which uses of a feature are reported.
+
+    Each use of a feature is reported with probability feature_rates[feature_name], or rate if the
+    feature has no rate of its own.
+
+    If by_session is True, the decision is made once per session instead of once per use: a session
+    reports either every use of a feature or none of them. Sessions are chosen consistently across
+    features and reporters, so a session which reports a feature with rate 0.1 also reports every
+    feature with a higher rate.
+    """
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        feature_rates: Optional[Dict[str, float]] = None,
+        by_session: bool = False,
+    ) -> None:
+        self.rate = rate
+        self.feature_rates: Dict[str, float] = {}
+        if feature_rates is not None:
+            self.feature_rates = feature_rates
+        self.by_session = by_session
+        self._session_position: Optional[Tuple[str, float]] = None
+
+    def rate_for(self, feature_name: str) -> float:
+        return self.feature_rates.get(feature_name, self.rate)
+
+    def _position(self, session_id: str) -> float:
+        cached = self._session_position
+        if cached is not None and cached[0] == session_id:
+            return cached[1]
+        position = session_position(session_id)
+        self._session_position = (session_id, position)
+        return position
+
+    def sample(self, feature_name: str, session_id: str) -> Optional[float]:
+        """
+        Returns None if this use of the feature should not be reported. Otherwise, returns its
+        sample weight: the number of uses that the report stands for.
+        """
+        rate = self.rate_for(feature_name)
+        if rate >= 1:
+            return 1.0
+        if rate <= 0:
+            return None
+        if self.by_session:
+            position = self._position(session_id)
+        else:
+            position = random.random()
+        if position >= rate:
+            return None
+        return 1 / rate
@@ -0,0 +1,399 @@
+"""
+This module implements a durable on-disk spool for Humbug reports. Reporters which use a spool write
+every report to it before sending it, and remove it from the spool once it has been delivered.
+Reports which were not delivered (because the network was down, or because the process died before
+they were sent) are replayed by the next reporter which uses the same spool directory.
+"""
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, IO, List, Optional, Tuple
+
+from .stats import Counters
+
+SEGMENT_SUFFIX = ".spool"
+
+
+def _pid_is_alive(pid: int) -> bool:
+    if os.name != "posix":
+        # There is no cheap liveness check here. Segments which are still being written to by a live
+        # process cannot be renamed on Windows, so ReportSpool.claim skips them anyway.
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class SpoolSegment:
+    """
+    A single append-only spool file. Its name starts with the PID of the process which owns it.
+
+    pending is the number of reports in the segment which have not been delivered yet. Once it drops
+    to 0, the segment is deleted (or emptied, if reports are still being appended to it). Until
+    then, every report which is acked is recorded in the segment, so that it is not replayed.
+    """
+
+    def __init__(self, path: str, size: int = 0, pending: int = 0) -> None:
+        self.path = path
+        self.size = size
+        self.pending = pending
+        self.is_removed = False
+        # Acks of claimed segments are appended to them through this file.
+        self.ack_file: Optional[IO[bytes]] = None
+
+
+class SpoolRecord:
+    """
+    A report in the spool: the segment it was written to, and the offset in the segment file at
+    which it starts.
+    """
+
+    def __init__(self, segment: SpoolSegment, offset: int) -> None:
+        self.segment = segment
+        self.offset = offset
+
+
+class ReportSpool:
+    """
+    Append-only log of reports which have not been delivered yet, stored as segment files in
+    directory.
+
+    Reports are appended to the active segment, which is rotated once it grows past
+    max_segment_bytes. Every append is handed to the operating system immediately, but fsync is
+    batched - it happens after fsync_every appends or fsync_interval_seconds, whichever comes first,
+    on a background thread, so that appending never waits for the disk.
+
+    Delivered reports are acked by appending an ack line (with the offset of the report) to their
+    segment, and reports which were acked are not replayed.
+
+    Segments older than max_age_seconds are discarded, as are the oldest segments whenever the spool
+    grows past max_bytes. The number of discarded reports is counted in counters under the name
+    "spool_dropped".
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_segment_bytes: int = 1024 * 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_age_seconds: float = 7 * 24 * 60 * 60,
+        fsync_every: int = 100,
+        fsync_interval_seconds: float = 1.0,
+        counters: Optional[Counters] = None,
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.fsync_every = fsync_every
+        self.fsync_interval_seconds = fsync_interval_seconds
+        if counters is None:
+            counters = Counters()
+        self.counters = counters
+
+        self._lock = threading.Lock()
+        # Segments owned by this spool, oldest first.
+        self._segments: List[SpoolSegment] = []
+        self._active: Optional[SpoolSegment] = None
+        self._active_file: Optional[IO[bytes]] = None
+        self._sequence = 0
+        self._unsynced = 0
+        # Duplicates of the file descriptors of rotated segments which have not been synced yet.
+        self._unsynced_fds: List[int] = []
+        self._has_unsynced = threading.Event()
+        self._sync_requested = threading.Event()
+        self._is_syncer_started = False
+
+    def _segment_path(self, segment_id: str) -> str:
+        return os.path.join(
+            self.directory, "{}-{}{}".format(os.getpid(), segment_id, SEGMENT_SUFFIX)
+        )
+
+    def _open_segment(self) -> None:
+        self._sequence += 1
+        segment_id = "{:013d}-{:06d}".format(int(time.time() * 1000), self._sequence)
+        segment = SpoolSegment(self._segment_path(segment_id))
+        self._active_file = open(segment.path, "ab")
+        self._active = segment
+        self._segments.append(segment)
+
+    def _close_active(self) -> None:
+        if self._active_file is not None:
+            if self._unsynced:
+                # The segment is synced by whoever syncs next, through a duplicate of its file
+                # descriptor.
+                self._unsynced_fds.append(os.dup(self._active_file.fileno()))
+            self._active_file.close()
+        self._active_file = None
+        self._active = None
+        self._unsynced = 0
+
+    def _take_unsynced(self) -> List[int]:
+        """
+        Returns duplicates of the file descriptors of every segment which has not been synced, which
+        the caller should fsync and close. Must be called with the lock held.
+        """
+        fds = self._unsynced_fds
+        self._unsynced_fds = []
+        if self._active_file is not None and self._unsynced:
+            fds.append(os.dup(self._active_file.fileno()))
+        self._unsynced = 0
+        self._has_unsynced.clear()
+        self._sync_requested.clear()
+        return fds
+
+    def _fsync(self, fds: List[int]) -> None:
+        for fd in fds:
+            try:
+                os.fsync(fd)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+
+    def _request_sync(self, now: bool) -> None:
+        """
+        Makes sure that the syncer syncs the spool, right away if now is True and otherwise within
+        fsync_interval_seconds. Must be called with the lock held.
+        """
+        if not self._is_syncer_started:
+            self._is_syncer_started = True
+            threading.Thread(
+                target=self._run_syncer, name="humbug_spool_sync", daemon=True
+            ).start()
+        self._has_unsynced.set()
+        if now:
+            self._sync_requested.set()
+
+    def _run_syncer(self) -> None:
+        while True:
+            self._has_unsynced.wait()
+            self._sync_requested.wait(self.fsync_interval_seconds)
+            with self._lock:
+                fds = self._take_unsynced()
+            self._fsync(fds)
+
+    def _remove(self, segment: SpoolSegment) -> None:
+        if segment is self._active:
+            assert self._active_file is not None
+            self._active_file.close()
+            self._active_file = None
+            self._active = None
+            self._unsynced = 0
+        if segment.ack_file is not None:
+            segment.ack_file.close()
+            segment.ack_file = None
+        segment.is_removed = True
+        self._segments.remove(segment)
+        try:
+            os.remove(segment.path)
+        except OSError:
+            pass
+
+    def _drop(self, segment: SpoolSegment) -> None:
+        self.counters.increment("spool_dropped", segment.pending)
+        self._remove(segment)
+
+    def _enforce_limits(self) -> None:
+        expiry = time.time() - self.max_age_seconds
+        for segment in list(self._segments):
+            try:
+                if os.path.getmtime(segment.path) < expiry:
+                    self._drop(segment)
+            except OSError:
+                pass
+
+        total_bytes = sum(segment.size for segment in self._segments)
+        while total_bytes > self.max_bytes and self._segments:
+            oldest = self._segments[0]
+            total_bytes -= oldest.size
+            self._drop(oldest)
+
+    def append(self, path: str, body: Dict[str, Any]) -> SpoolRecord:
+        """
+        Writes a report to the spool. Returns the record of the report, which should be passed to
+        ack once the report has been delivered.
+        """
+        line = (json.dumps({"path": path, "body": body}) + "\n").encode("utf-8")
+        with self._lock:
+            if (
+                self._active is not None
+                and self._active.size + len(line) > self.max_segment_bytes
+            ):
+                self._close_active()
+                self._enforce_limits()
+            if self._active is None:
+                self._open_segment()
+            assert self._active is not None and self._active_file is not None
+
+            record = SpoolRecord(self._active, self._active.size)
+            self._active_file.write(line)
+            self._active_file.flush()
+            self._active.size += len(line)
+            self._active.pending += 1
+
+            self._unsynced += 1
+            self._request_sync(self._unsynced >= self.fsync_every)
+
+            return record
+
+    def ack(self, record: SpoolRecord) -> None:
+        """
+        Marks a report as delivered (or as no longer worth delivering).
+        """
+        with self._lock:
+            segment = record.segment
+            if segment.is_removed:
+                return
+            segment.pending -= 1
+            if segment.pending > 0:
+                line = (json.dumps({"ack": record.offset}) + "\n").encode("utf-8")
+                try:
+                    if segment is self._active and self._active_file is not None:
+                        ack_file = self._active_file
+                    else:
+                        if segment.ack_file is None:
+                            segment.ack_file = open(segment.path, "ab")
+                        ack_file = segment.ack_file
+                    ack_file.write(line)
+                    ack_file.flush()
+                    segment.size += len(line)
+                except OSError:
+                    # At worst, the report is delivered again.
+                    pass
+                return
+            if segment is self._active and self._active_file is not None:
+                # Reuse the active segment instead of replacing it with a new file.
+                self._active_file.truncate(0)
+                segment.size = 0
+                self._unsynced = 0
+            else:
+                self._remove(segment)
+
+    def claim(self) -> List[Tuple[SpoolRecord, str, Dict[str, Any]]]:
+        """
+        Takes ownership of the segments left behind by processes which are no longer running, and
+        returns the reports in them which were not acked as (record, path, body) tuples. Each of
+        these reports should be acked once it has been dealt with.
+        """
+        records: List[Tuple[SpoolRecord, str, Dict[str, Any]]] = []
+        try:
+            filenames = os.listdir(self.directory)
+        except OSError:
+            return records
+
+        segment_names = []
+        for filename in filenames:
+            if not filename.endswith(SEGMENT_SUFFIX):
+                continue
+            raw_owner_pid, _, segment_id = filename[: -len(SEGMENT_SUFFIX)].partition(
+                "-"
+            )
+            try:
+                owner_pid = int(raw_owner_pid)
+            except ValueError:
+                continue
+            if owner_pid == os.getpid() or _pid_is_alive(owner_pid):
+                continue
+            segment_names.append((segment_id, filename))
+
+        with self._lock:
+            # Claimed segments are older than any segment this spool has created.
+            insert_at = 0
+            for segment_id, filename in sorted(segment_names):
+                path = self._segment_path(segment_id)
+                try:
+                    os.rename(os.path.join(self.directory, filename), path)
+                    with open(path, "rb") as ifp:
+                        lines = ifp.read().splitlines()
+                except OSError:
+                    continue
+
+                segment = SpoolSegment(path, size=sum(len(line) + 1 for line in lines))
+                self._segments.insert(insert_at, segment)
+                insert_at += 1
+                acked = set()
+                reports = []
+                offset = 0
+                for line in lines:
+                    try:
+                        record = json.loads(line.decode("utf-8"))
+                        if "ack" in record:
+                            acked.add(record["ack"])
+                        else:
+                            reports.append((offset, record["path"], record["body"]))
+                    except Exception:
+                        # The last line of a segment may have been cut short by a crash.
+                        pass
+                    offset += len(line) + 1
+                for offset, report_path, body in reports:
+                    if offset not in acked:
+                        records.append(
+                            (SpoolRecord(segment, offset), report_path, body)
+                        )
+                        segment.pending += 1
+                if segment.pending == 0:
+                    self._remove(segment)
+
+            self._enforce_limits()
+
+        return [record for record in records if not record[0].segment.is_removed]
+
+    def sync(self) -> None:
+        """
+        Makes sure that every report which has been appended to the spool is on disk.
+        """
+        with self._lock:
+            if self._active_file is not None:
+                self._active_file.flush()
+            fds = self._take_unsynced()
+        self._fsync(fds)
+
+    def after_fork(self) -> None:
+        """
+        Called in a child process after a fork. The segments written so far belong to the parent
+        process, which delivers their reports, so the child writes its reports to new segments.
+        """
+        self._lock = threading.Lock()
+        # The parent process syncs its own segments.
+        files = [self._active_file] + [segment.ack_file for segment in self._segments]
+        for fd in self._unsynced_fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._segments = []
+        self._active = None
+        self._active_file = None
+        self._unsynced = 0
+        self._unsynced_fds = []
+        self._has_unsynced = threading.Event()
+        self._sync_requested = threading.Event()
+        self._is_syncer_started = False
+        for file in files:
+            if file is None:
+                continue
+            # Reports and acks are flushed as soon as they are written, so this does not write
+            # anything.
+            try:
+                file.close()
+            except Exception:
+                pass
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_active()
+            for segment in self._segments:
+                if segment.ack_file is not None:
+                    segment.ack_file.close()
+                    segment.ack_file = None
+            fds = self._take_unsynced()
+        self._fsync(fds)
@@ -0,0 +1,32 @@
+"""
+This module implements the counters that Humbug reporters use to keep track of what happened to the
+reports they were asked to publish.
+"""
+from collections import Counter
+import threading
+from typing import Dict
+
+
+class Counters:
+    """
+    A thread-safe collection of named counters.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts: Counter = Counter()
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counts[name] += amount
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._counts[name]
+
+    def snapshot(self) -> Dict[str, int]:
+        """
+        Returns the current values of all counters which have been incremented at least once.
+        """
+        with self._lock:
+            return dict(self._counts)
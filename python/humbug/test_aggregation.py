@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+import unittest
+
+from . import consent, report
+from .aggregation import CallAggregator, CallStats, OVERFLOW_KEY
+
+
+class TestCallAggregator(unittest.TestCase):
+    def test_record_and_collect(self):
+        aggregator = CallAggregator()
+        key = aggregator.parameters_key({"b": 2, "a": 1})
+        self.assertEqual(key, (("a", "1"), ("b", "2")))
+        for duration in [0.0002, 0.002, 0.02]:
+            aggregator.record("feature", key, duration)
+        aggregator.record("feature", key, 0.2, error=True)
+
+        summaries = aggregator.collect()
+        self.assertEqual(len(summaries), 1)
+        stats = summaries[0].stats[key]
+        self.assertEqual(stats.calls, 4)
+        self.assertEqual(stats.errors, 1)
+        self.assertAlmostEqual(stats.total_seconds, 0.2222)
+        self.assertEqual(stats.max_seconds, 0.2)
+        self.assertEqual(sum(stats.histogram), 4)
+
+        self.assertListEqual(aggregator.collect(), [])
+
+    def test_max_keys_per_feature(self):
+        aggregator = CallAggregator(max_keys_per_feature=2)
+        for i in range(5):
+            aggregator.record("feature", aggregator.parameters_key({"i": i}), 0.001)
+        stats = aggregator.collect()[0].stats
+        self.assertEqual(len(stats), 3)
+        self.assertEqual(stats[OVERFLOW_KEY].calls, 3)
+
+    def test_threads(self):
+        aggregator = CallAggregator(group_by_parameters=False)
+
+        def record(_):
+            for _ in range(1000):
+                aggregator.record("feature", aggregator.parameters_key({}), 0.001)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(record, range(8)))
+        summaries = aggregator.collect()
+        self.assertEqual(summaries[0].calls, 8000)
+        self.assertListEqual(list(summaries[0].stats), [()])
+
+    def test_quantile(self):
+        bounds = (0.1, 1.0)
+        stats = CallStats(calls=10, max_seconds=5.0, histogram=[5, 4, 1])
+        self.assertEqual(stats.quantile(0.5, bounds), 0.1)
+        self.assertEqual(stats.quantile(0.9, bounds), 1.0)
+        self.assertEqual(stats.quantile(0.99, bounds), 5.0)
+
+
+class TestReporterAggregatedCalls(unittest.TestCase):
+    def setUp(self):
+        self.reporter = report.HumbugReporter(
+            "TestReporterAggregatedCalls",
+            consent.HumbugConsent(True),
+            bugout_token="humbug-unit-test-token",
+            mode=report.Modes.SYNCHRONOUS,
+            call_aggregator=CallAggregator(interval_seconds=3600),
+        )
+        self.published = []
+        self.reporter.publish = lambda report, wait=False: self.published.append(report)
+
+    def test_one_report_per_feature(self):
+        @self.reporter.record_call(aggregate=True)
+        def add(a, b):
+            return a + b
+
+        @self.reporter.record_call(aggregate=True)
+        def fail():
+            raise ValueError()
+
+        for i in range(100):
+            self.assertEqual(add(i % 2, 1), i % 2 + 1)
+        with self.assertRaises(ValueError):
+            fail()
+        self.assertListEqual(self.published, [])
+
+        self.reporter.wait()
+        self.assertEqual(len(self.published), 2)
+        reports = {
+            published_report.title: published_report
+            for published_report in self.published
+        }
+        add_report = reports["Feature used: add"]
+        self.assertIn("calls:100", add_report.tags)
+        self.assertIn("feature:add", add_report.tags)
+        self.assertIn("`arg.0` = `0`, `arg.1` = `1`", add_report.content)
+        self.assertIn("calls:1", reports["Feature used: fail"].tags)
+
+    def test_plain_record_call_still_reports_every_call(self):
+        @self.reporter.record_call
+        def add(a, b):
+            return a + b
+
+        add(1, 2)
+        add(3, 4)
+        self.assertEqual(len(self.published), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
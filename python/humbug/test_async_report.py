@@ -0,0 +1,215 @@
+import asyncio
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from benchmarks.stub_server import StubHumbugServer
+
+from . import consent
+from .async_report import AsyncHumbugReporter
+from .dedup import ErrorDeduplicator
+from .retry import RetryPolicy
+from .sampling import Sampler
+from .transport import HumbugTransport
+
+
+class SlowTransport(HumbugTransport):
+    def __init__(self, delay_seconds):
+        super().__init__()
+        self.delay_seconds = delay_seconds
+
+    def post(self, *args, **kwargs):
+        time.sleep(self.delay_seconds)
+        return super().post(*args, **kwargs)
+
+
+class TestAsyncHumbugReporter(unittest.TestCase):
+    def setUp(self):
+        self.server = StubHumbugServer().start()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.server.stop()
+
+    def make_reporter(self, **kwargs):
+        return AsyncHumbugReporter(
+            name="TestAsyncHumbugReporter",
+            consent=consent.HumbugConsent(True),
+            bugout_token="humbug-unit-test-token",
+            url=self.server.url,
+            tags=["humbug-unit-test"],
+            **kwargs
+        )
+
+    def test_reports_match_sync_reporter(self):
+        reporter = self.make_reporter()
+        error = Exception("This exception is for use in a Humbug Python test")
+
+        async def run():
+            return await reporter.error_report(error, publish=False)
+
+        report = self.loop.run_until_complete(run())
+        sync_report = reporter.reporter.error_report(error, publish=False)
+        self.assertEqual(report.title, sync_report.title)
+        self.assertSetEqual(set(report.tags), set(sync_report.tags))
+
+    def test_env_report_changes_since_last_published(self):
+        reporter = self.make_reporter()
+
+        async def run():
+            await reporter.env_report(publish=False)
+            first_report = await reporter.env_report(changes_only=True, wait=True)
+            unchanged_report = await reporter.env_report(changes_only=True)
+            os.environ["HUMBUG_TEST_ASYNC_ENV"] = "1"
+            second_report = await reporter.env_report(changes_only=True, publish=False)
+            await reporter.aclose()
+            return first_report, unchanged_report, second_report
+
+        with patch.dict(os.environ):
+            reports = self.loop.run_until_complete(run())
+        first_report, unchanged_report, second_report = reports
+        self.assertNotIn("env:changes", first_report.tags)
+        self.assertIsNone(unchanged_report)
+        self.assertIn("env:changes", second_report.tags)
+        self.assertIn("HUMBUG_TEST_ASYNC_ENV=1", second_report.content)
+        self.assertEqual(self.server.num_reports, 1)
+
+    def test_publish_does_not_block_event_loop(self):
+        reporter = self.make_reporter(transport=SlowTransport(0.2))
+
+        async def run():
+            start = time.monotonic()
+            for i in range(5):
+                await reporter.feature_report("async_feature", {"index": i})
+            elapsed = time.monotonic() - start
+            await reporter.aclose()
+            return elapsed
+
+        elapsed = self.loop.run_until_complete(run())
+        self.assertLess(elapsed, 0.2)
+        self.assertEqual(self.server.num_reports, 5)
+        for request in self.server.requests:
+            self.assertIn("humbug-unit-test", request["body"]["tags"])
+
+    def test_concurrency_limit(self):
+        max_concurrency = 2
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        class CountingTransport(HumbugTransport):
+            def post(self, *args, **kwargs):
+                with lock:
+                    in_flight.append(1)
+                    peak.append(len(in_flight))
+                time.sleep(0.02)
+                with lock:
+                    in_flight.pop()
+                return super().post(*args, **kwargs)
+
+        reporter = self.make_reporter(
+            transport=CountingTransport(), max_concurrency=max_concurrency
+        )
+
+        async def run():
+            for _ in range(10):
+                await reporter.custom_report("title", "content")
+            await reporter.aclose()
+
+        self.loop.run_until_complete(run())
+        self.assertEqual(self.server.num_reports, 10)
+        self.assertLessEqual(max(peak), max_concurrency)
+
+    def test_wait_publishes_before_returning(self):
+        reporter = self.make_reporter()
+
+        async def run():
+            await reporter.custom_report("title", "content", wait=True)
+            return self.server.num_reports
+
+        self.assertEqual(self.loop.run_until_complete(run()), 1)
+
+    def test_failed_reports_are_retried_and_counted(self):
+        self.server.error_rate = 1.0
+        reporter = self.make_reporter(
+            retry_policy=RetryPolicy(max_attempts=3, initial_backoff_seconds=0.0)
+        )
+
+        async def run():
+            await reporter.custom_report("title", "content", wait=True)
+
+        self.loop.run_until_complete(run())
+        self.assertEqual(self.server.num_requests, 3)
+        self.assertEqual(reporter.reporter.counters.get("retried"), 2)
+        self.assertEqual(reporter.reporter.counters.get("dropped"), 1)
+        self.assertEqual(reporter.reporter.counters.get("sent"), 0)
+
+        self.server.error_rate = 0.0
+        self.loop.run_until_complete(run())
+        self.assertEqual(reporter.reporter.counters.get("sent"), 1)
+
+    def test_feature_reports_are_sampled(self):
+        reporter = self.make_reporter(
+            sampler=Sampler(rate=1.0, feature_rates={"unsampled": 0.0})
+        )
+
+        async def run():
+            await reporter.feature_report("unsampled", {}, wait=True)
+            return await reporter.feature_report("sampled", {}, wait=True)
+
+        report = self.loop.run_until_complete(run())
+        self.assertIn("sample_weight:1", report.tags)
+        self.assertEqual(self.server.num_reports, 1)
+        self.assertEqual(
+            self.server.requests[0]["body"]["title"], "Feature used: sampled"
+        )
+
+    def test_errors_are_deduplicated(self):
+        reporter = self.make_reporter(deduplicator=ErrorDeduplicator(burst=1))
+        error = Exception("This exception is for use in a Humbug Python test")
+
+        async def run():
+            for _ in range(3):
+                await reporter.error_report(error, wait=True)
+
+        self.loop.run_until_complete(run())
+        self.assertEqual(self.server.num_reports, 1)
+
+    def test_aclose_cancels_pending_reports(self):
+        reporter = self.make_reporter(transport=SlowTransport(0.2), max_concurrency=1)
+
+        async def run():
+            for _ in range(3):
+                await reporter.custom_report("title", "content")
+            await asyncio.sleep(0.05)
+            await reporter.aclose(timeout=0.0)
+            return len(reporter._tasks)
+
+        self.assertEqual(self.loop.run_until_complete(run()), 0)
+        # The report which was already being sent is counted once it is sent.
+        self.assertEqual(reporter.reporter.counters.get("dropped"), 2)
+        time.sleep(0.3)
+        self.assertEqual(self.server.num_reports, 1)
+        self.assertEqual(reporter.reporter.counters.get("sent"), 1)
+
+    def test_no_consent(self):
+        reporter = AsyncHumbugReporter(
+            name="TestAsyncHumbugReporter",
+            consent=consent.HumbugConsent(False),
+            bugout_token="humbug-unit-test-token",
+            url=self.server.url,
+        )
+
+        async def run():
+            await reporter.custom_report("title", "content")
+            await reporter.aclose()
+
+        self.loop.run_until_complete(run())
+        self.assertEqual(self.server.num_reports, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
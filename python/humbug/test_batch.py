@@ -0,0 +1,131 @@
+import json
+import threading
+import time
+from typing import List
+import unittest
+
+from benchmarks.stub_server import StubHumbugServer
+
+from . import consent, report
+from .batch import ReportBatcher
+
+
+class TestReportBatcher(unittest.TestCase):
+    def setUp(self):
+        self.payloads: List[bytes] = []
+        self.lock = threading.Lock()
+
+    def send_batch(self, payload: bytes, num_reports: int) -> None:
+        with self.lock:
+            self.payloads.append(payload)
+
+    def decoded_payloads(self):
+        with self.lock:
+            return [json.loads(payload.decode("utf-8")) for payload in self.payloads]
+
+    def test_batches_respect_max_batch_size(self):
+        batcher = ReportBatcher(self.send_batch, max_batch_size=10, linger_seconds=60)
+        for i in range(25):
+            batcher.add({"title": str(i)})
+        self.assertTrue(batcher.flush(timeout=5))
+        batcher.close()
+
+        batches = self.decoded_payloads()
+        self.assertEqual([len(batch) for batch in batches], [10, 10, 5])
+        self.assertListEqual(
+            [body["title"] for batch in batches for body in batch],
+            [str(i) for i in range(25)],
+        )
+
+    def test_batches_respect_max_batch_bytes(self):
+        body = {"title": "x" * 100}
+        body_size = len(json.dumps(body).encode("utf-8"))
+        batcher = ReportBatcher(
+            self.send_batch,
+            max_batch_size=100,
+            max_batch_bytes=2 + 3 * body_size + 2,
+            linger_seconds=60,
+        )
+        for _ in range(7):
+            batcher.add(body)
+        self.assertTrue(batcher.flush(timeout=5))
+        batcher.close()
+
+        batches = self.decoded_payloads()
+        self.assertEqual([len(batch) for batch in batches], [3, 3, 1])
+        for payload in self.payloads:
+            self.assertLessEqual(len(payload), batcher.max_batch_bytes)
+
+    def test_linger_sends_partial_batch_without_flush(self):
+        batcher = ReportBatcher(
+            self.send_batch, max_batch_size=100, linger_seconds=0.05
+        )
+        batcher.add({"title": "lonely"})
+        deadline = time.monotonic() + 5
+        while not self.decoded_payloads() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        batcher.close()
+        self.assertEqual(self.decoded_payloads(), [[{"title": "lonely"}]])
+
+    def test_send_failures_do_not_stop_batcher(self):
+        calls = []
+
+        def failing_send_batch(payload: bytes, num_reports: int) -> None:
+            calls.append(payload)
+            raise Exception("Connection refused")
+
+        batcher = ReportBatcher(failing_send_batch, max_batch_size=1, linger_seconds=60)
+        batcher.add({"title": "a"})
+        batcher.add({"title": "b"})
+        self.assertTrue(batcher.flush(timeout=5))
+        batcher.close()
+        self.assertEqual(len(calls), 2)
+
+
+class TestBatchMode(unittest.TestCase):
+    def setUp(self):
+        self.server = StubHumbugServer().start()
+        self.reporter = report.HumbugReporter(
+            name="TestBatchMode",
+            consent=consent.HumbugConsent(True),
+            bugout_token="humbug-unit-test-token",
+            url=self.server.url,
+            mode=report.Modes.BATCH,
+            batch_max_size=100,
+            batch_linger_seconds=60,
+        )
+
+    def tearDown(self):
+        self.reporter.batcher.close()
+        self.server.stop()
+
+    def test_requests_per_report_far_below_one(self):
+        num_reports = 1000
+        for i in range(num_reports):
+            self.reporter.feature_report("batched_feature", {"index": i})
+        self.reporter.wait()
+
+        self.assertEqual(self.server.num_reports, num_reports)
+        requests_per_report = self.server.num_requests / num_reports
+        self.assertLessEqual(requests_per_report, 0.02)
+        for request in self.server.requests:
+            self.assertEqual(request["path"], "/humbug/reports/bulk")
+
+    def test_bulk_reports_include_reporter_tags(self):
+        self.reporter.tags = ["humbug-unit-test"]
+        self.reporter.custom_report("title", "content", tags=["a"])
+        self.reporter.wait()
+
+        self.assertEqual(self.server.num_reports, 1)
+        self.assertSetEqual(
+            set(self.server.reports[0]["tags"]), {"a", "humbug-unit-test"}
+        )
+
+    def test_wait_publishes_synchronously(self):
+        self.reporter.custom_report("title", "content", wait=True)
+        self.assertEqual(self.server.num_requests, 1)
+        self.assertEqual(self.server.requests[0]["path"], "/humbug/reports")
+
+
+if __name__ == "__main__":
+    unittest.main()
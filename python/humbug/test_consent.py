@@ -1,4 +1,7 @@
+import math
 import os
+import tempfile
+import threading
 import unittest
 from unittest import mock
 
@@ -161,6 +164,121 @@ class TestHumbugConsent(unittest.TestCase):
         self.assertEqual(user_input.call_count, retries + 1)
         self.assertEqual(consent_print.call_count, 3 * retries)
 
+    @mock.patch.object(consent, "input")
+    def test_prompt_user_answer_file(self, user_input):
+        with tempfile.TemporaryDirectory() as tempdir:
+            answer_file = os.path.join(tempdir, "consent")
+            user_input.return_value = "yes"
+            self.assertTrue(
+                consent.HumbugConsent(
+                    consent.prompt_user(
+                        "Accept?", ["yes"], ["no"], answer_file=answer_file
+                    )
+                ).check()
+            )
+            consent_checker = consent.HumbugConsent(
+                consent.prompt_user("Accept?", ["yes"], ["no"], answer_file=answer_file)
+            )
+            self.assertTrue(consent_checker.check())
+            self.assertEqual(user_input.call_count, 1)
+
+            consent_checker.invalidate(forget_answers=True)
+            self.assertFalse(os.path.exists(answer_file))
+            user_input.return_value = "no"
+            self.assertFalse(consent_checker.check())
+            self.assertEqual(user_input.call_count, 2)
+
+    @mock.patch.object(consent, "input")
+    def test_prompt_user_not_on_main_thread(self, user_input):
+        user_input.return_value = "yes"
+        consent_checker = consent.HumbugConsent(
+            consent.prompt_user("Accept?", ["yes"], ["no"])
+        )
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(consent_checker.check())
+        )
+        thread.start()
+        thread.join()
+        self.assertListEqual(results, [False])
+        self.assertTrue(consent_checker.is_pending())
+        user_input.assert_not_called()
+
+        self.assertTrue(consent_checker.check())
+        self.assertFalse(consent_checker.is_pending())
+        self.assertEqual(user_input.call_count, 1)
+
+
+class TestHumbugConsentCache(unittest.TestCase):
+    def setUp(self):
+        self.calls = 0
+        self.consents = True
+
+    def mechanism(self):
+        self.calls += 1
+        return self.consents
+
+    def test_result_is_cached(self):
+        consent_state = consent.HumbugConsent(self.mechanism, ttl_seconds=math.inf)
+        for _ in range(10):
+            self.assertTrue(consent_state.check())
+        self.assertEqual(self.calls, 1)
+
+        self.consents = False
+        self.assertTrue(consent_state.check())
+        consent_state.invalidate()
+        self.assertFalse(consent_state.check())
+        self.assertEqual(self.calls, 2)
+
+    def test_ttl(self):
+        # Not cached by default.
+        consent_state = consent.HumbugConsent(self.mechanism)
+        consent_state.check()
+        consent_state.check()
+        self.assertEqual(self.calls, 2)
+
+        consent_state = consent.HumbugConsent(self.mechanism, ttl_seconds=0)
+        consent_state.check()
+        consent_state.check()
+        self.assertEqual(self.calls, 4)
+
+        consent_state = consent.HumbugConsent(self.mechanism, ttl_seconds=60)
+        consent_state.check()
+        consent_state.check()
+        self.assertEqual(self.calls, 5)
+        with mock.patch.object(consent.time, "monotonic", return_value=1e12):
+            consent_state.check()
+        self.assertEqual(self.calls, 6)
+
+    def test_after_fork(self):
+        consent_state = consent.HumbugConsent(self.mechanism)
+        # Held by a thread which does not exist in the child process.
+        consent_state._lock.acquire()
+        consent_state.after_fork()
+        self.assertTrue(consent_state.check())
+
+    def test_environment_changes_are_detected(self):
+        consent_state = consent.HumbugConsent(
+            self.mechanism,
+            consent.environment_variable_opt_in("HUMBUG_TEST_CACHE_OPT_IN", ["1"]),
+            ttl_seconds=math.inf,
+        )
+        with mock.patch.dict(os.environ, {"HUMBUG_TEST_CACHE_OPT_IN": "1"}):
+            self.assertTrue(consent_state.check())
+            self.assertTrue(consent_state.check())
+            # BUGGER_OFF takes effect immediately.
+            with mock.patch.dict(os.environ, {consent.HumbugConsent.BUGGER_OFF: "1"}):
+                self.assertFalse(consent_state.check())
+            self.assertTrue(consent_state.check())
+            self.assertEqual(self.calls, 3)
+
+            # Other variables take effect once the cached result expires.
+            os.environ["HUMBUG_TEST_CACHE_OPT_IN"] = "0"
+            self.assertTrue(consent_state.check())
+            consent_state.invalidate()
+            self.assertFalse(consent_state.check())
+        self.assertEqual(self.calls, 4)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,156 @@
+import logging
+import time
+import unittest
+
+from benchmarks.stub_server import StubHumbugServer
+
+from . import consent, report
+from .dedup import ErrorDeduplicator, exception_fingerprint, log_record_fingerprint
+
+
+def raise_error(message):
+    raise ValueError(message)
+
+
+def caught(message):
+    try:
+        raise_error(message)
+    except ValueError as e:
+        return e
+
+
+class TestFingerprints(unittest.TestCase):
+    def test_exception_fingerprint_ignores_message(self):
+        errors = [caught("id {}".format(i)) for i in range(2)]
+        self.assertEqual(
+            exception_fingerprint(errors[0]), exception_fingerprint(errors[1])
+        )
+
+    def test_exception_fingerprint_depends_on_site(self):
+        try:
+            raise ValueError("id 0")
+        except ValueError as e:
+            error = e
+        self.assertNotEqual(
+            exception_fingerprint(error), exception_fingerprint(caught("id 0"))
+        )
+
+    def test_log_record_fingerprint(self):
+        def record(lineno, msg, args):
+            return logging.LogRecord(
+                "test", logging.ERROR, "/path.py", lineno, msg, args, None
+            )
+
+        self.assertEqual(
+            log_record_fingerprint(record(1, "a %s", ("x",))),
+            log_record_fingerprint(record(1, "a %s", ("y",))),
+        )
+        self.assertNotEqual(
+            log_record_fingerprint(record(1, "a %s", ("x",))),
+            log_record_fingerprint(record(2, "a %s", ("x",))),
+        )
+
+
+class TestErrorDeduplicator(unittest.TestCase):
+    def test_burst_then_suppress(self):
+        deduplicator = ErrorDeduplicator(burst=3, refill_seconds=3600)
+        allowed = [deduplicator.allow("a", "title", []) for _ in range(10)]
+        self.assertListEqual(allowed, [True] * 3 + [False] * 7)
+        # Other fingerprints have their own buckets.
+        self.assertTrue(deduplicator.allow("b", "title", []))
+
+    def test_refill(self):
+        deduplicator = ErrorDeduplicator(burst=1, refill_seconds=0.05)
+        self.assertTrue(deduplicator.allow("a", "title", []))
+        self.assertFalse(deduplicator.allow("a", "title", []))
+        time.sleep(0.06)
+        self.assertTrue(deduplicator.allow("a", "title", []))
+
+    def test_collect(self):
+        deduplicator = ErrorDeduplicator(burst=1, window_seconds=0.05)
+        for _ in range(5):
+            deduplicator.allow("a", "title", ["tag"])
+        self.assertListEqual(deduplicator.collect(), [])
+
+        time.sleep(0.06)
+        collected = deduplicator.collect()
+        self.assertEqual(len(collected), 1)
+        self.assertEqual(collected[0].fingerprint, "a")
+        self.assertEqual(collected[0].count, 4)
+        self.assertListEqual(collected[0].tags, ["tag"])
+        self.assertListEqual(deduplicator.collect(force=True), [])
+
+    def test_lru_eviction(self):
+        deduplicator = ErrorDeduplicator(max_fingerprints=2, burst=1)
+        deduplicator.allow("a", "title", [])
+        deduplicator.allow("a", "title", [])
+        deduplicator.allow("b", "title", [])
+        deduplicator.allow("a", "title", [])
+        deduplicator.allow("c", "title", [])
+        self.assertEqual(len(deduplicator), 2)
+        # "b" was the least recently seen fingerprint, so it was forgotten.
+        self.assertTrue(deduplicator.allow("b", "title", []))
+
+        deduplicator.allow("d", "title", [])
+        deduplicator.allow("e", "title", [])
+        # "a" had suppressed occurrences when it was evicted.
+        collected = deduplicator.collect()
+        self.assertListEqual(
+            [(occurrences.fingerprint, occurrences.count) for occurrences in collected],
+            [("a", 2)],
+        )
+
+
+class TestReporterDeduplication(unittest.TestCase):
+    def setUp(self):
+        self.server = StubHumbugServer().start()
+        self.reporter = report.HumbugReporter(
+            "TestReporterDeduplication",
+            consent.HumbugConsent(True),
+            bugout_token="humbug-unit-test-token",
+            url=self.server.url,
+            deduplicator=ErrorDeduplicator(burst=2, refill_seconds=3600),
+        )
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_record_errors(self):
+        @self.reporter.record_errors
+        def fail(i):
+            raise ValueError(i)
+
+        for i in range(100):
+            with self.assertRaises(ValueError):
+                fail(i)
+        self.reporter.wait()
+
+        titles = [report["title"] for report in self.server.reports]
+        self.assertEqual(len(titles), 3)
+        self.assertIn("TestReporterDeduplication - ValueError (98 occurrences)", titles)
+        occurrences_report = [
+            report for report in self.server.reports if "occurrences" in report["title"]
+        ][0]
+        self.assertIn("type:occurrences", occurrences_report["tags"])
+        self.assertIn("error:ValueError", occurrences_report["tags"])
+        self.assertIn("site:fail", occurrences_report["tags"])
+
+    def test_loggerhook(self):
+        logger = logging.getLogger("TestReporterDeduplication")
+        logger.propagate = False
+        handler = self.reporter.setup_loggerhook(
+            logging.ERROR, publish=True, logger=logger
+        )
+        try:
+            for i in range(10):
+                logger.error("failure %d", i)
+            self.reporter.wait()
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+
+        self.assertEqual(self.server.num_reports, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+import unittest
+
+from benchmarks.stub_server import StubHumbugServer
+
+from . import consent, report
+from .forwarding import ReportAggregator, ReportForwarder
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "requires os.fork")
+class TestReporterAfterFork(unittest.TestCase):
+    def setUp(self):
+        self.server = StubHumbugServer().start()
+        self.reporter = report.HumbugReporter(
+            "TestReporterAfterFork",
+            consent.HumbugConsent(True),
+            bugout_token="humbug-unit-test-token",
+            url=self.server.url,
+        )
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_child_publishes_its_own_reports(self):
+        self.reporter.custom_report("parent", "content")
+        self.reporter.wait()
+        # A report which is still waiting to be published when the process forks.
+        self.reporter.report_queue.put(("/humbug/reports", {"title": "pending"}, None))
+
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 1
+            try:
+                if len(self.reporter.report_queue) == 0:
+                    self.reporter.custom_report("child", "content")
+                    self.reporter.wait()
+                    if self.reporter.counters.get("sent") == 1:
+                        exit_code = 0
+            finally:
+                os._exit(exit_code)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+        self.assertListEqual(
+            [received["title"] for received in self.server.reports], ["parent", "child"]
+        )
+
+    def test_fork_while_first_report_is_published(self):
+        # Runs in a new interpreter, so that the first report is also the first time that the
+        # reporter's worker thread sends anything.
+        script = textwrap.dedent(
+            """
+            import os
+            from humbug.consent import HumbugConsent
+            from humbug.report import HumbugReporter
+
+            reporter = HumbugReporter(
+                "TestReporterAfterFork",
+                HumbugConsent(True),
+                bugout_token="humbug-unit-test-token",
+                url={url!r},
+            )
+            reporter.custom_report("parent", "content")
+            pid = os.fork()
+            if pid == 0:
+                exit_code = 1
+                try:
+                    reporter.custom_report("child", "content")
+                    reporter.wait()
+                    if reporter.counters.get("sent") == 1:
+                        exit_code = 0
+                finally:
+                    os._exit(exit_code)
+            _, status = os.waitpid(pid, 0)
+            reporter.wait()
+            print(os.WEXITSTATUS(status))
+            """
+        ).format(url=self.server.url)
+        package_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=package_directory,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            timeout=60,
+            check=True,
+            universal_newlines=True,
+        ).stdout
+        self.assertEqual(output.strip(), "0")
+        self.assertListEqual(
+            sorted(received["title"] for received in self.server.reports),
+            ["child", "parent"],
+        )
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "requires Unix sockets")
+class TestReportForwarding(unittest.TestCase):
+    def setUp(self):
+        self.server = StubHumbugServer().start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.directory.name, "humbug.sock")
+        self.forwarders = []
+        self.aggregator_reporter = report.HumbugReporter(
+            "TestReportForwarding",
+            consent.HumbugConsent(True),
+            bugout_token="humbug-unit-test-token",
+            url=self.server.url,
+            mode=report.Modes.BATCH,
+            batch_linger_seconds=0.05,
+        )
+
+    def tearDown(self):
+        for forwarder in self.forwarders:
+            forwarder.close()
+        self.server.stop()
+        self.directory.cleanup()
+
+    def forwarding_reporter(self):
+        forwarder = ReportForwarder(self.socket_path)
+        self.forwarders.append(forwarder)
+        return report.HumbugReporter(
+            "TestReportForwarding",
+            consent.HumbugConsent(True),
+            bugout_token="humbug-unit-test-token",
+            url=self.server.url,
+            mode=report.Modes.SYNCHRONOUS,
+            tags=["worker"],
+            forwarder=forwarder,
+        )
+
+    def test_forwarded_reports_are_batched(self):
+        with ReportAggregator(self.aggregator_reporter, self.socket_path):
+            reporter = self.forwarding_reporter()
+            for i in range(5):
+                reporter.custom_report("report {}".format(i), "content")
+            self.assertEqual(reporter.counters.get("forwarded"), 5)
+            self.assertTrue(wait_for(lambda: self.server.num_reports == 5))
+
+        self.assertEqual(self.server.num_requests, 1)
+        self.assertIn("worker", self.server.reports[0]["tags"])
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_forwarding_from_forked_processes(self):
+        with ReportAggregator(self.aggregator_reporter, self.socket_path):
+            reporter = self.forwarding_reporter()
+            reporter.custom_report("parent", "content")
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    reporter.custom_report("child", "content")
+                finally:
+                    os._exit(0 if reporter.counters.get("forwarded") == 1 else 1)
+            _, status = os.waitpid(pid, 0)
+            self.assertEqual(os.WEXITSTATUS(status), 0)
+            self.assertTrue(wait_for(lambda: self.server.num_reports == 2))
+
+    def test_without_aggregator(self):
+        reporter = self.forwarding_reporter()
+        reporter.custom_report("report", "content")
+        self.assertEqual(reporter.counters.get("forwarded"), 0)
+        self.assertEqual(reporter.counters.get("sent"), 1)
+        self.assertEqual(self.server.num_reports, 1)
+
+    def test_batch_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            report.HumbugReporter(
+                "TestReportForwarding",
+                consent.HumbugConsent(True),
+                mode=report.Modes.BATCH,
+                forwarder=ReportForwarder(self.socket_path),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
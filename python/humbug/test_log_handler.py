@@ -0,0 +1,139 @@
+import logging
+import sys
+import threading
+import unittest
+
+from . import consent, dedup, report
+from .log_handler import HumbugHandler
+
+
+class TestHumbugHandler(unittest.TestCase):
+    def setUp(self):
+        self.reporter = report.HumbugReporter(
+            "TestHumbugHandler",
+            consent.HumbugConsent(True),
+            bugout_token="humbug-unit-test-token",
+            mode=report.Modes.SYNCHRONOUS,
+        )
+        self.published = []
+        self.publishing_threads = set()
+
+        def publish(report, wait=False):
+            self.published.append(report)
+            self.publishing_threads.add(threading.current_thread().name)
+
+        self.reporter.publish = publish
+        self.logger = logging.getLogger("TestHumbugHandler")
+        self.logger.propagate = False
+        self.handlers = []
+
+    def tearDown(self):
+        for handler in self.handlers:
+            self.logger.removeHandler(handler)
+            handler.close()
+
+    def add_handler(self, **kwargs):
+        handler = HumbugHandler(self.reporter, **kwargs)
+        self.logger.addHandler(handler)
+        self.handlers.append(handler)
+        return handler
+
+    def test_reports_on_listener_thread(self):
+        handler = self.add_handler(tags=["handler-tag"])
+        self.logger.error("failure %s", "a")
+        self.logger.warning("not reported")
+        self.assertTrue(handler.wait(timeout=5))
+
+        self.assertEqual(len(self.published), 1)
+        self.assertIn("failure a", self.published[0].content)
+        self.assertIn("handler-tag", self.published[0].tags)
+        self.assertIn("type:logging", self.published[0].tags)
+        self.assertSetEqual(self.publishing_threads, {"humbug_log_listener"})
+
+    def test_logger_filtering(self):
+        handler = self.add_handler(
+            loggers=["TestHumbugHandler.included"],
+            exclude_loggers=["TestHumbugHandler.included.excluded"],
+        )
+        logging.getLogger("TestHumbugHandler.included").error("reported")
+        logging.getLogger("TestHumbugHandler.included.child").error("reported")
+        logging.getLogger("TestHumbugHandler.included.excluded").error("ignored")
+        logging.getLogger("TestHumbugHandler.other").error("ignored")
+        self.assertTrue(handler.wait(timeout=5))
+
+        self.assertEqual(len(self.published), 2)
+
+    def test_full_queue_drops_records(self):
+        handler = self.add_handler(max_queue_size=1)
+        blocker = threading.Event()
+        original_publish = self.reporter.publish
+
+        def blocked_publish(report, wait=False):
+            blocker.wait(5)
+            original_publish(report, wait)
+
+        self.reporter.publish = blocked_publish
+        for _ in range(10):
+            self.logger.error("failure")
+        blocker.set()
+        self.assertTrue(handler.wait(timeout=5))
+
+        self.assertGreater(self.reporter.counters.get("log_records_dropped"), 0)
+        self.assertEqual(
+            len(self.published) + self.reporter.counters.get("log_records_dropped"), 10
+        )
+
+    def test_records_are_snapshotted_when_logged(self):
+        handler = self.add_handler()
+        blocker = threading.Event()
+        original_publish = self.reporter.publish
+
+        def blocked_publish(report, wait=False):
+            blocker.wait(5)
+            original_publish(report, wait)
+
+        self.reporter.publish = blocked_publish
+        items = ["a"]
+        try:
+            raise ValueError("snapshot")
+        except ValueError:
+            self.logger.exception("items: %s", items)
+        items.append("b")
+        blocker.set()
+        self.assertTrue(handler.wait(timeout=5))
+
+        self.assertEqual(len(self.published), 1)
+        self.assertIn("items: ['a']", self.published[0].content)
+
+        record = logging.LogRecord(
+            "TestHumbugHandler", logging.ERROR, __file__, 1, "items: %s", (items,), None
+        )
+        try:
+            raise ValueError("snapshot")
+        except ValueError:
+            record.exc_info = sys.exc_info()
+        prepared = handler.prepare(record)
+        self.assertEqual(prepared.msg, "items: ['a', 'b']")
+        self.assertIsNone(prepared.args)
+        self.assertIsNone(prepared.exc_info)
+        self.assertIn("ValueError: snapshot", prepared.exc_text)
+        self.assertIsNotNone(record.exc_info)
+        self.assertEqual(
+            dedup.log_record_fingerprint(prepared), dedup.log_record_fingerprint(record)
+        )
+
+    def test_setup_loggerhook_adds_one_handler(self):
+        handler = self.reporter.setup_loggerhook(logging.ERROR, logger=self.logger)
+        self.handlers.append(handler)
+        self.assertIs(
+            self.reporter.setup_loggerhook(logging.ERROR, logger=self.logger), handler
+        )
+        self.assertEqual(self.logger.handlers.count(handler), 1)
+
+        self.logger.error("failure")
+        self.reporter.wait()
+        self.assertEqual(len(self.published), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
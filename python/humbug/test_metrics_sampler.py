@@ -0,0 +1,121 @@
+import math
+import time
+import unittest
+
+from . import consent, report
+from .metrics_sampler import MetricsSampler, percentile, RingBuffer, summarize
+
+
+class FakeCollector:
+    def __init__(self):
+        self.calls = 0
+
+    def cpu_metrics(self):
+        self.calls += 1
+        return {"cpu_percent": float(self.calls)}
+
+    def memory_metrics(self):
+        return {}
+
+    def network_metrics(self):
+        raise RuntimeError("network metrics are not available")
+
+
+METRICS = (
+    ("cpu", "cpu", "cpu_percent"),
+    ("memory", "memory", "percent_%"),
+    ("network", "network", "MB_sent_per_s"),
+)
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_overwrites_oldest_rows(self):
+        buffer = RingBuffer(capacity=3, num_values=2)
+        for i in range(5):
+            buffer.append(float(i), [i * 10.0, i * 100.0])
+        self.assertEqual(len(buffer), 3)
+        self.assertListEqual(
+            buffer.since(0),
+            [(2.0, [20.0, 200.0]), (3.0, [30.0, 300.0]), (4.0, [40.0, 400.0])],
+        )
+        self.assertListEqual([row[0] for row in buffer.since(3.5)], [4.0])
+
+    def test_empty(self):
+        self.assertListEqual(RingBuffer(capacity=3, num_values=1).since(0), [])
+
+
+class TestSummaries(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.95), 95)
+        self.assertEqual(percentile([7], 0.95), 7)
+
+    def test_summarize(self):
+        rows = [(float(i), [float(i), math.nan]) for i in range(1, 21)]
+        summary = summarize(["a", "b"], rows)
+        assert summary is not None
+        self.assertEqual(summary.num_samples, 20)
+        self.assertDictEqual(
+            summary.stats["a"], {"min": 1.0, "mean": 10.5, "max": 20.0, "p95": 19.0}
+        )
+        self.assertNotIn("b", summary.stats)
+        self.assertIsNone(summarize(["a"], []))
+
+
+class TestMetricsSampler(unittest.TestCase):
+    def test_sample_and_history(self):
+        sampler = MetricsSampler(FakeCollector(), capacity=2, metrics=METRICS)
+        for _ in range(3):
+            sampler.sample()
+        history = sampler.history(60)
+        self.assertEqual(len(history), 2)
+        self.assertEqual(history[-1][1]["cpu"], 3.0)
+        self.assertTrue(math.isnan(history[-1][1]["memory"]))
+        self.assertTrue(math.isnan(history[-1][1]["network"]))
+
+    def test_background_summaries(self):
+        summaries = []
+        sampler = MetricsSampler(
+            FakeCollector(),
+            interval_seconds=0.01,
+            window_seconds=0.05,
+            metrics=METRICS,
+            on_summary=summaries.append,
+        ).start()
+        time.sleep(0.2)
+        sampler.stop()
+        self.assertGreaterEqual(len(summaries), 2)
+        self.assertEqual(
+            sum(summary.num_samples for summary in summaries), len(sampler.buffer)
+        )
+
+
+class TestReporterMetricsSampler(unittest.TestCase):
+    def test_error_report_includes_history(self):
+        reporter = report.HumbugReporter(
+            "TestReporterMetricsSampler",
+            consent.HumbugConsent(True),
+            mode=report.Modes.SYNCHRONOUS,
+        )
+        reporter._metrics_collector = FakeCollector()
+        sampler = reporter.start_metrics_sampler(interval_seconds=3600, metrics=METRICS)
+        sampler.sample()
+
+        error_report = reporter.error_report(ValueError("error"), publish=False)
+        self.assertIn("### Metrics history", error_report.content)
+        self.assertIn("| Timestamp | cpu | memory | network |", error_report.content)
+
+        error_report = reporter.error_report(
+            ValueError("error"), publish=False, metrics_history_seconds=0
+        )
+        self.assertNotIn("### Metrics history", error_report.content)
+
+        published = []
+        reporter.publish = lambda report, wait=False: published.append(report)
+        reporter.wait()
+        self.assertEqual(len(published), 1)
+        self.assertIn("type:metrics_summary", published[0].tags)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from . import consent, report
+from .packages import diff, PackageIndex
+
+
+def install(directory, name, version):
+    dist_info = os.path.join(directory, "{}-{}.dist-info".format(name, version))
+    os.makedirs(dist_info)
+    with open(os.path.join(dist_info, "METADATA"), "w") as ofp:
+        ofp.write(
+            "Metadata-Version: 2.1\nName: {}\nVersion: {}\n".format(name, version)
+        )
+    touch(directory)
+
+
+def uninstall(directory, name, version):
+    shutil.rmtree(os.path.join(directory, "{}-{}.dist-info".format(name, version)))
+    touch(directory)
+
+
+def touch(directory):
+    # Makes sure that the modification time changes, even on file systems with coarse timestamps.
+    mtime = os.stat(directory).st_mtime + 1
+    os.utime(directory, (mtime, mtime))
+
+
+class TestPackageIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = PackageIndex()
+        # Imports importlib.metadata before sys.path is replaced.
+        if not self.index.is_available:
+            self.skipTest("importlib.metadata is not available")
+        self.first = tempfile.mkdtemp()
+        self.second = tempfile.mkdtemp()
+        install(self.first, "alpha", "1.0")
+        install(self.second, "alpha", "0.9")
+        install(self.second, "beta", "2.0")
+        self.path = patch.object(sys, "path", [self.first, self.second])
+        self.path.start()
+
+    def tearDown(self):
+        patch.stopall()
+        shutil.rmtree(self.first)
+        shutil.rmtree(self.second)
+
+    def test_packages(self):
+        self.assertEqual(self.index.packages(), {"alpha": "1.0", "beta": "2.0"})
+
+    def test_packages_are_cached_until_entries_change(self):
+        with patch.object(
+            self.index, "_read_distribution", wraps=self.index._read_distribution
+        ) as read_distribution:
+            packages = self.index.packages()
+            self.assertEqual(read_distribution.call_count, 3)
+            self.assertIs(self.index.packages(), packages)
+            self.assertEqual(read_distribution.call_count, 3)
+
+            install(self.second, "gamma", "3.0")
+            packages = self.index.packages()
+            self.assertEqual(packages["gamma"], "3.0")
+            # Only the metadata of the new package was read.
+            self.assertEqual(read_distribution.call_count, 4)
+
+            sys.path.pop(0)
+            self.assertEqual(self.index.packages()["alpha"], "0.9")
+            self.assertEqual(read_distribution.call_count, 4)
+
+    def test_diff(self):
+        changes = diff(
+            {"alpha": "1.0", "beta": "2.0", "delta": "4.0"},
+            {"alpha": "1.1", "beta": "2.0", "gamma": "3.0"},
+        )
+        self.assertEqual(changes.added, {"gamma": "3.0"})
+        self.assertEqual(changes.removed, {"delta": "4.0"})
+        self.assertEqual(changes.changed, {"alpha": ("1.0", "1.1")})
+        self.assertFalse(diff({"alpha": "1.0"}, {"alpha": "1.0"}))
+
+    def make_reporter(self, index):
+        reporter = report.HumbugReporter(
+            name="TestReporter",
+            consent=consent.HumbugConsent(True),
+            bugout_token="humbug-unit-test-token",
+            package_index=index,
+        )
+        reporter.publish = MagicMock()
+        return reporter
+
+    def test_packages_report(self):
+        reporter = self.make_reporter(self.index)
+        full_report = reporter.packages_report(changes_only=True)
+        self.assertEqual(full_report.content, "```\nalpha 1.0\nbeta 2.0\n```")
+
+        unchanged_report = reporter.packages_report(changes_only=True)
+        self.assertIn("packages:changes", unchanged_report.tags)
+        self.assertIn("No packages", unchanged_report.content)
+
+        install(self.second, "gamma", "3.0")
+        uninstall(self.second, "beta", "2.0")
+        uninstall(self.first, "alpha", "1.0")
+        changes_report = reporter.packages_report(changes_only=True)
+        self.assertIn("### Installed\n```\ngamma 3.0\n```", changes_report.content)
+        self.assertIn("### Removed\n```\nbeta 2.0\n```", changes_report.content)
+        self.assertIn("### Changed\n```\nalpha 1.0 -> 0.9\n```", changes_report.content)
+
+    def test_snapshot_file(self):
+        snapshot_file = os.path.join(self.first, "packages.json")
+        PackageIndex(snapshot_file).mark_reported(self.index.packages())
+        install(self.second, "gamma", "3.0")
+
+        index = PackageIndex(snapshot_file)
+        self.assertEqual(index.last_reported(), {"alpha": "1.0", "beta": "2.0"})
+        reporter = self.make_reporter(index)
+        changes_report = reporter.packages_report(changes_only=True)
+        self.assertEqual(changes_report.content, "### Installed\n```\ngamma 3.0\n```")
+
+    def test_unpublished_reports_are_not_marked_reported(self):
+        snapshot_file = os.path.join(self.first, "packages.json")
+        reporter = self.make_reporter(PackageIndex(snapshot_file))
+        reporter.packages_report(publish=False)
+        with patch.object(reporter.consent, "check", return_value=False):
+            reporter.packages_report()
+        self.assertFalse(os.path.exists(snapshot_file))
+        self.assertIsNone(reporter.package_index.last_reported())
+
+        full_report = reporter.packages_report(changes_only=True)
+        self.assertNotIn("packages:changes", full_report.tags)
+        self.assertIn("alpha 1.0", full_report.content)
+        self.assertTrue(os.path.exists(snapshot_file))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,13 @@
+import os
+import subprocess
+import sys
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
+
+from benchmarks.stub_server import StubHumbugServer
 
 from . import consent, report, blacklist
+from .retry import RetryPolicy
 
 
 class TestReporter(unittest.TestCase):
@@ -54,14 +60,81 @@ class TestReporter(unittest.TestCase):
         env_report = self.reporter.env_report(tags=tags, publish=False)
         self.assertSetEqual(set(env_report.tags), set(tags + ["type:env"]))
 
+    def test_env_report_redacts_secrets(self):
+        with patch.dict(
+            os.environ,
+            {
+                "HUMBUG_TEST_API_TOKEN": "hunter2",
+                "HUMBUG_TEST_HEADER": "Bearer abcdef",
+                "HUMBUG_TEST_HOME": "/home/humbug",
+            },
+        ):
+            content = self.reporter.env_report(publish=False).content
+        self.assertIn("HUMBUG_TEST_API_TOKEN=<redacted>", content)
+        self.assertIn("HUMBUG_TEST_HEADER=<redacted>", content)
+        self.assertIn("HUMBUG_TEST_HOME=/home/humbug", content)
+        self.assertNotIn("hunter2", content)
+
+    def test_env_report_changes(self):
+        self.reporter.bugout_token = "humbug-unit-test-token"
+        with patch.dict(os.environ, {"HUMBUG_TEST_A": "1", "HUMBUG_TEST_B": "2"}):
+            full_report = self.reporter.env_report(changes_only=True)
+            self.assertIn("HUMBUG_TEST_A=1", full_report.content)
+            self.assertNotIn("env:changes", full_report.tags)
+
+            with patch.object(
+                self.reporter, "env_filter", wraps=self.reporter.env_filter
+            ) as env_filter:
+                self.reporter.publish.reset_mock()
+                self.assertIsNone(self.reporter.env_report(changes_only=True))
+                self.reporter.publish.assert_not_called()
+                self.assertEqual(
+                    self.reporter.env_report(publish=False).content,
+                    full_report.content,
+                )
+                env_filter.assert_not_called()
+
+            os.environ["HUMBUG_TEST_A"] = "3"
+            os.environ["HUMBUG_TEST_C"] = "4"
+            del os.environ["HUMBUG_TEST_B"]
+            changes_report = self.reporter.env_report(changes_only=True)
+        self.assertEqual(
+            changes_report.content,
+            "### Set\n```\nHUMBUG_TEST_A=3\nHUMBUG_TEST_C=4\n```\n\n"
+            "### Unset\n```\nHUMBUG_TEST_B\n```",
+        )
+
+    def test_env_report_changes_since_last_published(self):
+        with patch.dict(os.environ, {"HUMBUG_TEST_A": "1"}):
+            # Neither report is sent: one is not published, and the other has no token to be
+            # published with.
+            self.reporter.env_report(publish=False)
+            self.reporter.env_report()
+            os.environ["HUMBUG_TEST_B"] = "2"
+            first_report = self.reporter.env_report(changes_only=True)
+            self.assertNotIn("env:changes", first_report.tags)
+            self.assertIn("HUMBUG_TEST_A=1", first_report.content)
+
+            self.reporter.bugout_token = "humbug-unit-test-token"
+            with patch.object(self.consent, "check", return_value=False):
+                self.reporter.env_report()
+            self.reporter.env_report(publish=False)
+            self.assertNotIn(
+                "env:changes", self.reporter.env_report(changes_only=True).tags
+            )
+
+            os.environ["HUMBUG_TEST_C"] = "3"
+            changes_report = self.reporter.env_report(changes_only=True)
+        self.assertEqual(changes_report.content, "### Set\n```\nHUMBUG_TEST_C=3\n```")
+
     def test_packages_report_successful(self):
         tags = ["a", "b", "c"]
         pkg_report = self.reporter.packages_report(tags=tags, publish=False)
 
         excepted_tags = tags + ["type:dependencies"]
 
-        if not self.reporter.pkg_resources_exists:
-            excepted_tags.append("warning:pkg_resources_import_failed")
+        if not self.reporter.package_index.is_available:
+            excepted_tags.append("warning:package_metadata_unavailable")
 
         self.assertSetEqual(set(pkg_report.tags), set(tags + excepted_tags))
 
@@ -81,6 +154,129 @@ class TestReporter(unittest.TestCase):
             },
         )
 
+    def test_post_body_deduplicates_tags(self):
+        sample_report = report.Report(
+            title="a", content="b", tags=["c", "humbug-unit-test", "d", "c"]
+        )
+        self.assertListEqual(
+            self.reporter._post_body(sample_report)["tags"],
+            ["c", "humbug-unit-test", "d"],
+        )
+
+    def test_merge_tags(self):
+        self.assertListEqual(
+            report.merge_tags(["b", "a", "b"], ["c", "a"], []), ["b", "a", "c"]
+        )
+
+    def test_system_tags_are_cached_until_ids_change(self):
+        tags = self.reporter.system_tags()
+        # Callers may modify the list they get.
+        tags.append("extra")
+        self.assertNotIn("extra", self.reporter.system_tags())
+        self.assertFalse(
+            any(tag.startswith("client:") for tag in self.reporter.system_tags())
+        )
+
+        self.reporter.client_id = "client-a"
+        self.reporter.session_id = "session-a"
+        self.assertIn("client:client-a", self.reporter.system_tags())
+        self.assertIn("session:session-a", self.reporter.system_tags())
+
+    def test_system_information_is_generated_when_needed(self):
+        system_information = self.reporter.system_information
+        with patch.object(report, "generate_system_information") as generate:
+            reporter = report.HumbugReporter(name="TestReporter", consent=self.consent)
+            generate.assert_not_called()
+            generate.return_value = system_information
+            reporter.system_tags()
+            reporter.system_tags()
+            generate.assert_called_once()
+
+    def test_heavy_dependencies_are_imported_lazily(self):
+        script = """
+import sys
+from humbug.consent import HumbugConsent
+from humbug.report import HumbugReporter
+import humbug.async_report
+
+imported = ["requests"] if "requests" in sys.modules else []
+# The reporter's transport imports requests.
+reporter = HumbugReporter("TestReporter", HumbugConsent(False))
+reporter.error_report(ValueError("not published"))
+modules = ("psutil", "GPUtil", "pkg_resources", "zstandard", "aiohttp")
+imported.extend(module for module in modules if module in sys.modules)
+print(",".join(imported))
+"""
+        output = subprocess.run(
+            [sys.executable, "-c", script],
+            stdout=subprocess.PIPE,
+            check=True,
+            universal_newlines=True,
+        ).stdout
+        self.assertEqual(output.strip(), "")
+
+    def test_report_futures_is_deprecated(self):
+        with self.assertWarns(DeprecationWarning):
+            self.assertListEqual(self.reporter.report_futures, [])
+
+    def test_headers_follow_token(self):
+        self.reporter.bugout_token = "token-a"
+        self.assertEqual(self.reporter._headers()["Authorization"], "Bearer token-a")
+        self.reporter.bugout_token = "token-b"
+        self.assertEqual(self.reporter._headers()["Authorization"], "Bearer token-b")
+        self.assertEqual(
+            self.reporter._bulk_headers()["Authorization"], "Bearer token-b"
+        )
+
+    def test_report_content_is_rendered_lazily(self):
+        try:
+            raise ValueError("lazy")
+        except ValueError as e:
+            error = e
+        capture = self.reporter.traceback_capture
+        with patch.object(capture, "format", wraps=capture.format) as format_traceback:
+            error_report = self.reporter.error_report(error, publish=False)
+            format_traceback.assert_not_called()
+            self.assertIn("ValueError: lazy", error_report.content)
+            self.assertIn("ValueError: lazy", error_report.content)
+            format_traceback.assert_called_once()
+
+    def test_error_report_traceback_is_captured_when_reported(self):
+        def fail():
+            raise ValueError("fail")
+
+        def report_and_raise():
+            try:
+                fail()
+            except ValueError as e:
+                return self.reporter.error_report(e, publish=False)
+
+        error_report = report_and_raise()
+        self.assertIn("in fail", error_report.content)
+
+        def reraise():
+            try:
+                fail()
+            except ValueError as e:
+                reports.append(self.reporter.error_report(e, publish=False))
+                raise
+
+        reports = []
+        with self.assertRaises(ValueError):
+            reraise()
+        self.assertNotIn("test_error_report_traceback", reports[0].content)
+
+    def test_unpublishable_reports_are_not_rendered(self):
+        reporter = report.HumbugReporter(
+            name="TestReporter",
+            consent=consent.HumbugConsent(False),
+            bugout_token="humbug-unit-test-token",
+            mode=report.Modes.SYNCHRONOUS,
+        )
+        with patch.object(reporter.traceback_capture, "format") as format_traceback:
+            reporter.error_report(ValueError("unpublished"))
+            format_traceback.assert_not_called()
+
     def test_feature_report(self):
         report = self.reporter.feature_report(
             "test_feature",
@@ -149,11 +345,98 @@ class TestReporter(unittest.TestCase):
         report = publish_args[0][0]
         self.assertTrue("site:broken" in report.tags)
 
+    def test_error_report_skips_capture_when_it_cannot_publish(self):
+        error = ValueError("not published")
+        with patch.object(
+            self.reporter.traceback_capture,
+            "capture",
+            wraps=self.reporter.traceback_capture.capture,
+        ) as capture:
+            # The reporter has no token, so the report is handed to publish without being built.
+            error_report = self.reporter.error_report(error)
+            capture.assert_not_called()
+            self.reporter.publish.assert_called_once()
+            self.assertIn("ValueError: not published", error_report.content)
+            self.assertIn("error:ValueError", error_report.tags)
+            self.assertIn("python:3", error_report.tags)
+            capture.assert_called_once()
+
+            self.reporter.bugout_token = "humbug-unit-test-token"
+            with patch.dict(os.environ, {"BUGGER_OFF": "yes"}):
+                self.reporter.error_report(error)
+            self.assertEqual(capture.call_count, 1)
+            self.reporter.error_report(error)
+            self.assertEqual(capture.call_count, 2)
+            self.assertEqual(self.reporter.publish.call_count, 3)
+
     def test_metrics_report(self):
         tags = ["a", "b", "c"]
         metrics_report = self.reporter.metrics_report(tags=tags, publish=False)
         self.assertSetEqual(set(metrics_report.tags), set(tags + ["type:metrics"]))
 
 
+class TestReporterPublishing(unittest.TestCase):
+    """
+    Publishes reports end to end, to a local stub Humbug server, in every mode.
+    """
+
+    def setUp(self):
+        self.server = StubHumbugServer(retry_after="0", seed=0).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def reporter(self, mode):
+        return report.HumbugReporter(
+            name="TestReporterPublishing",
+            consent=consent.HumbugConsent(True),
+            bugout_token="humbug-unit-test-token",
+            url=self.server.url,
+            mode=mode,
+            retry_policy=RetryPolicy(
+                max_attempts=10, initial_backoff_seconds=0.01, budget_ratio=1.0
+            ),
+        )
+
+    def publish_reports(self, reporter):
+        try:
+            raise ValueError("published")
+        except ValueError as e:
+            reporter.error_report(e)
+        reporter.feature_report("published_feature", {"a": 1})
+        reporter.wait()
+
+    def test_publish(self):
+        for mode in report.Modes:
+            with self.subTest(mode=mode):
+                self.server.reports.clear()
+                self.publish_reports(self.reporter(mode))
+                titles = sorted(body["title"] for body in self.server.reports)
+                self.assertEqual(
+                    titles,
+                    [
+                        "Feature used: published_feature",
+                        "TestReporterPublishing - ValueError",
+                    ],
+                )
+                error_body = next(
+                    body
+                    for body in self.server.reports
+                    if "error:ValueError" in body["tags"]
+                )
+                self.assertIn("ValueError: published", error_body["content"])
+
+    def test_publish_through_throttling_and_errors(self):
+        self.server.throttle_rate = 0.2
+        self.server.error_rate = 0.2
+        for mode in (report.Modes.DEFAULT, report.Modes.BATCH):
+            with self.subTest(mode=mode):
+                self.server.reports.clear()
+                reporter = self.reporter(mode)
+                self.publish_reports(reporter)
+                self.assertEqual(len(self.server.reports), 2)
+                self.assertEqual(reporter.counters.snapshot().get("dropped", 0), 0)
+
+
 if __name__ == "__main__":
     unittest.main()
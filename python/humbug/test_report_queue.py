@@ -0,0 +1,148 @@
+import threading
+import time
+import unittest
+
+from benchmarks.stub_server import StubHumbugServer
+
+from . import consent, report
+from .report_queue import OverflowPolicy, ReportQueue
+from .transport import HumbugTransport
+
+
+class TestReportQueue(unittest.TestCase):
+    def drain(self, queue):
+        items = []
+        while len(queue):
+            items.append(queue.get())
+        return items
+
+    def test_fifo(self):
+        queue = ReportQueue(max_size=10)
+        for i in range(5):
+            self.assertTrue(queue.put(i))
+        self.assertEqual(queue.peek(), 0)
+        self.assertListEqual(self.drain(queue), [0, 1, 2, 3, 4])
+        with self.assertRaises(IndexError):
+            queue.get()
+
+    def test_unbounded(self):
+        queue = ReportQueue(max_size=None)
+        for i in range(1000):
+            self.assertTrue(queue.put(i))
+        self.assertEqual(len(queue), 1000)
+
+    def test_drop_newest(self):
+        queue = ReportQueue(max_size=3, overflow_policy=OverflowPolicy.DROP_NEWEST)
+        results = [queue.put(i) for i in range(5)]
+        self.assertListEqual(results, [True, True, True, False, False])
+        self.assertListEqual(self.drain(queue), [0, 1, 2])
+        self.assertEqual(queue.counters.get("queue_dropped_newest"), 2)
+
+    def test_drop_oldest(self):
+        queue = ReportQueue(max_size=3, overflow_policy=OverflowPolicy.DROP_OLDEST)
+        results = [queue.put(i) for i in range(5)]
+        self.assertListEqual(results, [True] * 5)
+        self.assertListEqual(self.drain(queue), [2, 3, 4])
+        self.assertEqual(queue.counters.get("queue_dropped_oldest"), 2)
+
+    def test_block_times_out(self):
+        queue = ReportQueue(
+            max_size=1, overflow_policy=OverflowPolicy.BLOCK, block_timeout_seconds=0.05
+        )
+        self.assertTrue(queue.put(0))
+        start = time.monotonic()
+        self.assertFalse(queue.put(1))
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertEqual(queue.counters.get("queue_dropped_blocked"), 1)
+
+    def test_block_unblocks_when_consumer_makes_room(self):
+        queue = ReportQueue(
+            max_size=1, overflow_policy=OverflowPolicy.BLOCK, block_timeout_seconds=5
+        )
+        queue.put(0)
+        consumer = threading.Timer(0.05, queue.get)
+        consumer.start()
+        self.assertTrue(queue.put(1))
+        consumer.join()
+        self.assertListEqual(self.drain(queue), [1])
+        self.assertEqual(queue.counters.get("queue_dropped_blocked"), 0)
+
+    def test_sample(self):
+        max_size = 10
+        queue = ReportQueue(max_size=max_size, overflow_policy=OverflowPolicy.SAMPLE)
+        for i in range(1000):
+            queue.put(i)
+        self.assertEqual(len(queue), max_size)
+        self.assertEqual(queue.counters.get("queue_dropped_sampled"), 1000 - max_size)
+        items = self.drain(queue)
+        self.assertEqual(len(set(items)), max_size)
+        # With 10 survivors out of 1000, it is vanishingly unlikely that reservoir sampling keeps
+        # only reports from the first 10.
+        self.assertTrue(any(item >= max_size for item in items))
+
+
+class BlockedTransport(HumbugTransport):
+    """
+    Transport whose requests hang until it is released.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.released = threading.Event()
+
+    def post(self, *args, **kwargs):
+        self.released.wait()
+        return super().post(*args, **kwargs)
+
+
+class TestReporterBackpressure(unittest.TestCase):
+    def setUp(self):
+        self.server = StubHumbugServer().start()
+        self.transport = BlockedTransport()
+
+    def tearDown(self):
+        self.transport.released.set()
+        self.server.stop()
+
+    def make_reporter(self, mode):
+        return report.HumbugReporter(
+            name="TestReporterBackpressure",
+            consent=consent.HumbugConsent(True),
+            bugout_token="humbug-unit-test-token",
+            url=self.server.url,
+            mode=mode,
+            transport=self.transport,
+            max_queue_size=10,
+            overflow_policy=OverflowPolicy.DROP_NEWEST,
+        )
+
+    def test_default_mode_queue_stays_bounded(self):
+        reporter = self.make_reporter(report.Modes.DEFAULT)
+        for _ in range(100):
+            reporter.custom_report("title", "content")
+
+        # One report may already have been taken from the queue by the executor.
+        self.assertLessEqual(len(reporter.report_queue), 10)
+        self.assertGreaterEqual(reporter.dropped_reports, 89)
+
+        self.transport.released.set()
+        reporter.wait()
+        self.assertEqual(self.server.num_reports + reporter.dropped_reports, 100)
+        self.assertEqual(len(reporter.report_queue), 0)
+
+    def test_batch_mode_queue_stays_bounded(self):
+        reporter = self.make_reporter(report.Modes.BATCH)
+        for _ in range(100):
+            reporter.custom_report("title", "content")
+
+        self.assertLessEqual(len(reporter.report_queue), 10)
+
+        self.transport.released.set()
+        reporter.wait()
+        self.assertEqual(self.server.num_reports + reporter.dropped_reports, 100)
+        self.assertGreater(reporter.dropped_reports, 0)
+        reporter.batcher.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
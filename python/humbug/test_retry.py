@@ -0,0 +1,170 @@
+from email.utils import formatdate
+import tempfile
+import time
+import unittest
+
+from benchmarks.stub_server import StubHumbugServer
+
+from . import consent, report
+from .retry import parse_retry_after, RetryBudget, RetryPolicy
+from .spool import ReportSpool
+
+
+class TestParseRetryAfter(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        self.assertEqual(parse_retry_after(" 1.5 "), 1.5)
+        self.assertEqual(parse_retry_after("-1"), 0.0)
+
+    def test_http_date(self):
+        retry_after = parse_retry_after(formatdate(time.time() + 60, usegmt=True))
+        assert retry_after is not None
+        self.assertGreater(retry_after, 50)
+        self.assertLessEqual(retry_after, 60)
+
+    def test_invalid(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_backoff_grows_and_is_capped(self):
+        policy = RetryPolicy(
+            initial_backoff_seconds=1, multiplier=2, max_backoff_seconds=5, jitter=0
+        )
+        self.assertListEqual(
+            [policy.backoff_seconds(retry) for retry in range(1, 6)], [1, 2, 4, 5, 5]
+        )
+
+    def test_jitter(self):
+        policy = RetryPolicy(initial_backoff_seconds=1, jitter=0.5)
+        backoffs = [policy.backoff_seconds(1) for _ in range(100)]
+        for backoff in backoffs:
+            assert backoff is not None
+            self.assertGreaterEqual(backoff, 0.5)
+            self.assertLessEqual(backoff, 1)
+        self.assertGreater(len(set(backoffs)), 1)
+
+    def test_retry_after(self):
+        policy = RetryPolicy(max_backoff_seconds=10)
+        self.assertEqual(policy.backoff_seconds(1, retry_after_seconds=7), 7)
+        self.assertIsNone(policy.backoff_seconds(1, retry_after_seconds=11))
+
+    def test_is_retryable(self):
+        policy = RetryPolicy()
+        self.assertTrue(policy.is_retryable(429))
+        self.assertTrue(policy.is_retryable(503))
+        self.assertFalse(policy.is_retryable(400))
+        self.assertFalse(policy.is_retryable(404))
+
+
+class TestRetryBudget(unittest.TestCase):
+    def test_budget(self):
+        budget = RetryBudget(ratio=0.5, max_tokens=2)
+        self.assertTrue(budget.withdraw())
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        self.assertTrue(budget.withdraw())
+
+
+class TestReporterRetries(unittest.TestCase):
+    def setUp(self):
+        self.server = StubHumbugServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def make_reporter(self, **kwargs):
+        return report.HumbugReporter(
+            "TestReporterRetries",
+            consent.HumbugConsent(True),
+            bugout_token="humbug-unit-test-token",
+            url=self.server.url,
+            retry_policy=RetryPolicy(
+                initial_backoff_seconds=0.01, max_backoff_seconds=1
+            ),
+            **kwargs
+        )
+
+    def test_retries_throttled_and_failed_reports(self):
+        self.server.respond_with(429, retry_after="0")
+        self.server.respond_with(503)
+        reporter = self.make_reporter()
+        reporter.custom_report("title", "content")
+        reporter.wait()
+
+        self.assertEqual(self.server.num_requests, 3)
+        self.assertEqual(self.server.num_reports, 1)
+        counters = reporter.counters.snapshot()
+        self.assertEqual(counters.get("sent"), 1)
+        self.assertEqual(counters.get("retried"), 2)
+        self.assertEqual(counters.get("throttled"), 1)
+        self.assertIsNone(counters.get("dropped"))
+
+    def test_retries_batches(self):
+        self.server.respond_with(500)
+        reporter = self.make_reporter(mode=report.Modes.BATCH)
+        for _ in range(3):
+            reporter.custom_report("title", "content")
+        reporter.wait()
+        reporter.batcher.close()
+
+        self.assertEqual(self.server.num_reports, 3)
+        self.assertEqual(reporter.counters.get("sent"), 3)
+        self.assertEqual(reporter.counters.get("retried"), 3)
+
+    def test_gives_up_after_max_attempts(self):
+        self.server.respond_with(500, count=10)
+        reporter = self.make_reporter()
+        reporter.custom_report("title", "content")
+        reporter.wait()
+
+        self.assertEqual(self.server.num_requests, reporter.retry_policy.max_attempts)
+        self.assertEqual(reporter.counters.get("dropped"), 1)
+        self.assertEqual(self.server.num_reports, 0)
+
+    def test_spooled_reports_are_deferred(self):
+        self.server.respond_with(500, count=10)
+        with tempfile.TemporaryDirectory() as directory:
+            reporter = self.make_reporter(spool=ReportSpool(directory))
+            reporter.custom_report("title", "content")
+            reporter.wait()
+            reporter.spool.close()
+
+        self.assertEqual(reporter.counters.get("deferred"), 1)
+        self.assertEqual(reporter.counters.get("dropped"), 0)
+
+    def test_does_not_retry_client_errors(self):
+        self.server.respond_with(400)
+        reporter = self.make_reporter()
+        reporter.custom_report("title", "content")
+        reporter.wait()
+
+        self.assertEqual(self.server.num_requests, 1)
+        self.assertEqual(reporter.counters.get("dropped"), 1)
+
+    def test_does_not_retry_long_retry_after(self):
+        self.server.respond_with(429, retry_after="3600")
+        reporter = self.make_reporter()
+        reporter.custom_report("title", "content")
+        reporter.wait()
+
+        self.assertEqual(self.server.num_requests, 1)
+        self.assertEqual(reporter.counters.get("throttled"), 1)
+        self.assertEqual(reporter.counters.get("dropped"), 1)
+
+    def test_does_not_retry_on_callers_thread(self):
+        self.server.respond_with(503)
+        reporter = self.make_reporter()
+        reporter.custom_report("title", "content", wait=True)
+
+        self.assertEqual(self.server.num_requests, 1)
+        self.assertEqual(reporter.counters.get("retried"), 0)
+        self.assertEqual(reporter.counters.get("dropped"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
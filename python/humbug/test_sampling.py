@@ -0,0 +1,95 @@
+import unittest
+import uuid
+
+from . import consent, report
+from .sampling import Sampler, session_position
+
+
+class TestSampler(unittest.TestCase):
+    def test_rates(self):
+        sampler = Sampler(rate=0.25, feature_rates={"always": 1.0, "never": 0.0})
+        self.assertEqual(sampler.sample("always", "session"), 1.0)
+        self.assertIsNone(sampler.sample("never", "session"))
+
+        weights = [sampler.sample("other", "session") for _ in range(4000)]
+        sampled = [weight for weight in weights if weight is not None]
+        self.assertGreater(len(sampled), 800)
+        self.assertLess(len(sampled), 1200)
+        self.assertSetEqual(set(sampled), {4.0})
+
+    def test_by_session(self):
+        sampler = Sampler(rate=0.5, by_session=True)
+        for _ in range(20):
+            session_id = str(uuid.uuid4())
+            decisions = set(
+                sampler.sample("feature", session_id) is None for _ in range(10)
+            )
+            self.assertEqual(len(decisions), 1)
+            self.assertEqual(
+                decisions.pop(), session_position(session_id) >= sampler.rate
+            )
+
+    def test_session_position(self):
+        positions = [session_position(str(uuid.uuid4())) for _ in range(1000)]
+        for position in positions:
+            self.assertGreaterEqual(position, 0)
+            self.assertLess(position, 1)
+        self.assertLess(abs(sum(positions) / len(positions) - 0.5), 0.05)
+
+
+class TestReporterSampling(unittest.TestCase):
+    def make_reporter(self, sampler):
+        return report.HumbugReporter(
+            "TestReporterSampling",
+            consent.HumbugConsent(True),
+            bugout_token="humbug-unit-test-token",
+            mode=report.Modes.SYNCHRONOUS,
+            sampler=sampler,
+        )
+
+    def test_record_call_skips_unsampled_calls(self):
+        reporter = self.make_reporter(Sampler(rate=0.0))
+        published = []
+        reporter.publish = lambda report, wait=False: published.append(report)
+
+        @reporter.record_call
+        def add(a, b):
+            return a + b
+
+        self.assertEqual(add(1, 2), 3)
+        self.assertListEqual(published, [])
+
+    def test_sample_weight_tag(self):
+        reporter = self.make_reporter(Sampler(feature_rates={"add": 0.5}))
+        reporter.session_id = next(
+            session_id
+            for session_id in (str(uuid.uuid4()) for _ in range(1000))
+            if session_position(session_id) < 0.5
+        )
+        reporter.sampler.by_session = True
+        published = []
+        reporter.publish = lambda report, wait=False: published.append(report)
+
+        @reporter.record_call
+        def add(a, b):
+            return a + b
+
+        add(1, 2)
+        reporter.feature_report("add", {})
+        self.assertEqual(len(published), 2)
+        for published_report in published:
+            self.assertIn("sample_weight:2", published_report.tags)
+            self.assertEqual(published_report.tags.count("sample_weight:2"), 1)
+
+    def test_feature_report_is_returned_when_not_sampled(self):
+        reporter = self.make_reporter(Sampler(rate=0.0))
+        published = []
+        reporter.publish = lambda report, wait=False: published.append(report)
+
+        feature_report = reporter.feature_report("feature", {"a": 1})
+        self.assertIn("feature:feature", feature_report.tags)
+        self.assertListEqual(published, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,318 @@
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from benchmarks.stub_server import StubHumbugServer
+
+from . import consent, report
+from .spool import ReportSpool, SEGMENT_SUFFIX
+
+
+def dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def unused_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return "http://127.0.0.1:{}".format(port)
+
+
+def join_spool_replay():
+    for thread in threading.enumerate():
+        if thread.name == "humbug_spool_replay":
+            thread.join(5)
+
+
+class TestReportSpool(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.directory = self.tempdir.name
+        self.body = {"title": "a", "content": "b", "tags": ["c"]}
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def segment_files(self):
+        return sorted(
+            filename
+            for filename in os.listdir(self.directory)
+            if filename.endswith(SEGMENT_SUFFIX)
+        )
+
+    def abandon(self, spool):
+        """
+        Makes the segments of the given spool look like they belong to a process that has died.
+        """
+        spool.close()
+        pid = dead_pid()
+        for filename in self.segment_files():
+            _, _, rest = filename.partition("-")
+            os.rename(
+                os.path.join(self.directory, filename),
+                os.path.join(self.directory, "{}-{}".format(pid, rest)),
+            )
+
+    def test_acked_reports_leave_no_data(self):
+        spool = ReportSpool(self.directory)
+        records = [spool.append("/path", self.body) for _ in range(3)]
+        for record in records:
+            spool.ack(record)
+        spool.close()
+        for filename in self.segment_files():
+            self.assertEqual(os.path.getsize(os.path.join(self.directory, filename)), 0)
+
+    def test_rotation_and_deletion_of_acked_segments(self):
+        spool = ReportSpool(self.directory, max_segment_bytes=200)
+        records = [spool.append("/path", self.body) for _ in range(10)]
+        segments = set(record.segment for record in records)
+        self.assertGreater(len(segments), 1)
+        self.assertEqual(len(self.segment_files()), len(segments))
+
+        for record in records[:-1]:
+            spool.ack(record)
+        # Only the active segment is left
+        self.assertEqual(len(self.segment_files()), 1)
+
+    def test_claim_ignores_segments_of_live_processes(self):
+        spool = ReportSpool(self.directory)
+        spool.append("/path", self.body)
+        spool.sync()
+
+        other_spool = ReportSpool(self.directory)
+        self.assertListEqual(other_spool.claim(), [])
+
+    def test_claim_replays_segments_of_dead_processes(self):
+        spool = ReportSpool(self.directory, max_segment_bytes=200)
+        for i in range(5):
+            spool.append("/path/{}".format(i), self.body)
+        self.abandon(spool)
+
+        new_spool = ReportSpool(self.directory)
+        records = new_spool.claim()
+        self.assertListEqual(
+            [path for _, path, _ in records], ["/path/{}".format(i) for i in range(5)]
+        )
+        for _, _, body in records:
+            self.assertDictEqual(body, self.body)
+
+        # Claimed segments now belong to this process
+        for filename in self.segment_files():
+            self.assertTrue(filename.startswith("{}-".format(os.getpid())))
+
+        for record, _, _ in records:
+            new_spool.ack(record)
+        self.assertListEqual(self.segment_files(), [])
+
+    def test_acked_reports_are_not_replayed(self):
+        spool = ReportSpool(self.directory)
+        records = [spool.append("/path/{}".format(i), self.body) for i in range(4)]
+        spool.ack(records[0])
+        spool.ack(records[2])
+        self.abandon(spool)
+
+        new_spool = ReportSpool(self.directory)
+        claimed = new_spool.claim()
+        self.assertListEqual([path for _, path, _ in claimed], ["/path/1", "/path/3"])
+
+        # Acks of claimed segments are recorded too.
+        new_spool.ack(claimed[0][0])
+        self.abandon(new_spool)
+        claimed = ReportSpool(self.directory).claim()
+        self.assertListEqual([path for _, path, _ in claimed], ["/path/3"])
+
+    def test_append_does_not_fsync(self):
+        synced_on = []
+        real_fsync = os.fsync
+
+        def fsync(fd):
+            synced_on.append(threading.current_thread())
+            real_fsync(fd)
+
+        spool = ReportSpool(self.directory, fsync_every=2, max_segment_bytes=200)
+        with patch("os.fsync", fsync):
+            for _ in range(10):
+                spool.append("/path", self.body)
+            deadline = time.monotonic() + 5
+            while not synced_on and time.monotonic() < deadline:
+                time.sleep(0.01)
+            synced_before_close = list(synced_on)
+            spool.close()
+        self.assertGreater(len(synced_before_close), 0)
+        self.assertNotIn(threading.current_thread(), synced_before_close)
+
+    def test_claim_skips_truncated_records(self):
+        spool = ReportSpool(self.directory)
+        spool.append("/path", self.body)
+        path = spool._active.path
+        spool.close()
+        with open(path, "ab") as ofp:
+            ofp.write(b'{"path": "path", "bo')
+        self.abandon(spool)
+
+        records = ReportSpool(self.directory).claim()
+        self.assertEqual(len(records), 1)
+
+    def test_claim_discards_expired_segments(self):
+        spool = ReportSpool(self.directory)
+        spool.append("/path", self.body)
+        self.abandon(spool)
+        old = time.time() - 3600
+        for filename in self.segment_files():
+            os.utime(os.path.join(self.directory, filename), (old, old))
+
+        new_spool = ReportSpool(self.directory, max_age_seconds=60)
+        self.assertListEqual(new_spool.claim(), [])
+        self.assertListEqual(self.segment_files(), [])
+        self.assertEqual(new_spool.counters.get("spool_dropped"), 1)
+
+    def test_max_bytes(self):
+        spool = ReportSpool(self.directory, max_segment_bytes=200, max_bytes=600)
+        for _ in range(50):
+            spool.append("/path", self.body)
+        total_bytes = sum(
+            os.path.getsize(os.path.join(self.directory, filename))
+            for filename in self.segment_files()
+        )
+        self.assertLessEqual(total_bytes, 600 + 200)
+        self.assertGreater(spool.counters.get("spool_dropped"), 0)
+
+
+class TestReporterSpool(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.server = StubHumbugServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+        self.tempdir.cleanup()
+
+    def test_reports_survive_crash_while_offline(self):
+        # A separate process publishes reports while the Bugout API is unreachable, and then dies
+        # without running its atexit handlers.
+        script = textwrap.dedent(
+            """
+            import os
+            from humbug.consent import HumbugConsent
+            from humbug.report import HumbugReporter
+            from humbug.spool import ReportSpool
+
+            reporter = HumbugReporter(
+                "TestReporterSpool",
+                HumbugConsent(True),
+                bugout_token="humbug-unit-test-token",
+                url={url!r},
+                spool=ReportSpool({directory!r}),
+            )
+            for i in range(5):
+                reporter.custom_report("title {{}}".format(i), "content")
+            reporter.wait()
+            os._exit(1)
+            """
+        ).format(url=unused_url(), directory=self.tempdir.name)
+        package_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        subprocess.run(
+            [sys.executable, "-c", script], cwd=package_directory, check=False
+        )
+        self.assertEqual(self.server.num_reports, 0)
+
+        reporter = report.HumbugReporter(
+            "TestReporterSpool",
+            consent.HumbugConsent(True),
+            bugout_token="humbug-unit-test-token",
+            url=self.server.url,
+            spool=ReportSpool(self.tempdir.name),
+        )
+        deadline = time.monotonic() + 5
+        while self.server.num_reports < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        reporter.wait()
+
+        self.assertSetEqual(
+            set(report["title"] for report in self.server.reports),
+            set("title {}".format(i) for i in range(5)),
+        )
+        self.assertEqual(len(os.listdir(self.tempdir.name)), 0)
+
+    def abandon_reports(self, num_reports):
+        """
+        Leaves reports in the spool, as a process which has died would.
+        """
+        spool = ReportSpool(self.tempdir.name)
+        for i in range(num_reports):
+            spool.append(
+                "/humbug/reports",
+                {"title": "abandoned {}".format(i), "content": "b", "tags": []},
+            )
+        spool.close()
+        pid = dead_pid()
+        for filename in os.listdir(self.tempdir.name):
+            _, _, rest = filename.partition("-")
+            os.rename(
+                os.path.join(self.tempdir.name, filename),
+                os.path.join(self.tempdir.name, "{}-{}".format(pid, rest)),
+            )
+
+    def make_reporter(self, humbug_consent):
+        return report.HumbugReporter(
+            "TestReporterSpool",
+            humbug_consent,
+            bugout_token="humbug-unit-test-token",
+            url=self.server.url,
+            mode=report.Modes.SYNCHRONOUS,
+            spool=ReportSpool(self.tempdir.name),
+        )
+
+    def test_replay_waits_for_consent(self):
+        self.abandon_reports(3)
+        prompt = consent.UserPrompt("Send reports? ", consent.yes, consent.no)
+        # Runs on a background thread, where the user is not prompted.
+        reporter = self.make_reporter(consent.HumbugConsent(prompt))
+        join_spool_replay()
+        self.assertEqual(self.server.num_reports, 0)
+        self.assertEqual(len(os.listdir(self.tempdir.name)), 1)
+
+        prompt.answer = True
+        reporter.custom_report("title", "content")
+        join_spool_replay()
+        self.assertSetEqual(
+            set(report["title"] for report in self.server.reports),
+            {"title", "abandoned 0", "abandoned 1", "abandoned 2"},
+        )
+
+    def test_replay_discards_reports_without_consent(self):
+        self.abandon_reports(3)
+        self.make_reporter(consent.HumbugConsent(False))
+        join_spool_replay()
+        self.assertEqual(self.server.num_reports, 0)
+        self.assertListEqual(os.listdir(self.tempdir.name), [])
+
+    def test_delivered_reports_are_not_replayed(self):
+        spool = ReportSpool(self.tempdir.name)
+        reporter = report.HumbugReporter(
+            "TestReporterSpool",
+            consent.HumbugConsent(True),
+            bugout_token="humbug-unit-test-token",
+            url=self.server.url,
+            mode=report.Modes.BATCH,
+            spool=spool,
+        )
+        for _ in range(5):
+            reporter.custom_report("title", "content")
+        reporter.wait()
+        reporter.batcher.close()
+        self.assertEqual(self.server.num_reports, 5)
+
+        for filename in os.listdir(self.tempdir.name):
+            path = os.path.join(self.tempdir.name, filename)
+            self.assertEqual(os.path.getsize(path), 0)
@@ -0,0 +1,74 @@
+import time
+import unittest
+
+from benchmarks.stub_server import StubHumbugServer
+
+from . import consent, report
+from .transport import HumbugTransport
+
+
+class TestStubHumbugServer(unittest.TestCase):
+    def setUp(self):
+        self.server = StubHumbugServer(seed=0).start()
+        self.transport = HumbugTransport()
+        self.body = {"title": "a", "content": "b", "tags": ["c"]}
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.stop()
+
+    def post(self, path, body=None):
+        if body is None:
+            body = self.body
+        return self.transport.post(self.server.url + path, json=body, timeout=5)
+
+    def test_latency(self):
+        self.server.latency_seconds = 0.1
+        start = time.perf_counter()
+        self.assertEqual(self.post("/humbug/reports").status_code, 200)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.1)
+
+    def test_error_and_throttle_rates(self):
+        self.server.throttle_rate = 1.0
+        self.server.retry_after = "7"
+        response = self.post("/humbug/reports")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "7")
+
+        self.server.throttle_rate = 0.0
+        self.server.error_rate = 1.0
+        self.assertEqual(self.post("/humbug/reports").status_code, 503)
+
+        self.server.error_rate = 0.5
+        for _ in range(100):
+            self.post("/humbug/reports")
+        self.assertEqual(self.server.num_reports, self.server.status_counts[200])
+        self.assertGreater(self.server.status_counts[503], 20)
+        self.assertGreater(self.server.status_counts[200], 20)
+
+    def test_journal_entries(self):
+        self.assertEqual(self.post("/journals/journal-a/entries").status_code, 200)
+        self.assertEqual(
+            self.post("/journals/journal-a/bulk", [self.body, self.body]).status_code,
+            200,
+        )
+        self.assertEqual(self.post("/journals/journal-a/unknown").status_code, 404)
+        self.assertEqual(self.server.num_reports, 3)
+        self.assertEqual(self.server.requests[0]["journal_id"], "journal-a")
+
+    def test_legacy_reporter_publishes_to_journal(self):
+        reporter = report.Reporter(
+            name="TestStubHumbugServer",
+            consent=consent.HumbugConsent(True),
+            bugout_token="humbug-unit-test-token",
+            bugout_journal_id="journal-a",
+            mode=report.Modes.SYNCHRONOUS,
+        )
+        reporter.url = self.server.url
+        reporter.custom_report("title", "content")
+        self.assertEqual(self.server.num_reports, 1)
+        self.assertEqual(self.server.requests[0]["path"], "/journals/journal-a/entries")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+import traceback
+import unittest
+
+from . import consent, report
+from .tracebacks import (
+    CapturedFrame,
+    OmittedFrames,
+    TracebackCapture,
+    collapse_cycles,
+)
+
+
+def recurse(n):
+    if n == 0:
+        raise ValueError("bottom")
+    recurse(n - 1)
+
+
+def ping(n):
+    if n == 0:
+        raise KeyError("ping")
+    pong(n - 1)
+
+
+def pong(n):
+    ping(n)
+
+
+def deep(n):
+    """
+    Raises an exception n frames deep, from n different functions, so that no frames repeat.
+    """
+    function = None
+    for i in range(n):
+        namespace = {"next_function": function}
+        source = "def f(): next_function() if next_function else 1 / 0"
+        exec(compile(source, "<deep {}>".format(i), "exec"), namespace)
+        function = namespace["f"]
+    function()
+
+
+def raise_error(function, *args):
+    try:
+        function(*args)
+    except Exception as e:
+        return e
+    raise AssertionError("{} did not raise".format(function))
+
+
+class TestCollapseCycles(unittest.TestCase):
+    def test_collapse_cycles(self):
+        a = ("a.py", 1, "a")
+        b = ("b.py", 2, "b")
+        c = ("c.py", 3, "c")
+        self.assertEqual(collapse_cycles([a, b, c]), [0, 1, 2])
+        self.assertEqual(collapse_cycles([a, a]), [0, 1])
+        self.assertEqual(
+            collapse_cycles([c, a, a, a, a, b]), [0, 1, OmittedFrames(3, 1), 5]
+        )
+        self.assertEqual(
+            collapse_cycles([c, a, b, a, b, a, b, c]), [0, 1, 2, OmittedFrames(4, 2), 7]
+        )
+
+
+class TestTracebackCapture(unittest.TestCase):
+    def setUp(self):
+        self.capture = TracebackCapture(max_frames=10, max_chain_depth=3)
+
+    def test_matches_python_traceback(self):
+        error = raise_error(recurse, 1)
+        self.assertEqual(
+            self.capture.format(self.capture.capture(error)),
+            "".join(
+                traceback.format_exception(type(error), error, error.__traceback__)
+            ),
+        )
+
+    def test_recursion_is_collapsed(self):
+        error = raise_error(recurse, 500)
+        captured = self.capture.capture(error)
+        entries = captured.chain[0].entries
+        self.assertLessEqual(len(entries), 5)
+        self.assertIn(OmittedFrames(499, 1), entries)
+        formatted = self.capture.format(captured)
+        self.assertIn("[Previous line repeated 499 more times]", formatted)
+        self.assertIn("ValueError: bottom", formatted)
+
+        error = raise_error(ping, 300)
+        formatted = self.capture.format(self.capture.capture(error))
+        self.assertIn("[Previous 2 frames repeated 299 more times]", formatted)
+
+    def test_frames_are_capped(self):
+        error = raise_error(deep, 200)
+        captured = self.capture.capture(error)
+        entries = captured.chain[0].entries
+        frames = [entry for entry in entries if isinstance(entry, CapturedFrame)]
+        self.assertEqual(len(frames), 10)
+        omitted = sum(
+            entry.count for entry in entries if isinstance(entry, OmittedFrames)
+        )
+        self.assertEqual(len(frames) + omitted, 202)
+        # The outermost and innermost frames are kept.
+        self.assertEqual(frames[0].name, "raise_error")
+        self.assertEqual(frames[-1].filename, "<deep 0>")
+        self.assertIn("[192 frames omitted]", self.capture.format(captured))
+
+    def test_chain_is_capped(self):
+        def chain(n):
+            if n == 0:
+                raise ValueError("first")
+            try:
+                chain(n - 1)
+            except ValueError as e:
+                raise ValueError("after {}".format(n)) from e
+
+        error = raise_error(chain, 5)
+        captured = self.capture.capture(error)
+        self.assertEqual(len(captured.chain), 3)
+        self.assertEqual(captured.omitted_chained, 3)
+        self.assertEqual(captured.chain[-1].message, "after 5")
+        formatted = self.capture.format(captured)
+        self.assertIn("[3 earlier chained exceptions omitted]", formatted)
+        self.assertIn("direct cause", formatted)
+        self.assertNotIn("first", formatted)
+
+    def test_context(self):
+        def handle():
+            try:
+                raise KeyError("handled")
+            except KeyError:
+                raise ValueError("while handling")
+
+        formatted = self.capture.format(self.capture.capture(raise_error(handle)))
+        self.assertIn("KeyError: 'handled'", formatted)
+        self.assertIn("During handling of the above exception", formatted)
+
+    def test_locals(self):
+        capture = TracebackCapture(capture_locals=True, max_locals=2)
+
+        def fail(big, small):
+            raise ValueError("locals")
+
+        error = raise_error(fail, list(range(1000)), 42)
+        captured = capture.capture(error)
+        frame = captured.chain[0].entries[-1]
+        self.assertEqual(frame.locals["small"], "42")
+        self.assertLessEqual(len(frame.locals["big"]), 100)
+        self.assertIn("    small = 42\n", capture.format(captured))
+
+    def test_message_is_truncated(self):
+        capture = TracebackCapture(max_message_length=15)
+        captured = capture.capture(raise_error(recurse, 0))
+        self.assertEqual(captured.summary, "ValueError('...")
+
+    def test_error_report(self):
+        reporter = report.HumbugReporter(
+            name="TestReporter",
+            consent=consent.HumbugConsent(True),
+            traceback_capture=self.capture,
+        )
+        error_report = reporter.error_report(raise_error(recurse, 500), publish=False)
+        self.assertIn("[Previous line repeated", error_report.content)
+        self.assertLess(len(error_report.content), 2000)
+
+
+if __name__ == "__main__":
+    unittest.main()
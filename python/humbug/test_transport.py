@@ -0,0 +1,138 @@
+from concurrent.futures import ThreadPoolExecutor
+import unittest
+
+from benchmarks.stub_server import StubHumbugServer
+
+from . import consent, report
+from .lazy_imports import optional_import
+from .transport import compress, HumbugTransport
+
+
+class TestHumbugTransport(unittest.TestCase):
+    def setUp(self):
+        self.server = StubHumbugServer().start()
+        self.url = "{}/humbug/reports".format(self.server.url)
+        self.body = {"title": "a", "content": "b", "tags": ["c"]}
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_reuses_connection(self):
+        transport = HumbugTransport()
+        for _ in range(20):
+            response = transport.post(self.url, json=self.body, timeout=5)
+            self.assertEqual(response.status_code, 200)
+        transport.close()
+
+        self.assertEqual(self.server.num_requests, 20)
+        self.assertEqual(self.server.num_connections, 1)
+
+    def test_shared_between_threads(self):
+        pool_size = 4
+        transport = HumbugTransport(pool_size=pool_size, pool_block=True)
+
+        def post_reports(_):
+            return [
+                transport.post(self.url, json=self.body, timeout=5).status_code
+                for _ in range(10)
+            ]
+
+        with ThreadPoolExecutor(max_workers=pool_size) as executor:
+            statuses = [
+                status
+                for thread_statuses in executor.map(post_reports, range(pool_size))
+                for status in thread_statuses
+            ]
+        transport.close()
+
+        self.assertEqual(statuses, [200] * 10 * pool_size)
+        self.assertLessEqual(self.server.num_connections, pool_size)
+
+    def test_reporter_publishes_through_transport(self):
+        transport = HumbugTransport()
+        reporter = report.HumbugReporter(
+            name="TestHumbugTransport",
+            consent=consent.HumbugConsent(True),
+            bugout_token="humbug-unit-test-token",
+            url=self.server.url,
+            mode=report.Modes.SYNCHRONOUS,
+            transport=transport,
+        )
+        for _ in range(5):
+            reporter.custom_report("title", "content")
+
+        self.assertEqual(self.server.num_reports, 5)
+        self.assertEqual(self.server.num_connections, 1)
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.server = StubHumbugServer().start()
+        self.url = "{}/humbug/reports".format(self.server.url)
+        self.body = {"title": "a", "content": "b" * 10000, "tags": ["c"]}
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_gzip(self):
+        transport = HumbugTransport(compression="gzip")
+        headers = {"Authorization": "Bearer token"}
+        response = transport.post(self.url, headers=headers, json=self.body, timeout=5)
+        self.assertEqual(response.status_code, 200)
+        self.assertDictEqual(self.server.reports[0], self.body)
+        self.assertEqual(self.server.requests[0]["headers"]["Content-Encoding"], "gzip")
+        self.assertLess(self.server.received_bytes, 1000)
+        # The caller's headers are not modified.
+        self.assertDictEqual(headers, {"Authorization": "Bearer token"})
+
+    def test_zstd(self):
+        zstandard = optional_import("zstandard")
+        if zstandard is None:
+            self.skipTest("zstandard is not installed")
+        body = b"a" * 10000
+        compressed = compress(body, "zstd")
+        self.assertIsInstance(compressed, bytes)
+        self.assertLess(len(compressed), len(body))
+        self.assertEqual(zstandard.ZstdDecompressor().decompress(compressed), body)
+
+        transport = HumbugTransport(compression="zstd")
+        response = transport.post(self.url, json=self.body, timeout=5)
+        self.assertEqual(response.status_code, 200)
+        self.assertDictEqual(self.server.reports[0], self.body)
+        self.assertEqual(self.server.requests[0]["headers"]["Content-Encoding"], "zstd")
+
+    def test_small_bodies_are_not_compressed(self):
+        transport = HumbugTransport(
+            compression="gzip", compression_threshold_bytes=100000
+        )
+        transport.post(self.url, json=self.body, timeout=5)
+        self.assertNotIn("Content-Encoding", self.server.requests[0]["headers"])
+        self.assertDictEqual(self.server.reports[0], self.body)
+
+    def test_falls_back_when_server_rejects_compression(self):
+        self.server.accept_compression = False
+        transport = HumbugTransport(compression="gzip")
+        for _ in range(2):
+            response = transport.post(self.url, json=self.body, timeout=5)
+            self.assertEqual(response.status_code, 200)
+        self.assertIsNone(transport.compression)
+        self.assertEqual(self.server.num_reports, 2)
+
+    def test_unknown_compression(self):
+        with self.assertRaises(ValueError):
+            HumbugTransport(compression="brotli")
+
+    def test_compact_metrics_report(self):
+        reporter = report.HumbugReporter(
+            name="TestCompression", consent=consent.HumbugConsent(True)
+        )
+        pretty = reporter.metrics_report(processes_flag=False, publish=False)
+        compact = reporter.metrics_report(
+            processes_flag=False, publish=False, compact=True
+        )
+        self.assertLess(len(compact.content), len(pretty.content))
+        self.assertNotIn("\n    ", compact.content)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+
+from . import blacklist, consent, report
+from .truncation import ParameterFormatter, truncate
+
+
+class FakeArray:
+    """
+    Stands in for a large numpy array or pandas data frame.
+    """
+
+    shape = (1000000, 3)
+
+    def __str__(self):
+        raise AssertionError("Large arrays should not be converted to strings")
+
+
+class TestParameterFormatter(unittest.TestCase):
+    def setUp(self):
+        self.formatter = ParameterFormatter(
+            max_value_length=20, max_parameters_length=30, max_items=3
+        )
+
+    def test_truncate(self):
+        self.assertEqual(truncate("abc", 3), "abc")
+        self.assertEqual(truncate("abcdef", 5), "ab...")
+
+    def test_format(self):
+        self.assertEqual(self.formatter.format("lol"), "lol")
+        self.assertEqual(self.formatter.format(42), "42")
+        self.assertEqual(self.formatter.format(None), "None")
+        self.assertEqual(self.formatter.format("x" * 100), "x" * 17 + "...")
+        self.assertEqual(self.formatter.format([1, 2]), "[1, 2]")
+        self.assertEqual(self.formatter.format(list(range(100))), "[0, 1, 2, ...]")
+        self.assertEqual(self.formatter.format(b"x" * 100), "<bytes len=100>")
+        self.assertEqual(
+            self.formatter.format(FakeArray()), "<FakeArray shape=(1000000, 3)>"
+        )
+        self.assertEqual(self.formatter.format([FakeArray()])[:11], "[<FakeArray")
+
+    def test_format_parameters(self):
+        parameters = {"a": "x" * 100, "b": 1, "c": "y" * 100, "d": 2}
+        formatted, num_omitted = self.formatter.format_parameters(parameters)
+        self.assertListEqual(formatted, [("a", "x" * 17 + "..."), ("b", "1")])
+        self.assertEqual(num_omitted, 2)
+
+    def test_format_parameters_with_keys_which_are_not_strings(self):
+        formatted, num_omitted = self.formatter.format_parameters({0: "a", None: 1})
+        self.assertListEqual(formatted, [("0", "a"), ("None", "1")])
+        self.assertEqual(num_omitted, 0)
+
+
+class TestReporterParameterBudgets(unittest.TestCase):
+    def setUp(self):
+        self.reporter = report.HumbugReporter(
+            "TestReporterParameterBudgets",
+            consent.HumbugConsent(True),
+            mode=report.Modes.SYNCHRONOUS,
+            parameter_formatter=ParameterFormatter(
+                max_value_length=20, max_parameters_length=80
+            ),
+        )
+
+    def test_feature_report(self):
+        feature_report = self.reporter.feature_report(
+            "feature",
+            {"array": FakeArray(), "text": "z" * 1000, "extra": "z" * 40},
+            publish=False,
+        )
+        self.assertIn(
+            "parameter:array=<FakeArray shape=(1000000, 3)>", feature_report.tags
+        )
+        self.assertIn("parameter:text={}...".format("z" * 17), feature_report.tags)
+        self.assertIn("parameters_omitted:1", feature_report.tags)
+        self.assertIn("1 more parameters were omitted.", feature_report.content)
+
+    def test_record_call(self):
+        published = []
+        self.reporter.publish = lambda report, wait=False: published.append(report)
+
+        @self.reporter.record_call
+        def process(frame):
+            return frame.shape
+
+        process(FakeArray())
+        self.assertIn(
+            "parameter:arg.0=<FakeArray shape=(1000000, 3)>", published[0].tags
+        )
+
+    def test_blacklist_does_not_convert_large_values_in_full(self):
+        for blacklist_fn in (
+            blacklist.generate_filter_parameters_by_key_fn(["password"]),
+            blacklist.generate_filter_parameters_by_key_inner_fn(["password"]),
+            blacklist.generate_filter_parameters_fn(["password"]),
+        ):
+            self.reporter.blacklist_fn = blacklist_fn
+            feature_report = self.reporter.feature_report(
+                "feature",
+                {
+                    "password": "hunter2",
+                    "array": FakeArray(),
+                    "items": list(range(2000000)),
+                    "nested": {"array": FakeArray()},
+                },
+                publish=False,
+            )
+            self.assertIn("parameter:array=<FakeArray shape=...", feature_report.tags)
+            self.assertTrue(
+                any(tag.startswith("parameter:items=[") for tag in feature_report.tags)
+            )
+            self.assertNotIn("hunter2", feature_report.content)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import time
+import unittest
+
+from . import utils
+
+psutil = None
+
+try:
+    import psutil  # type: ignore
+except ImportError:
+    pass
+
+
+class FakeMemoryInfo:
+    def __init__(self, rss):
+        self.rss = rss
+
+
+class FakeProcess:
+    def __init__(self, name, cpu_percent, rss_MB):
+        memory_info = None if rss_MB is None else FakeMemoryInfo(rss_MB * 1024 * 1024)
+        self.info = {
+            "name": name,
+            "cpu_percent": cpu_percent,
+            "memory_info": memory_info,
+        }
+
+
+class TestProcessesMetrics(unittest.TestCase):
+    def setUp(self):
+        self.processes = [
+            FakeProcess("a", 1.0, 10),
+            FakeProcess("a", 2.0, 20),
+            FakeProcess("b", 50.0, 1),
+            FakeProcess("c", 0.5, 100),
+            # Values which the process_iter pass could not read
+            FakeProcess("d", None, None),
+        ]
+
+    def test_groups_by_name(self):
+        metrics = utils.get_processes_metrics(processes=self.processes)
+        self.assertDictEqual(
+            metrics["a"],
+            {"cpu_percent": 3.0, "memory_MB": 30.0, "amount_of_processes": 2},
+        )
+        self.assertDictEqual(
+            metrics["d"],
+            {"cpu_percent": 0.0, "memory_MB": 0.0, "amount_of_processes": 1},
+        )
+
+    def test_top_n(self):
+        metrics = utils.get_processes_metrics(top_n=2, processes=self.processes)
+        self.assertListEqual(list(metrics), ["b", "a", utils.OTHER_PROCESSES])
+        self.assertEqual(metrics[utils.OTHER_PROCESSES]["amount_of_processes"], 2)
+        self.assertEqual(metrics[utils.OTHER_PROCESSES]["memory_MB"], 100.0)
+
+        metrics = utils.get_processes_metrics(
+            top_n=1, sort_by="memory_MB", processes=self.processes
+        )
+        self.assertListEqual(list(metrics), ["c", utils.OTHER_PROCESSES])
+
+    def test_invalid_sort_by(self):
+        with self.assertRaises(ValueError):
+            utils.get_processes_metrics(sort_by="name", processes=self.processes)
+
+    @unittest.skipIf(psutil is None, "psutil is not installed")
+    def test_running_processes(self):
+        metrics = utils.get_processes_metrics(top_n=5)
+        self.assertLessEqual(len(metrics), 6)
+
+
+@unittest.skipIf(psutil is None, "psutil is not installed")
+class TestMetricsCollector(unittest.TestCase):
+    def test_process_cpu_is_measured_since_creation(self):
+        collector = utils.MetricsCollector(ttl_seconds=0)
+        deadline = time.monotonic() + 0.2
+        while time.monotonic() < deadline:
+            pass
+        self.assertGreater(collector.cpu_metrics()["cpu_load_by_process"], 0)
+
+    def test_first_cpu_measurement_waits_for_interval(self):
+        collector = utils.MetricsCollector(min_cpu_interval_seconds=0.05)
+        start = time.monotonic()
+        collector.cpu_metrics()
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+    def test_metrics_are_cached(self):
+        collector = utils.MetricsCollector(ttl_seconds=60)
+        self.assertIs(collector.memory_metrics(), collector.memory_metrics())
+
+        collector = utils.MetricsCollector(ttl_seconds=0)
+        self.assertIsNot(collector.memory_metrics(), collector.memory_metrics())
+
+    def test_rates(self):
+        collector = utils.MetricsCollector(ttl_seconds=0)
+        network_metrics = collector.network_metrics()
+        self.assertIn("MB_sent_per_s", network_metrics)
+        self.assertGreaterEqual(network_metrics["MB_sent_per_s"], 0)
+
+        if psutil.disk_io_counters() is not None:
+            self.assertIn("read_MB_per_s", collector.disk_metrics())
+
+    def test_thread_metrics(self):
+        collector = utils.MetricsCollector()
+        self.assertEqual(
+            collector.thread_metrics()["total"], len(collector.process.threads())
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,311 @@
+"""
+This module implements structured capture of exception tracebacks for error reports, with limits on
+their size, so that errors with very deep stacks (like RecursionError) or long chains of exceptions
+are cheap to capture, format and send.
+"""
+from dataclasses import dataclass, field
+import linecache
+import sys
+from types import FrameType, TracebackType
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from .truncation import ParameterFormatter, truncate
+
+# (file name, line number, function name)
+FrameKey = Tuple[str, int, str]
+
+# Formatted frames, shared between reports. Errors tend to be raised from the same places over and
+# over, so their frames are only formatted (and their source lines looked up) once.
+_formatted_frames: Dict[FrameKey, str] = {}
+_MAX_FORMATTED_FRAMES = 4096
+
+
+@dataclass
+class CapturedFrame:
+    filename: str
+    lineno: int
+    name: str
+    # String representations of the frame's local variables, if they were captured.
+    locals: Optional[Dict[str, str]] = None
+
+
+@dataclass
+class OmittedFrames:
+    """
+    Frames which were left out of a traceback. If cycle_length is positive, they repeat the
+    cycle_length frames before them (as in a recursion). Otherwise, they were left out because the
+    traceback had too many frames.
+    """
+
+    count: int
+    cycle_length: int = 0
+
+
+@dataclass
+class CapturedException:
+    type_name: str
+    message: str
+    entries: List[Union[CapturedFrame, OmittedFrames]] = field(default_factory=list)
+    # How this exception led to the next one in the chain: "cause" (raise ... from) or "context"
+    # (raised while handling it).
+    relation: Optional[str] = None
+
+
+@dataclass
+class CapturedError:
+    """
+    An exception and the exceptions chained to it, oldest first (so the reported exception is the
+    last one).
+    """
+
+    summary: str
+    chain: List[CapturedException] = field(default_factory=list)
+    # Number of older exceptions in the chain which were left out.
+    omitted_chained: int = 0
+
+
+def type_name(error_type: type) -> str:
+    module = error_type.__module__
+    if module in ("__main__", "builtins"):
+        return error_type.__qualname__
+    return "{}.{}".format(module, error_type.__qualname__)
+
+
+def collapse_cycles(
+    keys: List[FrameKey], max_cycle_length: int = 8, min_repeats: int = 3
+) -> List[Union[int, OmittedFrames]]:
+    """
+    Collapses runs of at least min_repeats repetitions of the same sequence of (at most
+    max_cycle_length) frames into a single repetition, followed by an OmittedFrames. Returns the
+    indices of the frames which are kept, and the OmittedFrames, in order.
+    """
+    entries: List[Union[int, OmittedFrames]] = []
+    i = 0
+    n = len(keys)
+    while i < n:
+        collapsed = False
+        for cycle_length in range(1, max_cycle_length + 1):
+            if i + cycle_length * min_repeats > n:
+                break
+            if keys[i + cycle_length] != keys[i]:
+                continue
+            end = i + cycle_length
+            while end + cycle_length <= n and (
+                keys[end : end + cycle_length] == keys[i : i + cycle_length]
+            ):
+                end += cycle_length
+            repeats = (end - i) // cycle_length
+            if repeats >= min_repeats:
+                entries.extend(range(i, i + cycle_length))
+                entries.append(
+                    OmittedFrames((repeats - 1) * cycle_length, cycle_length)
+                )
+                i = end
+                collapsed = True
+                break
+        if not collapsed:
+            entries.append(i)
+            i += 1
+    return entries
+
+
+class TracebackCapture:
+    """
+    Captures exceptions and their tracebacks as CapturedErrors, and formats them like Python does.
+
+    Capturing an exception only walks its traceback. Source lines are looked up, and frames
+    formatted, by format. Repeated sequences of frames (from recursion) are collapsed, and at most
+    max_frames frames are kept per exception - the outermost and innermost ones. At most
+    max_chain_depth exceptions of a chain (of causes and contexts) are captured.
+
+    If capture_locals is True, the local variables of every function frame which is kept are captured
+    too, as strings formatted by formatter (at most max_locals per frame).
+    """
+
+    def __init__(
+        self,
+        max_frames: int = 100,
+        max_chain_depth: int = 5,
+        max_message_length: int = 1000,
+        capture_locals: bool = False,
+        max_locals: int = 20,
+        formatter: Optional[ParameterFormatter] = None,
+    ) -> None:
+        self.max_frames = max_frames
+        self.max_chain_depth = max_chain_depth
+        self.max_message_length = max_message_length
+        self.capture_locals = capture_locals
+        self.max_locals = max_locals
+        if formatter is None:
+            formatter = ParameterFormatter(max_value_length=100)
+        self.formatter = formatter
+
+    def _message(self, error: BaseException) -> str:
+        try:
+            return truncate(str(error), self.max_message_length)
+        except Exception:
+            return "<exception str() failed>"
+
+    def _locals(self, frame: FrameType) -> Dict[str, str]:
+        frame_locals: Dict[str, str] = {}
+        for name, value in frame.f_locals.items():
+            if len(frame_locals) >= self.max_locals:
+                break
+            try:
+                frame_locals[name] = self.formatter.format(value)
+            except Exception:
+                frame_locals[name] = "<unrepresentable>"
+        return frame_locals
+
+    def _capture_exception(
+        self, error: BaseException, tb: Optional[TracebackType]
+    ) -> CapturedException:
+        frames: List[Tuple[FrameType, int]] = []
+        keys: List[FrameKey] = []
+        while tb is not None:
+            code = tb.tb_frame.f_code
+            frames.append((tb.tb_frame, tb.tb_lineno))
+            keys.append((code.co_filename, tb.tb_lineno, code.co_name))
+            tb = tb.tb_next
+
+        collapsed = collapse_cycles(keys)
+        num_frames = sum(1 for entry in collapsed if isinstance(entry, int))
+        if num_frames > self.max_frames:
+            # Keeps the outermost and innermost frames (and the repetitions which follow them).
+            head = self.max_frames // 2
+            tail_start = num_frames - (self.max_frames - head)
+            capped: List[Union[int, OmittedFrames]] = []
+            num_seen = 0
+            num_omitted = 0
+            keep = True
+            for entry in collapsed:
+                if isinstance(entry, int):
+                    keep = num_seen < head or num_seen >= tail_start
+                    if keep and num_omitted:
+                        capped.append(OmittedFrames(num_omitted))
+                        num_omitted = 0
+                    num_seen += 1
+                if keep:
+                    capped.append(entry)
+                elif isinstance(entry, int):
+                    num_omitted += 1
+                else:
+                    num_omitted += entry.count
+            collapsed = capped
+
+        captured = CapturedException(type_name(type(error)), self._message(error))
+        for entry in collapsed:
+            if isinstance(entry, OmittedFrames):
+                captured.entries.append(entry)
+                continue
+            frame, lineno = frames[entry]
+            filename, _, name = keys[entry]
+            captured_frame = CapturedFrame(sys.intern(filename), lineno, name)
+            # The locals of a module are its globals, which are rarely useful in a report.
+            if self.capture_locals and name != "<module>":
+                captured_frame.locals = self._locals(frame)
+            captured.entries.append(captured_frame)
+        return captured
+
+    def capture(
+        self, error: BaseException, tb: Optional[TracebackType] = None
+    ) -> CapturedError:
+        """
+        Captures an exception, with the given traceback (by default, its __traceback__), and the
+        exceptions chained to it.
+        """
+        if tb is None:
+            tb = error.__traceback__
+        try:
+            summary = truncate(repr(error), self.max_message_length)
+        except Exception:
+            summary = "<exception repr() failed>"
+        captured = CapturedError(summary)
+
+        chain = [self._capture_exception(error, tb)]
+        seen: Set[int] = {id(error)}
+        current: Optional[BaseException] = error
+        while current is not None:
+            relation = "cause"
+            chained = current.__cause__
+            if chained is None and not current.__suppress_context__:
+                relation = "context"
+                chained = current.__context__
+            if chained is None or id(chained) in seen:
+                break
+            if len(chain) >= self.max_chain_depth:
+                # Counts the rest of the chain without capturing it.
+                captured.omitted_chained += 1
+            else:
+                captured_chained = self._capture_exception(
+                    chained, chained.__traceback__
+                )
+                captured_chained.relation = relation
+                chain.append(captured_chained)
+            seen.add(id(chained))
+            current = chained
+        chain.reverse()
+        captured.chain = chain
+        return captured
+
+    def _format_frame(self, frame: CapturedFrame) -> str:
+        key = (frame.filename, frame.lineno, frame.name)
+        formatted = _formatted_frames.get(key)
+        if formatted is None:
+            formatted = '  File "{}", line {}, in {}\n'.format(*key)
+            line = linecache.getline(frame.filename, frame.lineno).strip()
+            if line:
+                formatted += "    {}\n".format(line)
+            if len(_formatted_frames) >= _MAX_FORMATTED_FRAMES:
+                _formatted_frames.clear()
+            _formatted_frames[key] = formatted
+        if not frame.locals:
+            return formatted
+        return formatted + "".join(
+            "    {} = {}\n".format(name, value) for name, value in frame.locals.items()
+        )
+
+    def format(self, captured: CapturedError) -> str:
+        """
+        Formats a captured error like traceback.format_exception does.
+        """
+        lines: List[str] = []
+        if captured.omitted_chained:
+            lines.append(
+                "[{} earlier chained exceptions omitted]\n\n".format(
+                    captured.omitted_chained
+                )
+            )
+        for exception in captured.chain:
+            if exception.entries:
+                lines.append("Traceback (most recent call last):\n")
+            for entry in exception.entries:
+                if isinstance(entry, CapturedFrame):
+                    lines.append(self._format_frame(entry))
+                elif entry.cycle_length == 1:
+                    lines.append(
+                        "  [Previous line repeated {} more times]\n".format(entry.count)
+                    )
+                elif entry.cycle_length:
+                    lines.append(
+                        "  [Previous {} frames repeated {} more times]\n".format(
+                            entry.cycle_length, entry.count // entry.cycle_length
+                        )
+                    )
+                else:
+                    lines.append("  [{} frames omitted]\n".format(entry.count))
+            if exception.message:
+                lines.append("{}: {}\n".format(exception.type_name, exception.message))
+            else:
+                lines.append("{}\n".format(exception.type_name))
+            if exception.relation == "cause":
+                lines.append(
+                    "\nThe above exception was the direct cause of the following "
+                    "exception:\n\n"
+                )
+            elif exception.relation == "context":
+                lines.append(
+                    "\nDuring handling of the above exception, another exception "
+                    "occurred:\n\n"
+                )
+        return "".join(lines)
@@ -0,0 +1,158 @@
+"""
+This module implements the HTTP transport that Humbug reporters use to send reports to the Bugout
+API.
+"""
+import gzip
+import json as jsonlib
+import threading
+from typing import Any, Dict, Optional
+
+from .lazy_imports import optional_import
+
+COMPRESSIONS = ("gzip", "zstd")
+
+
+def compress(body: bytes, compression: str, level: Optional[int] = None) -> bytes:
+    if compression == "gzip":
+        return gzip.compress(body, compresslevel=6 if level is None else level)
+    if compression == "zstd":
+        zstandard = optional_import("zstandard")
+        if zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        return compressor.compress(body)  # type: ignore
+    raise ValueError("Unknown compression: {}".format(compression))
+
+
+class HumbugTransport:
+    """
+    Sends HTTP requests over persistent (keep-alive) connections, so that publishing a report does
+    not require a new TCP connection and TLS handshake every time.
+
+    All threads share a single connection pool of up to pool_size connections per host. Every
+    thread gets its own requests.Session mounted on that pool, because requests sessions are not
+    guaranteed to be safe to share between threads.
+
+    If compression is "gzip" or "zstd" (which requires the zstandard package), request bodies of at
+    least compression_threshold_bytes are compressed and sent with a Content-Encoding header. If the
+    server answers a compressed request with 415 Unsupported Media Type, the request is sent again
+    uncompressed, and the transport stops compressing requests.
+
+    To customize how reports are sent (proxies, certificates, a different HTTP library), subclass
+    this and override the post method.
+
+    requests is imported when the transport is created, rather than when humbug is imported. It
+    is not imported by the first request, because that request is sent from a background thread:
+    if the process forked while that thread was still importing requests, the child process would
+    be left with a half-imported module. The connection pool is created when the first request is
+    sent.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        pool_block: bool = False,
+        compression: Optional[str] = None,
+        compression_threshold_bytes: int = 1024,
+        compression_level: Optional[int] = None,
+    ) -> None:
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError("Unknown compression: {}".format(compression))
+        if compression == "zstd" and optional_import("zstandard") is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        self.compression = compression
+        self.compression_threshold_bytes = compression_threshold_bytes
+        self.compression_level = compression_level
+
+        import requests  # type: ignore
+        from requests.adapters import HTTPAdapter  # type: ignore
+
+        self._requests = requests
+        self._http_adapter = HTTPAdapter
+
+        self.pool_size = pool_size
+        self.pool_block = pool_block
+        self._adapter: Any = None
+        self._adapter_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _get_adapter(self) -> Any:
+        with self._adapter_lock:
+            if self._adapter is None:
+                self._adapter = self._http_adapter(
+                    pool_connections=self.pool_size,
+                    pool_maxsize=self.pool_size,
+                    pool_block=self.pool_block,
+                )
+            return self._adapter
+
+    def session(self) -> Any:
+        """
+        Returns the requests.Session for the current thread.
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            adapter = self._get_adapter()
+            session = self._requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+        return session
+
+    def post(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        json: Optional[Any] = None,
+        data: Optional[bytes] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        compression = self.compression
+        if compression is None:
+            return self.session().post(
+                url=url, headers=headers, json=json, data=data, timeout=timeout
+            )
+
+        request_headers = dict(headers) if headers is not None else {}
+        if json is not None:
+            data = jsonlib.dumps(json, separators=(",", ":")).encode("utf-8")
+            request_headers["Content-Type"] = "application/json"
+        if data is None or len(data) < self.compression_threshold_bytes:
+            return self.session().post(
+                url=url, headers=request_headers, data=data, timeout=timeout
+            )
+
+        compressed_headers = dict(request_headers)
+        compressed_headers["Content-Encoding"] = compression
+        response = self.session().post(
+            url=url,
+            headers=compressed_headers,
+            data=compress(data, compression, self.compression_level),
+            timeout=timeout,
+        )
+        if response.status_code != 415:
+            return response
+
+        # The server does not accept compressed requests.
+        self.compression = None
+        return self.session().post(
+            url=url, headers=request_headers, data=data, timeout=timeout
+        )
+
+    def after_fork(self) -> None:
+        """
+        Called in a child process after a fork. The pooled connections belong to the parent process,
+        so the child opens its own.
+        """
+        self._adapter = None
+        self._adapter_lock = threading.Lock()
+        self._local = threading.local()
+
+    def close(self) -> None:
+        """
+        Closes all pooled connections. The transport can still be used afterwards, but it will need
+        to open new connections.
+        """
+        with self._adapter_lock:
+            if self._adapter is not None:
+                self._adapter.close()
@@ -0,0 +1,131 @@
+"""
+This module implements bounded string conversion of parameter values, so that reporting a call with
+a huge argument (like a large array or data frame) does not convert the whole argument to a string.
+"""
+import reprlib
+from typing import Any, Dict, List, Tuple
+
+# Appended to values which were truncated.
+ELLIPSIS = "..."
+
+# Types whose values are converted to strings directly, since that is cheap.
+_SCALAR_TYPES = (bool, int, float, complex, type(None))
+
+
+def truncate(value: str, max_length: int) -> str:
+    if len(value) <= max_length:
+        return value
+    return value[: max(max_length - len(ELLIPSIS), 0)] + ELLIPSIS
+
+
+def summarize(value: Any) -> str:
+    """
+    Describes a large object by its type and size, for objects that have a shape (like numpy arrays,
+    pandas data frames and tensors) or a length.
+    """
+    description = type(value).__name__
+    shape = getattr(value, "shape", None)
+    if shape is not None:
+        description += " shape={}".format(tuple(shape))
+    else:
+        try:
+            description += " len={}".format(len(value))
+        except Exception:
+            pass
+    return "<{}>".format(description)
+
+
+class _Repr(reprlib.Repr):
+    """
+    reprlib.Repr which summarizes (instead of converting to strings) the objects inside containers
+    that have a shape.
+    """
+
+    def repr_instance(self, x: Any, level: int) -> str:
+        if getattr(type(x), "shape", None) is not None:
+            return summarize(x)
+        return super().repr_instance(x, level)
+
+
+class ParameterFormatter:
+    """
+    Converts parameter values to strings of at most max_value_length characters.
+
+    Strings and numbers are converted with str and truncated. Lists, tuples, sets and dictionaries
+    are converted with reprlib, showing at most max_items items of each, max_depth levels deep.
+    Objects with a shape (like numpy arrays, pandas data frames and tensors), and bytes longer than
+    max_value_length, are summarized by their type and size. Other objects are converted with str
+    and truncated.
+
+    format_parameters also limits the total length of a report's parameters to
+    max_parameters_length characters.
+    """
+
+    def __init__(
+        self,
+        max_value_length: int = 256,
+        max_parameters_length: int = 4096,
+        max_items: int = 10,
+        max_depth: int = 3,
+    ) -> None:
+        self.max_value_length = max_value_length
+        self.max_parameters_length = max_parameters_length
+        self._repr = _Repr()
+        self._repr.maxlevel = max_depth
+        self._repr.maxstring = max_value_length
+        self._repr.maxother = max_value_length
+        self._repr.maxlong = max_value_length
+        for attribute in (
+            "maxdict",
+            "maxlist",
+            "maxtuple",
+            "maxset",
+            "maxfrozenset",
+            "maxdeque",
+            "maxarray",
+        ):
+            setattr(self._repr, attribute, max_items)
+        # Whether values of a given type are summarized rather than converted to strings.
+        self._is_summarized: Dict[type, bool] = {}
+
+    def _summarizes(self, value_type: type) -> bool:
+        is_summarized = self._is_summarized.get(value_type)
+        if is_summarized is None:
+            is_summarized = getattr(value_type, "shape", None) is not None
+            self._is_summarized[value_type] = is_summarized
+        return is_summarized
+
+    def format(self, value: Any) -> str:
+        value_type = type(value)
+        if value_type is str:
+            return truncate(value, self.max_value_length)
+        if value_type in _SCALAR_TYPES:
+            return truncate(str(value), self.max_value_length)
+        if self._summarizes(value_type):
+            return summarize(value)
+        if isinstance(value, (bytes, bytearray)) and len(value) > self.max_value_length:
+            return summarize(value)
+        if isinstance(value, (list, tuple, set, frozenset, dict)):
+            return truncate(self._repr.repr(value), self.max_value_length)
+        return truncate(str(value), self.max_value_length)
+
+    def format_parameters(
+        self, parameters: Dict[str, Any]
+    ) -> Tuple[List[Tuple[str, str]], int]:
+        """
+        Formats parameters, in order, until their total length (of keys and values) would exceed
+        max_parameters_length. Returns the formatted parameters and the number of parameters which
+        were left out. Keys which are not strings (as blacklist functions can return) are converted
+        to strings.
+        """
+        formatted: List[Tuple[str, str]] = []
+        length = 0
+        for i, (key, value) in enumerate(parameters.items()):
+            if type(key) is not str:
+                key = str(key)
+            formatted_value = self.format(value)
+            length += len(key) + len(formatted_value)
+            if length > self.max_parameters_length:
+                return formatted, len(parameters) - i
+            formatted.append((key, formatted_value))
+        return formatted, 0
@@ -1,9 +1,11 @@
 import os
+import threading
+import time
 import types
 import sys
 
 
-def get_cpu_metrics():
+def get_cpu_metrics(process=None):
     cpu_metrics = {}
 
     import psutil
@@ -13,9 +15,9 @@ def get_cpu_metrics():
     cpu_metrics["cpu_count_physical"] = psutil.cpu_count(logical=False)
     cpu_metrics["cpu_percent"] = psutil.cpu_percent()
     cpu_metrics["cpu_percent_per_core"] = psutil.cpu_percent(percpu=True)
-    current_pid = os.getpid()
-    current_process = psutil.Process(current_pid)
-    cpu_metrics["cpu_load_by_process"] = current_process.cpu_percent()
+    if process is None:
+        process = psutil.Process(os.getpid())
+    cpu_metrics["cpu_load_by_process"] = process.cpu_percent()
     return cpu_metrics
 
 
@@ -62,7 +64,7 @@ def get_memory_metrics():
     return memory_metrics
 
 
-def get_disk_metrics():
+def get_disk_metrics(disk_io=None):
     disk_metrics = {}
 
     import psutil
@@ -81,7 +83,11 @@ def get_disk_metrics():
         )  # in MB
         disk_metrics[str(disk_partition.mountpoint)]["percent_%"] = disk_usage.percent
 
-    disk_io = psutil.disk_io_counters()
+    if disk_io is None:
+        disk_io = psutil.disk_io_counters()
+    if disk_io is None:
+        # There are no disks whose I/O psutil can count (for example, in some containers).
+        return disk_metrics
     disk_metrics["read_count"] = disk_io.read_count
     disk_metrics["write_count"] = disk_io.write_count
     disk_metrics["read_MB"] = round(disk_io.read_bytes / 1024 / 1024, 2)  # in MB
@@ -94,12 +100,13 @@ def get_disk_metrics():
     return disk_metrics
 
 
-def get_network_metrics():
+def get_network_metrics(network_io=None):
     network_metrics = {}
 
     import psutil
 
-    network_io = psutil.net_io_counters()
+    if network_io is None:
+        network_io = psutil.net_io_counters()
     network_metrics["MB_sent"] = round(network_io.bytes_sent / 1024 / 1024, 2)  # in MB
     network_metrics["MB_recv"] = round(network_io.bytes_recv / 1024 / 1024, 2)  # in MB
     network_metrics["packets_sent"] = network_io.packets_sent
@@ -112,52 +119,245 @@ def get_network_metrics():
     return network_metrics
 
 
-def get_open_files_metrics():
+def get_open_files_metrics(process=None):
     files_metrics = {}
 
     import psutil
 
-    open_files = psutil.Process().open_files()
+    if process is None:
+        process = psutil.Process()
+    open_files = process.open_files()
     files_metrics["total"] = len(open_files)
 
     return files_metrics
 
 
-def get_thread_metrics():
+def get_thread_metrics(process=None):
     threads_metrics = {}
 
     import psutil
 
-    threads = psutil.Process().threads()
-    threads_metrics["total"] = len(threads)
+    if process is None:
+        process = psutil.Process()
+    threads_metrics["total"] = process.num_threads()
 
     return threads_metrics
 
 
-def get_processes_metrics():
-    process_metrics = {}
+PROCESS_ATTRS = ["name", "cpu_percent", "memory_info"]
 
-    import psutil
+# Name under which get_processes_metrics sums up the processes which did not make its top_n.
+OTHER_PROCESSES = "[other]"
+
+
+def get_processes_metrics(top_n=None, sort_by="cpu_percent", processes=None):
+    """
+    Returns the CPU and memory usage of the processes running on the machine, grouped by process
+    name. If top_n is given, only the top_n groups by sort_by ("cpu_percent" or "memory_MB") are
+    returned, and the rest are summed up under OTHER_PROCESSES.
 
-    # get all processes memory usage
+    Processes are read in a single psutil.process_iter pass (or taken from processes, which should
+    yield objects with an info dictionary like the ones process_iter returns). Processes which exit
+    during the pass are skipped, and values which cannot be read are counted as 0.
+    """
+    if sort_by not in ("cpu_percent", "memory_MB"):
+        raise ValueError("Unknown sort_by value: {}".format(sort_by))
 
-    processes = psutil.process_iter()
+    if processes is None:
+        import psutil
 
-    # Iterate through each process and get its CPU and memory utilization
+        processes = psutil.process_iter(attrs=PROCESS_ATTRS, ad_value=None)
+
+    # Process name -> [cpu_percent, rss in bytes, amount_of_processes]
+    groups = {}
     for process in processes:
-        cpu_percent = process.cpu_percent()
-        mem_info = process.memory_info()
-        if process.name() not in process_metrics:
-            process_metrics[f"{process.name()}"] = {
-                "cpu_percent": cpu_percent,
-                "memory_MB": round(mem_info.rss / 1024 / 1024, 2),  # in MB
-                "amount_of_processes": 1,
-            }
+        info = process.info
+        name = info.get("name") or ""
+        cpu_percent = info.get("cpu_percent") or 0.0
+        memory_info = info.get("memory_info")
+        rss = memory_info.rss if memory_info is not None else 0
+        group = groups.get(name)
+        if group is None:
+            groups[name] = [cpu_percent, rss, 1]
         else:
-            process_metrics[f"{process.name()}"]["cpu_percent"] += cpu_percent
-            process_metrics[f"{process.name()}"]["memory_MB"] += round(
-                mem_info.rss / 1024 / 1024, 2
+            group[0] += cpu_percent
+            group[1] += rss
+            group[2] += 1
+
+    names = list(groups)
+    other = None
+    if top_n is not None and len(names) > top_n:
+        sort_index = 0 if sort_by == "cpu_percent" else 1
+        names.sort(
+            key=lambda name: (groups[name][sort_index], groups[name][1 - sort_index]),
+            reverse=True,
+        )
+        other = [0.0, 0, 0]
+        for name in names[top_n:]:
+            for i, value in enumerate(groups[name]):
+                other[i] += value
+        names = names[:top_n]
+
+    def metrics(group):
+        return {
+            "cpu_percent": round(group[0], 2),
+            "memory_MB": round(group[1] / 1024 / 1024, 2),  # in MB
+            "amount_of_processes": group[2],
+        }
+
+    process_metrics = {name: metrics(groups[name]) for name in names}
+    if other is not None:
+        process_metrics[OTHER_PROCESSES] = metrics(other)
+    return process_metrics
+
+
+class MetricsCollector:
+    """
+    Collects the metrics in metrics reports, keeping state between collections:
+    1. A single psutil.Process handle for the current process, so that its CPU usage is measured
+       since the previous collection (a new Process always reports 0.0 on its first call).
+    2. Every group of metrics is cached for ttl_seconds, so that reports generated in quick
+       succession do not repeat the same system calls.
+    3. Disk and network I/O rates (per second) are computed between consecutive collections.
+
+    The first CPU measurement is taken at least min_cpu_interval_seconds after the collector is
+    created. If it is requested sooner, cpu_metrics sleeps for the difference.
+
+    Process metrics are limited to the processes_top_n process names with the highest
+    processes_sort_by (see get_processes_metrics).
+    """
+
+    def __init__(
+        self,
+        ttl_seconds=1.0,
+        min_cpu_interval_seconds=0.1,
+        processes_top_n=20,
+        processes_sort_by="cpu_percent",
+    ):
+        import psutil
+
+        self.ttl_seconds = ttl_seconds
+        self.min_cpu_interval_seconds = min_cpu_interval_seconds
+        self.processes_top_n = processes_top_n
+        self.processes_sort_by = processes_sort_by
+        self.process = psutil.Process()
+
+        self._lock = threading.Lock()
+        # Group name -> (monotonic time of collection, metrics)
+        self._cache = {}
+        # Counter name -> (monotonic time of collection, psutil counters)
+        self._counters = {}
+
+        # cpu_percent measures usage since the previous call, so these calls set the baseline.
+        psutil.cpu_percent()
+        psutil.cpu_percent(percpu=True)
+        self.process.cpu_percent()
+        self._cpu_baseline_time = time.monotonic()
+        self._rates("disk_io", psutil.disk_io_counters())
+        self._rates("network_io", psutil.net_io_counters())
+
+    def _cached(self, name, collect):
+        with self._lock:
+            cached = self._cache.get(name)
+            if cached is not None and time.monotonic() - cached[0] < self.ttl_seconds:
+                return cached[1]
+            metrics = collect()
+            self._cache[name] = (time.monotonic(), metrics)
+            return metrics
+
+    def _rates(self, name, counters):
+        """
+        Returns the per-second rates at which the given psutil counters (a named tuple) changed
+        since the last time counters with the same name were passed in.
+        """
+        now = time.monotonic()
+        previous = self._counters.get(name)
+        self._counters[name] = (now, counters)
+        if counters is None or previous is None or previous[1] is None:
+            return {}
+        elapsed = now - previous[0]
+        if elapsed <= 0:
+            return {}
+        return {
+            field: (value - previous_value) / elapsed
+            for field, value, previous_value in zip(
+                counters._fields, counters, previous[1]
             )
-            process_metrics[f"{process.name()}"]["amount_of_processes"] += 1
+        }
 
-    return process_metrics
+    def cpu_metrics(self):
+        def collect():
+            remaining = self.min_cpu_interval_seconds - (
+                time.monotonic() - self._cpu_baseline_time
+            )
+            if remaining > 0:
+                time.sleep(remaining)
+            return get_cpu_metrics(process=self.process)
+
+        return self._cached("cpu", collect)
+
+    def memory_metrics(self):
+        return self._cached("memory", get_memory_metrics)
+
+    def disk_metrics(self):
+        def collect():
+            import psutil
+
+            disk_io = psutil.disk_io_counters()
+            disk_metrics = get_disk_metrics(disk_io=disk_io)
+            rates = self._rates("disk_io", disk_io)
+            if rates:
+                disk_metrics["read_MB_per_s"] = round(
+                    rates["read_bytes"] / 1024 / 1024, 4
+                )
+                disk_metrics["write_MB_per_s"] = round(
+                    rates["write_bytes"] / 1024 / 1024, 4
+                )
+                disk_metrics["read_count_per_s"] = round(rates["read_count"], 2)
+                disk_metrics["write_count_per_s"] = round(rates["write_count"], 2)
+            return disk_metrics
+
+        return self._cached("disk", collect)
+
+    def network_metrics(self):
+        def collect():
+            import psutil
+
+            network_io = psutil.net_io_counters()
+            network_metrics = get_network_metrics(network_io=network_io)
+            rates = self._rates("network_io", network_io)
+            if rates:
+                network_metrics["MB_sent_per_s"] = round(
+                    rates["bytes_sent"] / 1024 / 1024, 4
+                )
+                network_metrics["MB_recv_per_s"] = round(
+                    rates["bytes_recv"] / 1024 / 1024, 4
+                )
+                network_metrics["packets_sent_per_s"] = round(rates["packets_sent"], 2)
+                network_metrics["packets_recv_per_s"] = round(rates["packets_recv"], 2)
+            return network_metrics
+
+        return self._cached("network", collect)
+
+    def process_memory_metrics(self):
+        def collect():
+            memory_info = self.process.memory_info()
+            return {"rss_MB": round(memory_info.rss / 1024 / 1024, 2)}  # in MB
+
+        return self._cached("process_memory", collect)
+
+    def open_files_metrics(self):
+        return self._cached(
+            "open_files", lambda: get_open_files_metrics(process=self.process)
+        )
+
+    def thread_metrics(self):
+        return self._cached("threads", lambda: get_thread_metrics(process=self.process))
+
+    def processes_metrics(self):
+        return self._cached(
+            "processes",
+            lambda: get_processes_metrics(
+                top_n=self.processes_top_n, sort_by=self.processes_sort_by
+            ),
+        )
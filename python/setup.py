@@ -9,7 +9,11 @@ setup(
     version="0.3.2",
     packages=find_packages(),
     package_data={"humbug": ["py.typed"]},
-    install_requires=["requests", "dataclasses; python_version=='3.6'"],
+    install_requires=[
+        "requests",
+        "dataclasses; python_version=='3.6'",
+        "importlib_metadata; python_version<'3.8'",
+    ],
     extras_require={
         "dev": [
             "black",
@@ -22,6 +26,8 @@ setup(
         ],
         "distribute": ["setuptools", "twine", "wheel"],
         "profile": ["psutil", "GPUtil", "types-psutil"],
+        "async": ["aiohttp"],
+        "compression": ["zstandard"],
     },
     description="Humbug: Do you build developer tools? Humbug helps you know your users.",
     long_description=long_description,